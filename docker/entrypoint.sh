@@ -11,9 +11,26 @@ set -e
 
 if [ "$#" -eq 0 ]; then
     CUDA_ARG=
-    if [ "${W2C_BENCH_CUDA:-0}" = 1 ]; then CUDA_ARG=--cuda; fi
+    if [ "${W2C_BENCH_CUDA:-0}" = 1 ] || [ -n "${W2C_BENCH_DEVICES:-}" ]; then CUDA_ARG=--cuda; fi
+    EXTRA_ARGS=
+    if [ "${W2C_BENCH_MODEL_HOST:-0}" = 1 ]; then EXTRA_ARGS=--model-host; fi
+    if [ -n "${W2C_BENCH_CACHE:-}" ]; then EXTRA_ARGS="$EXTRA_ARGS --cache $W2C_BENCH_CACHE"; fi
+    if [ -n "${W2C_BENCH_GT_DIR:-}" ]; then EXTRA_ARGS="$EXTRA_ARGS --gt_dir $W2C_BENCH_GT_DIR"; fi
+    if [ -n "${W2C_BENCH_LIGHT_WORKERS:-}" ]; then EXTRA_ARGS="$EXTRA_ARGS --light-workers $W2C_BENCH_LIGHT_WORKERS"; fi
+    if [ "${W2C_BENCH_TIMINGS:-0}" = 1 ]; then EXTRA_ARGS="$EXTRA_ARGS --timings"; fi
+    if [ -n "${W2C_BENCH_MAX_TASKS_PER_WORKER:-}" ]; then EXTRA_ARGS="$EXTRA_ARGS --max-tasks-per-worker $W2C_BENCH_MAX_TASKS_PER_WORKER"; fi
+    if [ -n "${W2C_BENCH_MAX_WORKER_RSS_MB:-}" ]; then EXTRA_ARGS="$EXTRA_ARGS --max-worker-rss-mb $W2C_BENCH_MAX_WORKER_RSS_MB"; fi
+    if [ -n "${W2C_BENCH_MAX_WORKER_VRAM_MB:-}" ]; then EXTRA_ARGS="$EXTRA_ARGS --max-worker-vram-mb $W2C_BENCH_MAX_WORKER_VRAM_MB"; fi
+    if [ -n "${W2C_BENCH_DEVICES:-}" ]; then EXTRA_ARGS="$EXTRA_ARGS --devices $W2C_BENCH_DEVICES"; fi
+    if [ -n "${W2C_BENCH_DRAIN_TIMEOUT:-}" ]; then EXTRA_ARGS="$EXTRA_ARGS --drain-timeout $W2C_BENCH_DRAIN_TIMEOUT"; fi
+    # Supervisor metrics on W2C_BENCH_METRICS_PORT, the daemon's on the next port.
+    if [ -n "${W2C_BENCH_METRICS_PORT:-}" ]; then
+        EXTRA_ARGS="$EXTRA_ARGS --metrics-port $W2C_BENCH_METRICS_PORT"
+        EXTRA_ARGS="$EXTRA_ARGS --daemon-metrics-port $((W2C_BENCH_METRICS_PORT + 1))"
+        EXTRA_ARGS="$EXTRA_ARGS --metrics-host ${W2C_BENCH_METRICS_HOST:-0.0.0.0}"
+    fi
     python docker/selfcheck.py --cached $CUDA_ARG
-    exec python -m widget2code_bench.supervisor --workers "${W2C_BENCH_WORKERS:-8}" $CUDA_ARG
+    exec python -m widget2code_bench.supervisor --workers "${W2C_BENCH_WORKERS:-8}" $CUDA_ARG $EXTRA_ARGS
 fi
 
 case "$1" in
@@ -10,7 +10,6 @@ import tempfile
 from pathlib import Path
 
 import cv2
-import numpy as np
 
 
 HERE = Path(__file__).resolve().parent
@@ -21,21 +20,9 @@ VERSIONS_JSON = HERE / "versions.json"
 
 
 def _canary_pair(root: Path, variant: int) -> tuple[Path, Path]:
-    height, width = (192, 256)
-    background = 245 if variant == 0 else 28
-    foreground = (24, 72, 132) if variant == 0 else (210, 170, 55)
-    gt = np.full((height, width, 3), background, dtype=np.uint8)
-    pred = gt.copy()
-    cv2.rectangle(gt, (18, 20), (237, 171), foreground, -1)
-    cv2.rectangle(pred, (22, 23), (233, 168), foreground, -1)
-    cv2.circle(gt, (68, 78), 25, (230, 90, 50), -1)
-    cv2.circle(pred, (72, 80), 23, (220, 100, 55), -1)
-    cv2.putText(gt, "Widget 42", (98, 82), cv2.FONT_HERSHEY_SIMPLEX, 0.55,
-                (255 - background,) * 3, 1, cv2.LINE_AA)
-    cv2.putText(pred, "Widget 42", (98, 84), cv2.FONT_HERSHEY_SIMPLEX, 0.55,
-                (255 - background,) * 3, 1, cv2.LINE_AA)
-    cv2.line(gt, (38, 130), (216, 130), (50, 170, 90), 4)
-    cv2.line(pred, (42, 132), (211, 132), (55, 165, 95), 4)
+    from widget2code_bench.canary import canary_arrays
+
+    gt, pred = canary_arrays(variant)
     gt_path = root / f"gt-{variant}.png"
     pred_path = root / f"pred-{variant}.png"
     if not cv2.imwrite(str(gt_path), gt) or not cv2.imwrite(str(pred_path), pred):
@@ -70,6 +57,27 @@ def scores(*, use_cuda: bool) -> dict:
         }
 
 
+def lpips_batching_is_exact(*, use_cuda: bool) -> bool:
+    """Batched LPIPS must give every canary the distance a batch of one gives.
+
+    Batching only stacks tensors; whether the convolutions then reduce in the
+    same order for every batch size is a property of the stack, so it is proven
+    here - with both canaries in one batch - rather than assumed.
+    """
+    from widget_quality import perceptual
+    from widget_quality.utils import load_image, resize_to_match
+
+    perceptual.set_device(use_cuda=use_cuda)
+    with tempfile.TemporaryDirectory(prefix="w2c-bench-selfcheck-") as tmp:
+        pairs = []
+        for variant in (0, 1):
+            gt_path, pred_path = _canary_pair(Path(tmp), variant)
+            gt = load_image(str(gt_path))
+            pairs.append((gt, resize_to_match(gt, load_image(str(pred_path)))))
+    single = [perceptual.compute_lpips(gt, gen) for gt, gen in pairs]
+    return perceptual.compute_lpips_batch(pairs) == single
+
+
 def _marker() -> Path:
     runtime = Path(os.environ.get("W2C_BENCH_RUNTIME_DIR", "/tmp/w2c-bench"))
     device = "cuda" if os.environ.get("W2C_BENCH_CUDA") == "1" else "cpu"
@@ -102,7 +110,12 @@ def main() -> int:
         print("selfcheck: metric mismatch; refusing to serve", file=sys.stderr)
         print(json.dumps({"expected": expected, "actual": current}, indent=2), file=sys.stderr)
         return 1
-    print(f"selfcheck: versions exact; {len(current)}/{len(current)} metric canaries exact", flush=True)
+    if not lpips_batching_is_exact(use_cuda=args.cuda):
+        print("selfcheck: batched LPIPS differs from batch size 1; refusing to serve",
+              file=sys.stderr)
+        return 1
+    print(f"selfcheck: versions exact; {len(current)}/{len(current)} metric canaries exact; "
+          f"batched LPIPS exact", flush=True)
     if args.cached:
         _marker().parent.mkdir(parents=True, exist_ok=True)
         _marker().touch()
@@ -3,11 +3,19 @@
 Infrastructure failures are retried across daemon restarts.  Invalid images or
 metric selections are replies from a healthy evaluator and raise
 ``BenchEvaluationError`` immediately.
+
+A client keeps its connections open and tags every request with an id, so any
+number of calls can be in flight on one connection and the daemon may answer
+them in any order. A reply without an id - from a daemon that predates them,
+and so answers strictly in order - goes to the oldest outstanding request.
 """
 from __future__ import annotations
 
 import asyncio
+import hashlib
+import itertools
 import time
+from collections import OrderedDict
 from pathlib import Path
 
 from . import bench_ipc as ipc
@@ -15,6 +23,7 @@ from . import bench_ipc as ipc
 
 RECONNECT_BACKOFF_S = (0.5, 1.0, 2.0, 4.0, 8.0, 15.0)
 RECONNECT_ALARM_AFTER = 6
+KNOWN_GT_LIMIT = 4096
 
 
 class BenchTransportError(RuntimeError):
@@ -25,17 +34,105 @@ class BenchEvaluationError(ValueError):
     pass
 
 
+class _Connection:
+    """One open socket and the requests awaiting a reply on it."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.pending: OrderedDict[int, asyncio.Future] = OrderedDict()
+        self.closed = False
+        self._reader_task = asyncio.create_task(self._read_replies(reader))
+
+    async def request(self, request_id: int, chunks: list[bytes]) -> dict:
+        if self.closed:
+            raise ConnectionResetError("daemon closed the connection")
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        try:
+            self.writer.writelines(chunks)
+            await self.writer.drain()
+            return await future
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def _read_replies(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                message = await ipc.read_message(reader)
+                if message is None:
+                    raise ConnectionResetError("daemon closed the connection")
+                reply = message[1]
+                request_id = reply.pop("id", None)
+                if request_id is None and self.pending:
+                    request_id = next(iter(self.pending))
+                future = self.pending.pop(request_id, None)
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        except ValueError as exc:
+            self.close(BenchTransportError(
+                f"unreadable reply (lines are limited to bench_ipc.STREAM_LIMIT, "
+                f"{ipc.STREAM_LIMIT // (1024 * 1024)} MB): {exc}"
+            ))
+        except (OSError, ConnectionError, asyncio.IncompleteReadError) as exc:
+            self.close(ConnectionResetError(f"daemon closed the connection: {exc}"))
+        except asyncio.CancelledError:
+            self.close(ConnectionResetError("connection closed by the client"))
+            raise
+
+    def close(self, exc: BaseException | None = None) -> None:
+        self.closed = True
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(exc or ConnectionResetError("connection closed"))
+        self.pending.clear()
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+        if asyncio.current_task() is not self._reader_task:
+            self._reader_task.cancel()
+
+
 class BenchClient:
-    """Evaluate image pairs without importing the numerical benchmark stack."""
+    """Evaluate image pairs without importing the numerical benchmark stack.
+
+    Safe to share between any number of concurrent calls in one event loop;
+    they are spread over `connections` persistent sockets.
+    """
 
-    def __init__(self, runtime_dir: Path | None = None):
+    def __init__(self, runtime_dir: Path | None = None, *,
+                 protocol: int = ipc.PROTOCOL_VERSION, connections: int = 1,
+                 priority: str | None = None, deadline_s: float | None = None):
         self.socket_path = ipc.socket_path(runtime_dir)
+        # The daemon's scheduling class for this client's requests -
+        # "interactive" or "bulk"; by default single pairs are interactive and
+        # evaluate_many is bulk. A request still waiting for a worker
+        # `deadline_s` after it was sent is dropped rather than started.
+        self.priority = priority
+        self.deadline_s = deadline_s
+        self._connections: list[_Connection | None] = [None] * max(1, connections)
+        # Made on first use: before 3.10 an asyncio.Lock binds to the loop
+        # current at construction, which need not be the one that runs it.
+        self._connect_locks: list[asyncio.Lock | None] = [None] * len(self._connections)
+        self._next_connection = itertools.cycle(range(len(self._connections)))
+        self._request_ids = itertools.count(1)
+        # Binary frames unless told otherwise; drops to v1 for good the first
+        # time a daemon answers a frame in v1.
+        self.protocol = protocol
+        # Ground truths this client has sent, by sha256; later requests name them.
+        self._sent_gt: OrderedDict[str, None] = OrderedDict()
 
     async def __aenter__(self) -> "BenchClient":
         return self
 
     async def __aexit__(self, *exc_info) -> None:
-        return None
+        await self.close()
+
+    async def close(self) -> None:
+        for index, connection in enumerate(self._connections):
+            if connection is not None:
+                connection.close()
+                self._connections[index] = None
 
     async def evaluate(self, gt_path, pred_path, *, metrics: str | None = None) -> dict:
         gt = Path(gt_path)
@@ -54,57 +151,174 @@ class BenchClient:
         gt_name: str = "gt.png",
         pred_name: str = "pred.png",
     ) -> dict:
-        reply = await self._exchange(ipc.build_request(
-            gt_bytes, pred_bytes, metrics=metrics,
-            gt_name=gt_name, pred_name=pred_name,
-        ))
-        if reply.get("v") != ipc.PROTOCOL_VERSION:
+        """Score a pair; a GT this client already sent goes by its sha256 alone."""
+        async def send(gt, named):
+            return await self._request(gt, [pred_bytes], metrics=metrics,
+                                       gt_name=gt_name, pred_name=pred_name, **named)
+
+        return self._scores(await self._with_gt(gt_bytes, send))
+
+    async def evaluate_many(
+        self,
+        gt_bytes: bytes,
+        preds: list[bytes],
+        *,
+        metrics: str | None = None,
+    ) -> list[dict | BenchEvaluationError]:
+        """Score several predictions against one ground truth in one request.
+
+        The daemon computes the GT's half once and spreads the predictions over
+        its pool. Results come back in order; a prediction that cannot be
+        scored yields a `BenchEvaluationError` in its place rather than failing
+        the others.
+        """
+        async def send(gt, named):
+            return await self._request(gt, list(preds), many=True, metrics=metrics, **named)
+
+        return self._results(await self._with_gt(gt_bytes, send))
+
+    async def evaluate_gt_id(
+        self,
+        gt_id: str,
+        pred_bytes: bytes,
+        *,
+        metrics: str | None = None,
+        pred_name: str = "pred.png",
+    ) -> dict:
+        """Score a prediction against a sample the daemon preloaded with `--gt_dir`.
+
+        An id the daemon does not know raises `BenchEvaluationError`.
+        """
+        return self._scores(await self._request(
+            None, [pred_bytes], gt_id=gt_id, metrics=metrics, pred_name=pred_name))
+
+    async def _with_gt(self, gt_bytes: bytes, send) -> dict:
+        # `send(gt_bytes or None, naming fields)` makes one request.
+        sha = hashlib.sha256(gt_bytes).hexdigest()
+        if sha in self._sent_gt and self.protocol != ipc.V1:
+            self._sent_gt.move_to_end(sha)
+            reply = await send(None, {"gt_sha256": sha})
+            # The daemon restarted, or evicted it: send the bytes after all.
+            resend = (reply.get("error") == ipc.UnknownGroundTruth.__name__
+                      or (self.protocol == ipc.V1 and not reply.get("ok")))
+            if not resend:
+                return reply
+            del self._sent_gt[sha]
+        reply = await send(gt_bytes, {})
+        self._sent_gt[sha] = None
+        if len(self._sent_gt) > KNOWN_GT_LIMIT:
+            self._sent_gt.popitem(last=False)
+        return reply
+
+    async def _request(self, gt_bytes: bytes | None, preds: list[bytes], *,
+                       many: bool = False, **fields) -> dict:
+        started = time.monotonic()
+        busy = 0
+        while True:
+            protocol = self.protocol
+            if protocol == ipc.V1:
+                build = ipc.build_many_request if many else ipc.build_request
+                message = build(gt_bytes, preds if many else preds[0], **fields)
+                payloads = ()
+            else:
+                build = ipc.build_many_frame if many else ipc.build_frame
+                message, payloads = build(gt_bytes, preds if many else preds[0], **fields)
+            if self.priority is not None:
+                message["priority"] = self.priority
+            if self.deadline_s is not None:
+                remaining = self.deadline_s - (time.monotonic() - started)
+                if remaining <= 0:
+                    return {"v": protocol, "ok": False, "error": ipc.DeadlineExceeded.__name__,
+                            "message": "deadline passed while the daemon was busy"}
+                message["deadline_ms"] = round(1000 * remaining)
+            reply = await self._exchange(protocol, message, payloads)
+            if protocol != ipc.V1 and reply.get("v") == ipc.V1:
+                self.protocol = ipc.V1
+                continue
+            if reply.get("error") == ipc.Busy.__name__:
+                # Backpressure, not an answer: the daemon took nothing on.
+                busy += 1
+                await self._wait(busy, f"daemon busy: {reply.get('message', '')}", started)
+                continue
+            break
+        if reply.get("v") != protocol:
             raise BenchTransportError(
-                f"benchmark protocol mismatch: client v{ipc.PROTOCOL_VERSION}, "
+                f"benchmark protocol mismatch: client v{protocol}, "
                 f"daemon v{reply.get('v')}"
             )
+        return reply
+
+    @staticmethod
+    def _check(reply: dict) -> None:
         if not reply.get("ok"):
             raise BenchEvaluationError(
                 f"{reply.get('error', 'evaluation error')}: {reply.get('message', '')}"
             )
+
+    @classmethod
+    def _scores(cls, reply: dict) -> dict:
+        cls._check(reply)
         scores = reply.get("scores")
         if not isinstance(scores, dict):
             raise BenchTransportError("benchmark daemon returned no score dictionary")
         return scores
 
-    async def _exchange(self, request: dict) -> dict:
+    @classmethod
+    def _results(cls, reply: dict) -> list[dict | BenchEvaluationError]:
+        cls._check(reply)
+        results = reply.get("results")
+        if not isinstance(results, list):
+            raise BenchTransportError("benchmark daemon returned no result list")
+        out = []
+        for entry in results:
+            try:
+                out.append(cls._scores(entry))
+            except BenchEvaluationError as exc:
+                out.append(exc)
+        return out
+
+    async def _exchange(self, protocol: int, message: dict, payloads=()) -> dict:
+        message["id"] = next(self._request_ids)
+        if protocol == ipc.V1:
+            chunks = [ipc.encode(message)]
+        else:
+            chunks = ipc.encode_frame(message, payloads)
         attempt = 0
+        resent = False
         started = time.monotonic()
         while True:
             try:
-                reader, writer = await asyncio.open_unix_connection(
-                    str(self.socket_path), limit=ipc.STREAM_LIMIT
-                )
+                connection = await self._connection()
             except (OSError, asyncio.TimeoutError) as exc:
                 attempt += 1
                 await self._wait(attempt, f"cannot connect: {exc}", started)
                 continue
             try:
-                writer.write(ipc.encode(request))
-                await writer.drain()
-                try:
-                    line = await reader.readline()
-                except ValueError as exc:
-                    raise BenchTransportError(
-                        f"reply exceeded bench_ipc.STREAM_LIMIT "
-                        f"({ipc.STREAM_LIMIT // (1024 * 1024)} MB): {exc}"
-                    ) from exc
-                if not line:
-                    raise ConnectionResetError("daemon closed the connection")
-                return ipc.decode(line)
+                return await connection.request(message["id"], chunks)
             except (OSError, ConnectionError, asyncio.IncompleteReadError) as exc:
+                connection.close()
+                if not resent:
+                    # A daemon being replaced closes connections once it has
+                    # answered what it read; the socket already leads to its
+                    # successor, so the first resend does not wait.
+                    resent = True
+                    continue
                 attempt += 1
                 await self._wait(attempt, f"lost the daemon: {exc}", started)
-            finally:
-                try:
-                    writer.close()
-                except Exception:
-                    pass
+
+    async def _connection(self) -> _Connection:
+        index = next(self._next_connection)
+        lock = self._connect_locks[index]
+        if lock is None:
+            lock = self._connect_locks[index] = asyncio.Lock()
+        async with lock:
+            connection = self._connections[index]
+            if connection is None or connection.closed:
+                reader, writer = await asyncio.open_unix_connection(
+                    str(self.socket_path), limit=ipc.STREAM_LIMIT
+                )
+                connection = self._connections[index] = _Connection(reader, writer)
+            return connection
 
     async def _wait(self, attempt: int, reason: str, started: float) -> None:
         delay = RECONNECT_BACKOFF_S[min(attempt - 1, len(RECONNECT_BACKOFF_S) - 1)]
@@ -3,78 +3,298 @@ from __future__ import annotations
 
 import argparse
 import asyncio
+import contextvars
+import itertools
 import json
 import multiprocessing
 import os
 import signal
 import sys
-import tempfile
 import time
-from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
 from pathlib import Path
 
 from . import bench_ipc as ipc
+from .devices import parse_devices, pin_device
+from .gt_registry import GroundTruthRegistry
+from .result_cache import DEFAULT_MAX_BYTES, ResultCache, cache_key, digest
+from .scheduler import DEFAULT_MAX_QUEUE, Scheduler
+from .selection import parse_metric_selection, selection_cost, selection_key
+from .telemetry import Registry, resident_bytes, serve as serve_metrics
+from .timings import RollingTimings
+from .worker_pool import RecyclingPool
 
 
 HEARTBEAT_INTERVAL_S = 5.0
+DRAIN_TIMEOUT_S = 60.0
+GT_CACHE_BYTES = 256 * 1024 * 1024
+_connection: contextvars.ContextVar[int] = contextvars.ContextVar("connection", default=0)
+_connection_ids = itertools.count(1)
+SHM_BUDGET_BYTES = int(os.environ.get("W2C_BENCH_SHM_MB", "32")) * 1024 * 1024
+# What warm-up scores on each pool's workers: everything on the model workers,
+# so both networks load; what the light workers can be sent on theirs.
+WARMUP_METRICS = {"model": None, "light": "geometry,ssim,layout,style,contrast"}
 
 
-def _safe_suffix(name: str) -> str:
-    suffix = Path(name).suffix.lower()
-    return suffix if suffix in {".png", ".jpg", ".jpeg", ".webp", ".bmp"} else ".png"
+class SharedPayload:
+    """Both images of a request in one shared-memory block.
+
+    Pickling a request's bytes to a pool worker copies them into the pipe and
+    out again; this pickles only the block's name, and the worker copies the
+    images straight out of it. The daemon creates and unlinks the block; workers only
+    attach to it, through the daemon's resource tracker (see `run`), so a
+    worker exiting does not take a block with it.
+    """
+
+    def __init__(self, gt: bytes, pred: bytes):
+        self._shm = shared_memory.SharedMemory(create=True, size=len(gt) + len(pred))
+        self._shm.buf[:len(gt)] = gt
+        self._shm.buf[len(gt):len(gt) + len(pred)] = pred
+        self.name = self._shm.name
+        self.sizes = (len(gt), len(pred))
+
+    def __getstate__(self):
+        return {"name": self.name, "sizes": self.sizes}
+
+    def __setstate__(self, state):
+        self._shm = None
+        self.name = state["name"]
+        self.sizes = state["sizes"]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self.sizes)
+
+    def read(self) -> tuple[bytes, bytes]:
+        """The two images, copied out of the block (worker side)."""
+        shm = shared_memory.SharedMemory(name=self.name)
+        try:
+            n_gt, n_pred = self.sizes
+            return bytes(shm.buf[:n_gt]), bytes(shm.buf[n_gt:n_gt + n_pred])
+        finally:
+            shm.close()
+
+    def release(self) -> None:
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+_ground_truths = None   # this worker's single.GroundTruthCache
+
+
+def _init_worker(host, use_cuda: bool, gt_cache_bytes: int = 0,
+                 device: int | None = None) -> None:
+    global _ground_truths
+    pin_device(device)
+    if gt_cache_bytes > 0:
+        from widget2code_bench.single import GroundTruthCache
+
+        _ground_truths = GroundTruthCache(gt_cache_bytes)
+    # With a model host, this worker's OCR and LPIPS calls go to the one shared
+    # copy of each network instead of loading its own on first use.
+    if host is not None:
+        from .model_host import use_host
+
+        use_host(host, use_cuda)
 
 
 def _evaluate_in_worker(
-    gt_bytes: bytes,
-    pred_bytes: bytes,
-    gt_name: str,
-    pred_name: str,
+    payload: SharedPayload | tuple[bytes, bytes],
     metrics: str | None,
     use_cuda: bool,
-) -> dict:
+    gt_sha256: str | None = None,
+    gt_path: str | None = None,
+    summaries: dict | None = None,
+    timings: bool = False,
+) -> dict | tuple[dict, dict]:
+    """The scores; with `timings`, (scores, per-stage timing record)."""
     # Import here so the supervisor/client side stays light and every worker
     # owns its own lazy EasyOCR/LPIPS model instances.
     from widget2code_bench.single import evaluate_single
+    from widget_quality import timing
+
+    if timings:
+        with timing.collect() as record:
+            scores = _evaluate_in_worker(payload, metrics, use_cuda, gt_sha256, gt_path,
+                                         summaries)
+        return scores, record
+    gt, pred = payload.read() if isinstance(payload, SharedPayload) else payload
+    if gt_sha256 is not None and (_ground_truths is not None or summaries):
+        gt = _resident_ground_truth(gt_sha256, gt, gt_path, summaries)
+    return evaluate_single(gt, pred, metrics=metrics, use_cuda=use_cuda)
 
-    with tempfile.TemporaryDirectory(prefix="w2c-bench-") as tmp:
-        root = Path(tmp)
-        gt = root / f"gt{_safe_suffix(gt_name)}"
-        pred = root / f"pred{_safe_suffix(pred_name)}"
-        gt.write_bytes(gt_bytes)
-        pred.write_bytes(pred_bytes)
-        return evaluate_single(gt, pred, metrics=metrics, use_cuda=use_cuda)
+
+def _prepare_in_worker(
+    payload: SharedPayload | tuple[bytes, bytes],
+    metrics: str | None,
+    use_cuda: bool,
+    gt_sha256: str,
+    gt_path: str | None = None,
+) -> dict:
+    """The GT summaries `metrics` needs, for an evaluate_many to share."""
+    from widget2code_bench.single import prepare_ground_truth
+
+    gt, _ = payload.read() if isinstance(payload, SharedPayload) else payload
+    entry = _resident_ground_truth(gt_sha256, gt, gt_path)
+    prepare_ground_truth(entry, metrics=metrics, use_cuda=use_cuda)
+    return entry.summaries
+
+
+def _resident_ground_truth(sha256: str, data: bytes, path: str | None,
+                           summaries: dict | None = None):
+    from widget2code_bench.eval import _summary_from_metadata
+    from widget2code_bench.single import GroundTruth
+    from widget_quality.utils import load_pixels
+
+    entry = _ground_truths.get(sha256) if _ground_truths is not None else None
+    if entry is None:
+        img = load_pixels(data)
+        # A preloaded sample's metadata.json already holds every summary.
+        entry = GroundTruth(img, _summary_from_metadata(path, img) if path else None)
+        if _ground_truths is not None:
+            _ground_truths.put(sha256, entry)
+    for group, summary in (summaries or {}).items():
+        entry.summaries.setdefault(group, summary)
+    return entry
 
 
 class BenchDaemon:
-    def __init__(self, *, runtime_dir: Path, workers: int, use_cuda: bool):
+    def __init__(self, *, runtime_dir: Path, workers: int, use_cuda: bool,
+                 model_host: bool = False, lpips_batch: int = 8,
+                 cache: ResultCache | None = None,
+                 shm_budget: int = SHM_BUDGET_BYTES,
+                 ground_truths: GroundTruthRegistry | None = None,
+                 gt_cache_bytes: int = GT_CACHE_BYTES,
+                 max_queue: int = DEFAULT_MAX_QUEUE,
+                 light_workers: int = 2,
+                 timings: bool = False,
+                 metrics_address: tuple[str, int] | None = None,
+                 warmup: bool = True,
+                 max_tasks_per_worker: int = 0,
+                 max_worker_rss: int = 0,
+                 max_worker_vram: int = 0,
+                 takeover: bool = False,
+                 drain_timeout: float = DRAIN_TIMEOUT_S,
+                 devices: list[int] | None = None):
         self.runtime_dir = runtime_dir
         self.workers = workers
         self.use_cuda = use_cuda
+        # GPUs the model workers are dealt out over, one card per process -
+        # and, with a model host, one host per card.
+        self.devices = devices
+        self.model_host = model_host
+        self.lpips_batch = lpips_batch
+        self.cache = cache
+        self.shm_budget = shm_budget
+        self._shm_bytes = 0
+        self.ground_truths = ground_truths or GroundTruthRegistry()
+        self.gt_cache_bytes = gt_cache_bytes
+        self.light_workers = light_workers
+        # Per-stage times of the last evaluations, for the heartbeat.
+        self.timings = RollingTimings() if timings else None
+        # One slot per worker: a pool itself never holds a backlog. Selections
+        # that need no neural network have workers of their own, so they are
+        # not queued behind seconds-long OCR and LPIPS jobs.
+        self.schedulers = {"model": Scheduler(workers, max_queue),
+                           "light": Scheduler(light_workers, max_queue)}
         self._in_flight = 0
         self._completed = 0
         self._started_at = time.time()
         self._last_completed_at = time.time()
         self._stopping = asyncio.Event()
-        self._pool: ProcessPoolExecutor | None = None
+        self._pool: RecyclingPool | None = None
+        self._light_pool: RecyclingPool | None = None
+        self._host_pids: list[int] = []
+        self._hosts: dict[str, object] = {}     # device ("default" without --devices) -> proxy
+        self._model_memory: dict[str, dict] = {}
+        self.metrics_address = metrics_address
+        self.warmup = warmup
+        # A successor warms up beside the daemon it replaces, reporting to the
+        # standby heartbeat, and moves to the real one when it takes the socket.
+        self.takeover = takeover
+        self.drain_timeout = drain_timeout
+        self._heartbeat_path = (ipc.standby_heartbeat_path(runtime_dir) if takeover
+                                else ipc.heartbeat_path(runtime_dir))
+        self._draining = False
+        self._readers: set[asyncio.Future] = set()
+        self._connections: set[asyncio.Task] = set()
+        self._socket_inode: int | None = None
+        # When a worker is replaced by a fresh one (0: never for that reason).
+        self.recycle = {"max_tasks": max_tasks_per_worker, "max_rss": max_worker_rss,
+                        "max_vram": max_worker_vram}
+        self._ready_at: float | None = None
+        self.metrics = Registry()
+        self._requests = self.metrics.counter(
+            "w2c_requests_total", "Requests answered, by op and outcome (ok or the error type).")
+        self._errors = self.metrics.counter(
+            "w2c_errors_total", "Failed evaluations by error type, evaluate_many candidates "
+            "included.")
+        self._request_seconds = self.metrics.histogram(
+            "w2c_request_seconds", "Time from reading a request to answering it, by op.")
+        self._evaluation_seconds = self.metrics.histogram(
+            "w2c_evaluation_seconds", "Time an evaluation spent queued and on a worker, by "
+            "metric groups and lane; cache hits excluded.")
+        self._stage_seconds = self.metrics.histogram(
+            "w2c_stage_seconds", "Wall time of each evaluation stage (with --timings).")
+        self.metrics.collector(self._collect_metrics)
 
     def _write_heartbeat(self) -> None:
         payload = {
             "pid": os.getpid(),
+            "ready": self._ready_at is not None,
+            "draining": self._draining,
             "started_at": self._started_at,
+            "ready_at": self._ready_at,
             "now": time.time(),
             "last_completed_at": self._last_completed_at,
             "in_flight": self._in_flight,
             "completed": self._completed,
             "workers": self.workers,
             "cuda": self.use_cuda,
+            "model_host": self.model_host,
+            "devices": self.devices,
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "ground_truths": self.ground_truths.stats(),
+            "light_workers": self.light_workers,
+            "scheduler": {lane: s.stats() for lane, s in self.schedulers.items()},
+            "timings": self.timings.stats() if self.timings is not None else None,
+            "recycling": {pool.name: pool.stats() for pool in (self._pool, self._light_pool)
+                          if isinstance(pool, RecyclingPool)},
+            "model_memory": self._model_memory,
         }
-        path = ipc.heartbeat_path(self.runtime_dir)
+        if self._ready_at is not None and not self._owns_socket():
+            return      # superseded: the heartbeat is the successor's now
+        path = self._heartbeat_path
         tmp = path.with_suffix(".tmp")
         tmp.write_text(json.dumps(payload))
         os.replace(tmp, path)
 
+    def _owns_socket(self) -> bool:
+        """Whether the socket path still leads to this daemon's listener."""
+        try:
+            return os.stat(ipc.socket_path(self.runtime_dir)).st_ino == self._socket_inode
+        except OSError:
+            return False
+
     async def _heartbeat_loop(self) -> None:
+        loop = asyncio.get_running_loop()
         while not self._stopping.is_set():
+            if self._socket_inode is not None and not self._owns_socket():
+                # A successor took the socket (or it was removed): nothing new
+                # reaches this daemon, so finish what it has and go.
+                print("bench-daemon: socket taken over, draining", flush=True)
+                self.stop()
+                return
+            for device, host in self._hosts.items():
+                # A proxy call blocks, so it runs off the loop; a busy host
+                # just leaves the previous reading in place.
+                try:
+                    self._model_memory[device] = await asyncio.wait_for(
+                        loop.run_in_executor(None, host.memory), HEARTBEAT_INTERVAL_S)
+                except Exception:
+                    pass
             try:
                 self._write_heartbeat()
             except Exception:
@@ -84,89 +304,500 @@ class BenchDaemon:
             except asyncio.TimeoutError:
                 pass
 
-    async def _evaluate(self, request: dict) -> dict:
-        if request.get("v") != ipc.PROTOCOL_VERSION:
+    async def _warm(self) -> None:
+        """Score the canary pair once on every worker before serving.
+
+        Loads each worker's models - or connects it to the model host - so the
+        first requests after a (re)start do not pay for it, and checks that all
+        workers of a pool agree on the scores.
+        """
+        from .canary import canary_png
+
+        loop = asyncio.get_running_loop()
+        canary = canary_png(0)
+        lanes = [("model", self._pool, self.workers)]
+        if self._light_pool is not None:
+            lanes.append(("light", self._light_pool, self.light_workers))
+
+        async def warm(lane, pool, count):
+            # One canary per worker: the RecyclingPool hands each submit to an
+            # idle worker and counts it busy at once, so `count` jobs submitted
+            # together land on `count` different workers however fast they run.
+            results = await asyncio.gather(*(
+                loop.run_in_executor(pool, _evaluate_in_worker, canary,
+                                     WARMUP_METRICS[lane], self.use_cuda)
+                for _ in range(count)))
+            if any(result != results[0] for result in results):
+                raise RuntimeError(f"{lane} workers disagree on the canary: {results}")
+
+        await asyncio.gather(*(warm(*lane) for lane in lanes))
+
+    def _collect_metrics(self):
+        """Scrape-time families: state other objects already keep."""
+        yield ("w2c_ready", "gauge", "1 once every worker is warm and the socket is bound.",
+               [({}, int(self._ready_at is not None))])
+        yield ("w2c_in_flight", "gauge", "Requests being answered.", [({}, self._in_flight)])
+        yield ("w2c_uptime_seconds", "gauge", "Seconds since the daemon started.",
+               [({}, time.time() - self._started_at)])
+        stats = {lane: scheduler.stats() for lane, scheduler in self.schedulers.items()}
+        yield ("w2c_queue_depth", "gauge", "Jobs waiting for a worker, by lane and priority.",
+               [({"lane": lane, "priority": priority}, depth)
+                for lane, s in stats.items() for priority, depth in s["queued"].items()])
+        yield ("w2c_running", "gauge", "Jobs on a worker, by lane.",
+               [({"lane": lane}, s["running"]) for lane, s in stats.items()])
+        yield ("w2c_slots", "gauge", "Workers per lane.",
+               [({"lane": lane}, s["slots"]) for lane, s in stats.items()])
+        yield ("w2c_rejected_total", "counter", "Requests refused Busy, by lane.",
+               [({"lane": lane}, s["rejected"]) for lane, s in stats.items()])
+        yield ("w2c_expired_total", "counter", "Jobs dropped past their deadline, by lane.",
+               [({"lane": lane}, s["expired"]) for lane, s in stats.items()])
+        if self.cache is not None:
+            cache = self.cache.stats()
+            yield ("w2c_result_cache_lookups_total", "counter",
+                   "Result cache lookups, by result.",
+                   [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])])
+            yield ("w2c_result_cache_evictions_total", "counter",
+                   "Results evicted from the cache.", [({}, cache["evictions"])])
+            if cache["hit_ratio"] is not None:
+                yield ("w2c_result_cache_hit_ratio", "gauge", "Hits over lookups.",
+                       [({}, cache["hit_ratio"])])
+        ground_truths = self.ground_truths.stats()
+        yield ("w2c_ground_truths", "gauge", "Ground truths the registry holds bytes for, "
+               "and preloaded.",
+               [({"kind": "resident"}, ground_truths["resident"]),
+                ({"kind": "preloaded"}, ground_truths["preloaded"])])
+        yield ("w2c_ground_truth_bytes", "gauge", "Encoded ground-truth bytes held.",
+               [({}, ground_truths["bytes"])])
+
+        pids = {"daemon": [os.getpid()]}
+        pools = (("worker", self._pool), ("light_worker", self._light_pool))
+        for role, pool in pools:
+            pids[role] = pool.pids() if isinstance(pool, RecyclingPool) else []
+        if self._host_pids:
+            pids["model_host"] = list(self._host_pids)
+        yield ("w2c_worker_retirements_total", "counter",
+               "Workers replaced, by pool and reason (tasks, rss, vram, died).",
+               [({"pool": pool.name, "reason": reason}, count)
+                for _, pool in pools if isinstance(pool, RecyclingPool)
+                for reason, count in pool.stats()["retired"].items()])
+        yield ("w2c_processes", "gauge", "Live processes, by role.",
+               [({"role": role}, len(found)) for role, found in pids.items()])
+        memory = []
+        for role, found in pids.items():
+            sizes = [size for size in map(resident_bytes, found) if size is not None]
+            if sizes:
+                memory.append(({"role": role}, sum(sizes)))
+        yield ("w2c_resident_bytes", "gauge", "Resident memory, summed by process role.", memory)
+        if any(self._model_memory.values()):
+            yield ("w2c_model_host_cuda_bytes", "gauge",
+                   "CUDA memory the model hosts' networks hold, by device and kind.",
+                   [({"device": device, "kind": kind}, value)
+                    for device, memory in self._model_memory.items()
+                    for kind, value in memory.items()])
+
+    async def _answer(self, framing: int, request: dict, payloads: list[bytes]) -> dict:
+        if request.get("v") != framing:
             raise ValueError(
-                f"protocol mismatch: daemon v{ipc.PROTOCOL_VERSION}, request v{request.get('v')}"
+                f"protocol mismatch: v{framing} framing, request v{request.get('v')}"
             )
-        gt = ipc.image_bytes(request, "gt_b64")
-        pred = ipc.image_bytes(request, "pred_b64")
-        assert self._pool is not None
+        received = time.monotonic()
+        op = request.get("op") or "evaluate"
+        if op not in ("evaluate", "evaluate_many"):
+            raise ValueError(f"unknown op {op!r}")
+        reference = ipc.gt_reference(request)
+        if op == "evaluate_many":
+            gt, preds = ipc.many_images(framing, request, payloads, gt_named=reference is not None)
+        elif framing == ipc.V1:
+            gt = None if reference else ipc.image_bytes(request, "gt_b64")
+            preds = [ipc.image_bytes(request, "pred_b64")]
+        else:
+            gt, pred = ipc.frame_images(payloads, gt_named=reference is not None)
+            preds = [pred]
+        # Hashing a sent GT and reading a preloaded one from disk both run off
+        # the event loop, so neither holds up the other connections.
         loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(
-            self._pool,
-            _evaluate_in_worker,
-            gt,
-            pred,
-            str(request.get("gt_name") or "gt.png"),
-            str(request.get("pred_name") or "pred.png"),
-            request.get("metrics"),
-            self.use_cuda,
+        gt_path = None
+        if reference is None:
+            gt_sha = await loop.run_in_executor(None, digest, gt)
+            self.ground_truths.add(gt_sha, gt)
+        else:
+            gt_sha, gt, gt_path = self.ground_truths.locate(**reference)
+            if gt is None:
+                gt = await loop.run_in_executor(None, gt_path.read_bytes)
+                self.ground_truths.add(gt_sha, gt)
+        metrics = request.get("metrics")
+        # Parsed here as well as in the worker so an unknown name raises before
+        # any work is queued, so `lpips` and `lp` share a cache entry, and so
+        # work that needs no model can skip the queue for the model workers.
+        parsed = parse_metric_selection(metrics)
+        selection = selection_key(parsed)
+        lane = "model"
+        if self._light_pool is not None and selection_cost(parsed) == "light":
+            lane = "light"
+        priority = request.get("priority") or (
+            "bulk" if op == "evaluate_many" else "interactive")
+        deadline = None
+        if request.get("deadline_ms") is not None:
+            deadline = received + float(request["deadline_ms"]) / 1000
+        ground_truth = (gt_sha, gt, None if gt_path is None else str(gt_path))
+        # The request's jobs hold their queue places from here, not from when
+        # each is queued: an evaluate_many queues its predictions only once the
+        # GT is prepared, and requests admitted meanwhile must count them.
+        with self.schedulers[lane].admit(len(preds) + (op == "evaluate_many")) as admission:
+            order = {"lane": lane, "priority": priority, "deadline": deadline,
+                     "groups": "+".join(sorted(parsed)), "admission": admission}
+            return await self._answer_admitted(framing, op, order, ground_truth, preds,
+                                               metrics, selection)
+
+    async def _answer_admitted(self, framing: int, op: str, order: dict, ground_truth: tuple,
+                               preds: list[bytes], metrics: str | None, selection: str) -> dict:
+        gt_sha, gt, gt_path = ground_truth
+        if op == "evaluate":
+            return ipc.success(
+                await self._evaluate(ground_truth, preds[0], metrics, selection, order=order),
+                framing)
+
+        # The cache is consulted first: a batch it answers whole needs no
+        # worker, not even for the GT. Otherwise one worker computes the GT's
+        # half once and every prediction the cache misses is scored against
+        # it, across the pool. A failed lookup fails only its prediction.
+        lookups = await asyncio.gather(
+            *(self._lookup(gt_sha, pred, selection) for pred in preds), return_exceptions=True)
+        summaries = None
+        if any(not isinstance(lookup, BaseException) and lookup[1] is None
+               for lookup in lookups):
+            summaries = await self._run(order, _prepare_in_worker, (gt, b""), metrics,
+                                        self.use_cuda, gt_sha, gt_path)
+        else:
+            order["admission"].release(1)
+        outcomes = await asyncio.gather(
+            *(self._evaluate(ground_truth, pred, metrics, selection, summaries, order=order,
+                             lookup=lookup)
+              for pred, lookup in zip(preds, lookups)),
+            return_exceptions=True,
         )
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException) and not isinstance(outcome, Exception):
+                raise outcome
+            if isinstance(outcome, Exception):
+                self._errors.inc(type=type(outcome).__name__)
+        return ipc.many_success(outcomes, framing)
+
+    async def _evaluate(self, ground_truth: tuple, pred: bytes, metrics: str | None,
+                        selection: str, summaries: dict | None = None, *,
+                        order: dict, lookup: tuple | BaseException | None = None) -> dict:
+        """Scores for one prediction. `lookup` is its `_lookup`, if already made."""
+        gt_sha, gt, gt_path = ground_truth
+        if lookup is None:
+            lookup = await self._lookup(gt_sha, pred, selection)
+        if isinstance(lookup, BaseException):
+            raise lookup
+        key, cached = lookup
+        if cached is not None:
+            order["admission"].release(1)
+            return cached
+        started = time.monotonic()
+        scores = await self._run(order, _evaluate_in_worker, (gt, pred), metrics,
+                                 self.use_cuda, gt_sha, gt_path, summaries,
+                                 self.timings is not None)
+        self._evaluation_seconds.observe(time.monotonic() - started,
+                                         groups=order["groups"], lane=order["lane"])
+        if self.timings is not None:
+            scores, record = scores
+            self.timings.add(record)
+            for stage, entry in record.items():
+                self._stage_seconds.observe(entry["wall_ms"] / 1000, stage=stage)
+        if key is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.cache.put, key, scores)
+        return scores
+
+    async def _lookup(self, gt_sha: str, pred: bytes, selection: str) -> tuple:
+        """``(cache key, cached scores)``, both None without a cache.
+
+        SQLite can wait out another process's lock for seconds, so the cache
+        is read (and, in `_evaluate`, written) off the event loop.
+        """
+        if self.cache is None:
+            return None, None
+        key = cache_key(gt_sha, digest(pred), selection, use_cuda=self.use_cuda)
+        return key, await asyncio.get_running_loop().run_in_executor(None, self.cache.get, key)
+
+    async def _run(self, order: dict, fn, images: tuple[bytes, bytes], *args):
+        """`fn(payload, *args)` on a worker, when the scheduler says so."""
+        pool = self._light_pool if order["lane"] == "light" else self._pool
+        return await self.schedulers[order["lane"]].run(
+            _connection.get(), order["priority"], order["deadline"],
+            lambda: self._run_now(pool, fn, images, *args), order["admission"])
+
+    async def _run_now(self, pool, fn, images: tuple[bytes, bytes], *args):
+        assert pool is not None
+        loop = asyncio.get_running_loop()
+        payload = self._share(*images)
+        try:
+            return await loop.run_in_executor(pool, fn, payload, *args)
+        finally:
+            if isinstance(payload, SharedPayload):
+                self._shm_bytes -= payload.nbytes
+                payload.release()
+
+    def _share(self, gt: bytes, pred: bytes) -> SharedPayload | tuple[bytes, bytes]:
+        # A block lives only while its job runs, but a full /dev/shm faults on
+        # write rather than failing the allocation - Docker gives containers
+        # 64 MB by default. Past the budget, images are pickled to the worker
+        # as before.
+        size = len(gt) + len(pred)
+        if self._shm_bytes + size > self.shm_budget:
+            return gt, pred
+        try:
+            payload = SharedPayload(gt, pred)
+        except OSError:
+            return gt, pred
+        self._shm_bytes += size
+        return payload
+
+    @staticmethod
+    async def _reply(writer: asyncio.StreamWriter, framing: int, reply: dict) -> None:
+        if framing == ipc.V1:
+            writer.write(ipc.encode(reply))
+        else:
+            writer.writelines(ipc.encode_frame(reply))
+        await writer.drain()
 
     async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Requests that carry an id run concurrently and are answered as they
+        # finish, with the id echoed; one without an id is answered before the
+        # next message is read, which is what clients before ids expect.
+        write_lock = asyncio.Lock()
+        running: set[asyncio.Task] = set()
+        self._connections.add(asyncio.current_task())
+        # Tasks started below inherit this, and the scheduler shares workers
+        # fairly between the values it sees.
+        _connection.set(next(_connection_ids))
+
+        async def reply(framing: int, message: dict) -> None:
+            async with write_lock:
+                await self._reply(writer, framing, message)
+
+        async def answer(framing: int, request: dict, payloads: list[bytes]) -> None:
+            self._in_flight += 1
+            started = time.monotonic()
+            try:
+                message = await self._answer(framing, request, payloads)
+            except Exception as exc:
+                # A malformed/corrupt sample is an evaluation outcome; it
+                # must not kill the daemon or be retried forever.
+                message = ipc.failure(exc, framing)
+                self._errors.inc(type=type(exc).__name__)
+            finally:
+                self._in_flight -= 1
+                self._completed += 1
+                self._last_completed_at = time.time()
+            op = request.get("op") or "evaluate"
+            if op not in ("evaluate", "evaluate_many"):
+                op = "unknown"
+            self._requests.inc(op=op, outcome="ok" if message["ok"] else message["error"])
+            self._request_seconds.observe(time.monotonic() - started, op=op)
+            if request.get("id") is not None:
+                message["id"] = request["id"]
+            try:
+                await reply(framing, message)
+            except (ConnectionResetError, BrokenPipeError):
+                pass
+
         try:
-            while True:
-                line = await reader.readline()
-                if not line:
-                    return
+            while not self._draining:
+                framing = ipc.V1
+                # A separate task, so that a drain can stop the read without
+                # cancelling an answer in progress.
+                read = asyncio.ensure_future(ipc.read_message(reader))
+                self._readers.add(read)
                 try:
-                    request = ipc.decode(line)
-                except Exception as exc:
-                    writer.write(ipc.encode(ipc.failure(exc)))
-                    await writer.drain()
+                    message = await read
+                    if message is None:
+                        return
+                    framing, request, payloads = message
+                except asyncio.CancelledError:
+                    if self._draining and read.cancelled():
+                        break
+                    raise
+                except (asyncio.IncompleteReadError, ConnectionError):
                     return
-                self._in_flight += 1
-                try:
-                    reply = ipc.success(await self._evaluate(request))
                 except Exception as exc:
-                    # A malformed/corrupt sample is an evaluation outcome; it
-                    # must not kill the daemon or be retried forever.
-                    reply = ipc.failure(exc)
-                finally:
-                    self._in_flight -= 1
-                    self._completed += 1
-                    self._last_completed_at = time.time()
-                try:
-                    writer.write(ipc.encode(reply))
-                    await writer.drain()
-                except (ConnectionResetError, BrokenPipeError):
+                    # A message that does not parse leaves the stream at an
+                    # unknown offset, so answer once and drop the connection.
+                    if isinstance(exc, ipc.FrameError):
+                        framing = ipc.PROTOCOL_VERSION
+                    self._requests.inc(op="unknown", outcome=type(exc).__name__)
+                    await reply(framing, ipc.failure(exc, framing))
                     return
+                finally:
+                    self._readers.discard(read)
+                if request.get("id") is None:
+                    await answer(framing, request, payloads)
+                    continue
+                task = asyncio.create_task(answer(framing, request, payloads))
+                running.add(task)
+                task.add_done_callback(running.discard)
         except asyncio.CancelledError:
             raise
         except Exception as exc:
             print(f"bench-daemon: connection failed: {type(exc).__name__}: {exc}", flush=True)
         finally:
+            # Requests already read are answered before the socket closes. A
+            # client sees the close and sends what it had not been answered
+            # for again - through the socket, which by now leads to the
+            # successor.
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
             try:
                 writer.close()
             except Exception:
                 pass
+            self._connections.discard(asyncio.current_task())
 
     async def run(self) -> None:
         self.runtime_dir.mkdir(parents=True, exist_ok=True)
         sock = ipc.socket_path(self.runtime_dir)
-        sock.unlink(missing_ok=True)
         context = multiprocessing.get_context("spawn")
-        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
-        server = await asyncio.start_unix_server(
-            self._handle, path=str(sock), limit=ipc.STREAM_LIMIT, backlog=4096
-        )
+        # Spawned workers inherit the tracker only if it is already running;
+        # otherwise each would start its own, and unlink every shared block it
+        # had attached to when it exits.
+        resource_tracker.ensure_running()
+        managers = []
+        devices = self.devices or [None]
+        hosts = dict.fromkeys(devices)
+        if self.model_host:
+            from .model_host import start_host
+
+            for device in devices:
+                manager, hosts[device] = start_host(
+                    context, use_cuda=self.use_cuda, lpips_batch=self.lpips_batch,
+                    device=device)
+                managers.append(manager)
+                self._hosts["default" if device is None else str(device)] = hosts[device]
+                self._host_pids.append(manager._process.pid)
+        canary = None
+        if self.warmup:
+            from .canary import canary_png
+
+            canary = canary_png(0)
+
+        def pool(lane: str, workers: int, placements: list[tuple]) -> RecyclingPool:
+            return RecyclingPool(
+                workers, mp_context=context, initializer=_init_worker,
+                placements=placements, name=lane,
+                warm=None if canary is None else (
+                    _evaluate_in_worker, canary, WARMUP_METRICS[lane], self.use_cuda),
+                **self.recycle)
+
+        # Model workers take the cards in turn, each with its card's host.
+        self._pool = pool("model", self.workers,
+                          [(hosts[device], self.use_cuda, self.gt_cache_bytes, device)
+                           for device in devices])
+        if self.light_workers > 0:
+            # Never asked for OCR or LPIPS, so they load no model, need no
+            # host and stay off the cards.
+            self._light_pool = pool("light", self.light_workers,
+                                    [(None, self.use_cuda, self.gt_cache_bytes)])
+        server = metrics = None
+        if self.metrics_address is not None:
+            if self.takeover:
+                metrics = asyncio.create_task(self._serve_metrics())
+            else:
+                metrics = await serve_metrics(self.metrics, *self.metrics_address)
+        # The heartbeat runs through the warm-up, so the supervisor sees a
+        # live daemon that is not ready yet rather than a silent one.
         heartbeat = asyncio.create_task(self._heartbeat_loop())
-        print(
-            f"bench-daemon: listening on {sock} "
-            f"(pid {os.getpid()}, {self.workers} workers, cuda={self.use_cuda})",
-            flush=True,
-        )
         try:
+            if self.warmup:
+                warm = asyncio.ensure_future(self._warm())
+                stopping = asyncio.ensure_future(self._stopping.wait())
+                await asyncio.wait({warm, stopping}, return_when=asyncio.FIRST_COMPLETED)
+                stopping.cancel()
+                if not warm.done():
+                    warm.cancel()
+                    return
+                warm.result()
+            # Bound only now, so a client that finds the socket finds warm
+            # workers; and under a temporary name, renamed over the socket
+            # path in one step, so a daemon being replaced serves until then
+            # and no client ever finds the path missing.
+            staging = sock.with_name(f"{sock.name}.{os.getpid()}.tmp")
+            staging.unlink(missing_ok=True)
+            server = await asyncio.start_unix_server(
+                self._handle, path=str(staging), limit=ipc.STREAM_LIMIT, backlog=4096
+            )
+            self._socket_inode = os.stat(staging).st_ino
+            os.replace(staging, sock)
+            self._ready_at = time.time()
+            self._heartbeat_path = ipc.heartbeat_path(self.runtime_dir)
+            if self.takeover:
+                ipc.standby_heartbeat_path(self.runtime_dir).unlink(missing_ok=True)
+            print(
+                f"bench-daemon: {'took over' if self.takeover else 'listening on'} {sock} "
+                f"(pid {os.getpid()}, {self.workers}+{self.light_workers} workers, "
+                f"cuda={self.use_cuda}"
+                f"{'' if self.devices is None else ' on ' + ','.join(map(str, self.devices))}, "
+                f"model_host={self.model_host}, "
+                f"warm-up {self._ready_at - self._started_at:.1f}s)",
+                flush=True,
+            )
+            self._write_heartbeat()
             await self._stopping.wait()
         finally:
             heartbeat.cancel()
-            server.close()
-            await server.wait_closed()
-            sock.unlink(missing_ok=True)
+            if server is not None:
+                await self._drain(server)
+            if isinstance(metrics, asyncio.Task):
+                metrics.cancel()
+                await asyncio.gather(metrics, return_exceptions=True)
+            elif metrics is not None:
+                metrics.close()
+            if self.takeover and self._ready_at is None:
+                self._heartbeat_path.unlink(missing_ok=True)     # the standby one
+            if self._socket_inode is not None and self._owns_socket():
+                sock.unlink(missing_ok=True)
             self._pool.shutdown(wait=False, cancel_futures=True)
+            if self._light_pool is not None:
+                self._light_pool.shutdown(wait=False, cancel_futures=True)
+            for manager in managers:
+                manager.shutdown()
         print("bench-daemon: stopped", flush=True)
 
+    async def _serve_metrics(self) -> None:
+        # A successor starts while the daemon it replaces still holds the
+        # port, so it keeps trying until that one has let go.
+        server = None
+        try:
+            while server is None:
+                try:
+                    server = await serve_metrics(self.metrics, *self.metrics_address)
+                except OSError:
+                    await asyncio.sleep(1.0)
+            await asyncio.Event().wait()
+        finally:
+            if server is not None:
+                server.close()
+
+    async def _drain(self, server: asyncio.AbstractServer) -> None:
+        """Stop accepting, then answer what was already read before returning.
+
+        Connections waiting for their next request are closed at once; their
+        clients reconnect, to the successor if one holds the socket. Anything
+        still unanswered after `drain_timeout` is dropped with the connection.
+        """
+        self._draining = True
+        server.close()
+        for read in list(self._readers):
+            read.cancel()
+        if self._connections:
+            pending = len(self._connections)
+            print(f"bench-daemon: draining {pending} connections", flush=True)
+            _, late = await asyncio.wait(set(self._connections), timeout=self.drain_timeout)
+            for task in late:
+                task.cancel()
+        await server.wait_closed()
+
     def stop(self) -> None:
         self._stopping.set()
 
@@ -176,11 +807,88 @@ def main() -> int:
     parser.add_argument("--runtime-dir", type=Path, default=ipc.DEFAULT_RUNTIME_DIR)
     parser.add_argument("--workers", type=int, default=8)
     parser.add_argument("--cuda", action="store_true")
+    parser.add_argument("--devices", default=None, metavar="N,N,...",
+                        help="GPU indices to deal the model workers out over, one card per "
+                             "process (with --model-host, one host per card); implies --cuda")
+    parser.add_argument("--model-host", action="store_true",
+                        help="serve OCR and LPIPS from one process shared by all workers "
+                             "instead of one copy of each network per worker")
+    parser.add_argument("--lpips-batch", type=int, default=8,
+                        help="with --model-host: most same-sized pairs per LPIPS pass")
+    parser.add_argument("--cache", type=Path, default=None, metavar="DIR",
+                        help="result cache, shareable with batch runs and other daemons")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024))
+    parser.add_argument("--light-workers", type=int, default=2,
+                        help="extra workers for selections that need no neural network "
+                             "(geometry, ssim, layout, style, contrast); 0 sends them to "
+                             "the model workers")
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE,
+                        help="jobs that may wait for a worker; beyond it requests are "
+                             "answered Busy and the client retries")
+    parser.add_argument("--gt_dir", type=Path, default=None,
+                        help="ground truths callers may name by sample id (one directory per "
+                             "sample, metadata.json beside each image, as batch mode reads)")
+    parser.add_argument("--gt-registry-mb", type=int, default=256,
+                        help="encoded ground truths kept for requests that name them by sha256")
+    parser.add_argument("--gt-cache-mb", type=int, default=GT_CACHE_BYTES // (1024 * 1024),
+                        help="per worker: decoded ground truths and their OCR, edge and "
+                             "histogram summaries kept between requests (0: off)")
+    parser.add_argument("--metrics-port", type=int, default=None, metavar="PORT",
+                        help="serve Prometheus metrics on http://HOST:PORT/metrics")
+    parser.add_argument("--metrics-host", default="127.0.0.1",
+                        help="address for --metrics-port (default: 127.0.0.1)")
+    parser.add_argument("--no-warmup", dest="warmup", action="store_false",
+                        help="bind the socket at once and let workers load their models on "
+                             "first use, instead of scoring the canary on each first")
+    parser.add_argument("--max-tasks-per-worker", type=int, default=0, metavar="N",
+                        help="replace a worker with a fresh process after N jobs (0: never)")
+    parser.add_argument("--max-worker-rss-mb", type=int, default=0, metavar="MB",
+                        help="replace a worker whose resident memory exceeds MB after a job "
+                             "(0: never)")
+    parser.add_argument("--max-worker-vram-mb", type=int, default=0, metavar="MB",
+                        help="replace a worker whose CUDA reservation exceeds MB after a job "
+                             "(0: never)")
+    parser.add_argument("--takeover", action="store_true",
+                        help="replace a running daemon: warm up beside it, then take its "
+                             "socket; it finishes its in-flight requests and exits")
+    parser.add_argument("--drain-timeout", type=float, default=DRAIN_TIMEOUT_S, metavar="S",
+                        help="on SIGTERM or takeover, seconds to finish requests already "
+                             "read before exiting (default: %(default)s)")
+    parser.add_argument("--timings", action="store_true",
+                        help="time every evaluation's stages and report percentiles and "
+                             "histograms of the recent ones in the heartbeat")
     args = parser.parse_args()
     if args.workers < 1:
         parser.error("--workers must be at least 1")
+    if args.light_workers < 0:
+        parser.error("--light-workers must not be negative")
+    if args.devices is not None:
+        try:
+            args.devices = parse_devices(args.devices)
+        except ValueError as exc:
+            parser.error(str(exc))
+        if args.workers < len(args.devices):
+            parser.error("--workers must be at least one per --devices card")
+        args.cuda = True
+    cache = None
+    if args.cache is not None:
+        cache = ResultCache(args.cache, max_bytes=args.cache_max_mb * 1024 * 1024)
+    ground_truths = GroundTruthRegistry(args.gt_registry_mb * 1024 * 1024)
+    if args.gt_dir is not None:
+        count = ground_truths.preload(args.gt_dir)
+        print(f"bench-daemon: {count} ground truths from {args.gt_dir}", flush=True)
     daemon = BenchDaemon(
-        runtime_dir=args.runtime_dir, workers=args.workers, use_cuda=args.cuda
+        runtime_dir=args.runtime_dir, workers=args.workers, use_cuda=args.cuda,
+        model_host=args.model_host, lpips_batch=args.lpips_batch, cache=cache,
+        ground_truths=ground_truths, gt_cache_bytes=args.gt_cache_mb * 1024 * 1024,
+        max_queue=args.max_queue, light_workers=args.light_workers, timings=args.timings,
+        metrics_address=(None if args.metrics_port is None
+                         else (args.metrics_host, args.metrics_port)),
+        warmup=args.warmup,
+        max_tasks_per_worker=args.max_tasks_per_worker,
+        max_worker_rss=args.max_worker_rss_mb * 1024 * 1024,
+        max_worker_vram=args.max_worker_vram_mb * 1024 * 1024,
+        takeover=args.takeover, drain_timeout=args.drain_timeout, devices=args.devices,
     )
 
     async def _run() -> None:
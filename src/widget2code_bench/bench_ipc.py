@@ -3,21 +3,55 @@
 Both images cross the Unix socket as bytes.  The daemon never reads a caller's
 filesystem, so the container only needs the small runtime-directory mount that
 holds the socket and heartbeat.
+
+Two framings share the socket, told apart by a message's first byte:
+
+v1  one JSON line per message, images base64-encoded inside it.
+v2  ``W2C2``, a 4-byte big-endian header length, a JSON header ending in a
+    newline, then the raw payloads whose lengths the header lists under
+    ``sizes``.  Images are not inflated by a third or copied into strings, and
+    no line limit applies to them.
+
+A daemon answers in the framing it was asked in. The newline that ends a v2
+header makes a v1-only daemon reject the frame with a v1 error line rather than
+read on to its line limit; that error is how a client learns to fall back.
 """
 from __future__ import annotations
 
+import asyncio
 import base64
 import json
 import os
+import struct
 from pathlib import Path
 from typing import Any, Mapping
 
 
-PROTOCOL_VERSION = 1
+PROTOCOL_VERSION = 2
+V1 = 1
 STREAM_LIMIT = 64 * 1024 * 1024
+FRAME_MAGIC = b"W2C2"
+MAX_HEADER_BYTES = 1024 * 1024
+MAX_PAYLOAD_BYTES = 1024 * 1024 * 1024
 DEFAULT_RUNTIME_DIR = Path(os.environ.get("W2C_BENCH_RUNTIME_DIR", "/tmp/w2c-bench"))
 
 
+class FrameError(ValueError):
+    """A v2 frame that does not parse; answered in v2."""
+
+
+class UnknownGroundTruth(LookupError):
+    """A request named a ground truth the daemon does not hold; resend its bytes."""
+
+
+class Busy(RuntimeError):
+    """The daemon's queue is full; the request was not accepted. Retry later."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's deadline passed before a worker was free to start it."""
+
+
 def socket_path(runtime_dir: Path | None = None) -> Path:
     return (runtime_dir or DEFAULT_RUNTIME_DIR) / "bench.sock"
 
@@ -26,6 +60,11 @@ def heartbeat_path(runtime_dir: Path | None = None) -> Path:
     return (runtime_dir or DEFAULT_RUNTIME_DIR) / "heartbeat.json"
 
 
+def standby_heartbeat_path(runtime_dir: Path | None = None) -> Path:
+    """Where a daemon started with `--takeover` reports until it serves."""
+    return (runtime_dir or DEFAULT_RUNTIME_DIR) / "heartbeat.standby.json"
+
+
 def encode(message: Mapping[str, Any]) -> bytes:
     return (json.dumps(message, ensure_ascii=False, separators=(",", ":")) + "\n").encode()
 
@@ -34,22 +73,182 @@ def decode(line: bytes) -> dict[str, Any]:
     return json.loads(line.decode("utf-8"))
 
 
+def encode_frame(header: Mapping[str, Any], payloads=()) -> list[bytes]:
+    """The chunks of one v2 frame, for ``writer.writelines``; payloads are not copied."""
+    payloads = list(payloads)
+    body = (json.dumps({**header, "sizes": [len(p) for p in payloads]},
+                       ensure_ascii=False, separators=(",", ":")) + "\n").encode()
+    return [FRAME_MAGIC, struct.pack(">I", len(body)), body, *payloads]
+
+
+async def read_message(
+    reader: asyncio.StreamReader,
+) -> tuple[int, dict[str, Any], list[bytes]] | None:
+    """Read one message of either framing: (framing, header, payloads).
+
+    A v1 line has its images inside the header and no payloads. Returns None
+    at a clean end of stream.
+    """
+    first = await reader.read(1)
+    if not first:
+        return None
+    if first != FRAME_MAGIC[:1]:
+        return V1, decode(first + await reader.readline()), []
+    magic = first + await reader.readexactly(len(FRAME_MAGIC) - 1)
+    if magic != FRAME_MAGIC:
+        raise FrameError(f"not a bench_ipc frame: {magic!r}")
+    (length,) = struct.unpack(">I", await reader.readexactly(4))
+    if length > MAX_HEADER_BYTES:
+        raise FrameError(f"frame header of {length} bytes exceeds {MAX_HEADER_BYTES}")
+    try:
+        header = decode(await reader.readexactly(length))
+    except ValueError as exc:
+        raise FrameError(f"frame header is not JSON: {exc}") from exc
+    if not isinstance(header, dict):
+        raise FrameError("frame header is not a JSON object")
+    sizes = header.pop("sizes", [])
+    if not isinstance(sizes, list) or not all(
+            isinstance(n, int) and 0 <= n <= MAX_PAYLOAD_BYTES for n in sizes):
+        raise FrameError(f"bad payload sizes in frame header: {sizes!r}")
+    return PROTOCOL_VERSION, header, [await reader.readexactly(n) for n in sizes]
+
+
+def build_frame(
+    gt_bytes: bytes | None,
+    pred_bytes: bytes,
+    *,
+    metrics: str | None = None,
+    gt_name: str = "gt.png",
+    pred_name: str = "pred.png",
+    gt_sha256: str | None = None,
+    gt_id: str | None = None,
+) -> tuple[dict[str, Any], list[bytes]]:
+    """A v2 request: the header and its two payloads, GT first.
+
+    With `gt_sha256` or `gt_id` in place of `gt_bytes`, the ground truth is
+    named rather than sent and the prediction is the only payload.
+    """
+    header = {
+        "v": PROTOCOL_VERSION,
+        "gt_name": Path(gt_name).name,
+        "pred_name": Path(pred_name).name,
+        "metrics": metrics,
+    }
+    if gt_bytes is not None:
+        return header, [gt_bytes, pred_bytes]
+    _name_gt(header, gt_sha256, gt_id)
+    return header, [pred_bytes]
+
+
+def build_many_frame(
+    gt_bytes: bytes | None,
+    preds: list[bytes],
+    *,
+    metrics: str | None = None,
+    gt_sha256: str | None = None,
+    gt_id: str | None = None,
+) -> tuple[dict[str, Any], list[bytes]]:
+    """A v2 evaluate_many request: one GT (sent or named), many predictions."""
+    header = {"v": PROTOCOL_VERSION, "op": "evaluate_many", "metrics": metrics}
+    if gt_bytes is not None:
+        return header, [gt_bytes, *preds]
+    _name_gt(header, gt_sha256, gt_id)
+    return header, list(preds)
+
+
+def build_many_request(
+    gt_bytes: bytes | None,
+    preds: list[bytes],
+    *,
+    metrics: str | None = None,
+    gt_sha256: str | None = None,
+    gt_id: str | None = None,
+) -> dict[str, Any]:
+    """The v1 form of `build_many_frame`."""
+    request = {
+        "v": V1,
+        "op": "evaluate_many",
+        "preds_b64": [base64.b64encode(p).decode("ascii") for p in preds],
+        "metrics": metrics,
+    }
+    if gt_bytes is not None:
+        request["gt_b64"] = base64.b64encode(gt_bytes).decode("ascii")
+    else:
+        _name_gt(request, gt_sha256, gt_id)
+    return request
+
+
+def many_images(
+    framing: int, message: Mapping[str, Any], payloads: list[bytes], *, gt_named: bool
+) -> tuple[bytes | None, list[bytes]]:
+    """(GT, predictions) of an evaluate_many request; GT is None when named."""
+    if framing == V1:
+        gt = None if gt_named else image_bytes(message, "gt_b64")
+        encoded = message.get("preds_b64")
+        if not isinstance(encoded, list):
+            raise ValueError("evaluate_many request is missing its preds_b64 list")
+        preds = [base64.b64decode(p, validate=True) for p in encoded]
+    elif gt_named:
+        gt, preds = None, payloads
+    else:
+        gt, preds = (payloads[0], payloads[1:]) if payloads else (None, [])
+    if (not gt_named and not gt) or not preds or not all(preds):
+        raise ValueError("evaluate_many needs a ground truth and at least one non-empty "
+                         "prediction")
+    return gt, preds
+
+
+def _name_gt(header: dict[str, Any], gt_sha256: str | None, gt_id: str | None) -> None:
+    if gt_sha256 is not None:
+        header["gt_sha256"] = gt_sha256
+    elif gt_id is not None:
+        header["gt_id"] = str(gt_id)
+    else:
+        raise ValueError("a request needs the GT's bytes, gt_sha256 or gt_id")
+
+
+def gt_reference(message: Mapping[str, Any]) -> dict[str, str] | None:
+    """The request's GT handle as `GroundTruthRegistry.resolve` keywords, if any."""
+    if message.get("gt_sha256") is not None:
+        return {"sha256": str(message["gt_sha256"])}
+    if message.get("gt_id") is not None:
+        return {"sample_id": str(message["gt_id"])}
+    return None
+
+
+def frame_images(payloads: list[bytes], *, gt_named: bool = False) -> tuple[bytes | None, bytes]:
+    """(GT, prediction) from a v2 request's payloads; GT is None when named."""
+    expected = 1 if gt_named else 2
+    if len(payloads) != expected or not all(payloads):
+        raise ValueError("request must carry two non-empty payloads, GT then prediction"
+                         if expected == 2 else
+                         "a request naming its GT must carry one payload, the prediction")
+    return (None, payloads[0]) if gt_named else (payloads[0], payloads[1])
+
+
 def build_request(
-    gt_bytes: bytes,
+    gt_bytes: bytes | None,
     pred_bytes: bytes,
     *,
     metrics: str | None = None,
     gt_name: str = "gt.png",
     pred_name: str = "pred.png",
+    gt_sha256: str | None = None,
+    gt_id: str | None = None,
 ) -> dict[str, Any]:
-    return {
-        "v": PROTOCOL_VERSION,
-        "gt_b64": base64.b64encode(gt_bytes).decode("ascii"),
+    """A v1 request, images base64-encoded in the line; the GT may be named instead."""
+    request = {
+        "v": V1,
         "pred_b64": base64.b64encode(pred_bytes).decode("ascii"),
         "gt_name": Path(gt_name).name,
         "pred_name": Path(pred_name).name,
         "metrics": metrics,
     }
+    if gt_bytes is not None:
+        request["gt_b64"] = base64.b64encode(gt_bytes).decode("ascii")
+    else:
+        _name_gt(request, gt_sha256, gt_id)
+    return request
 
 
 def image_bytes(message: Mapping[str, Any], key: str) -> bytes:
@@ -59,13 +258,27 @@ def image_bytes(message: Mapping[str, Any], key: str) -> bytes:
     return base64.b64decode(payload, validate=True)
 
 
-def success(scores: Mapping[str, Any]) -> dict[str, Any]:
-    return {"v": PROTOCOL_VERSION, "ok": True, "scores": dict(scores)}
+def success(scores: Mapping[str, Any], v: int = PROTOCOL_VERSION) -> dict[str, Any]:
+    return {"v": v, "ok": True, "scores": dict(scores)}
 
 
-def failure(exc: Exception) -> dict[str, Any]:
+def many_success(outcomes: list, v: int = PROTOCOL_VERSION) -> dict[str, Any]:
+    """An evaluate_many reply: one entry per prediction, in order, each a
+    score dictionary or the error that prediction raised."""
+    results = []
+    for outcome in outcomes:
+        if isinstance(outcome, Exception):
+            entry = failure(outcome, v)
+            del entry["v"]
+            results.append(entry)
+        else:
+            results.append({"ok": True, "scores": dict(outcome)})
+    return {"v": v, "ok": True, "results": results}
+
+
+def failure(exc: Exception, v: int = PROTOCOL_VERSION) -> dict[str, Any]:
     return {
-        "v": PROTOCOL_VERSION,
+        "v": v,
         "ok": False,
         "error": type(exc).__name__,
         "message": str(exc),
@@ -0,0 +1,44 @@
+"""The two synthetic widget pairs every deployment is checked against.
+
+`docker/selfcheck.py` scores them once per image and compares the result with
+`docker/golden.json`; the daemon scores them on each of its workers before it
+accepts requests, which loads every model up front and proves each worker
+computes what the others do. Both sides draw the same pixels from here.
+"""
+from __future__ import annotations
+
+import cv2
+import numpy as np
+
+VARIANTS = (0, 1)
+
+
+def canary_arrays(variant: int) -> tuple[np.ndarray, np.ndarray]:
+    """(gt, pred) as the 8-bit BGR arrays OpenCV draws and writes."""
+    height, width = (192, 256)
+    background = 245 if variant == 0 else 28
+    foreground = (24, 72, 132) if variant == 0 else (210, 170, 55)
+    gt = np.full((height, width, 3), background, dtype=np.uint8)
+    pred = gt.copy()
+    cv2.rectangle(gt, (18, 20), (237, 171), foreground, -1)
+    cv2.rectangle(pred, (22, 23), (233, 168), foreground, -1)
+    cv2.circle(gt, (68, 78), 25, (230, 90, 50), -1)
+    cv2.circle(pred, (72, 80), 23, (220, 100, 55), -1)
+    cv2.putText(gt, "Widget 42", (98, 82), cv2.FONT_HERSHEY_SIMPLEX, 0.55,
+                (255 - background,) * 3, 1, cv2.LINE_AA)
+    cv2.putText(pred, "Widget 42", (98, 84), cv2.FONT_HERSHEY_SIMPLEX, 0.55,
+                (255 - background,) * 3, 1, cv2.LINE_AA)
+    cv2.line(gt, (38, 130), (216, 130), (50, 170, 90), 4)
+    cv2.line(pred, (42, 132), (211, 132), (55, 165, 95), 4)
+    return gt, pred
+
+
+def canary_png(variant: int) -> tuple[bytes, bytes]:
+    """(gt, pred) PNG-encoded, as a client would send them."""
+    encoded = []
+    for image in canary_arrays(variant):
+        ok, buffer = cv2.imencode(".png", image)
+        if not ok:
+            raise RuntimeError("could not encode canary images")
+        encoded.append(buffer.tobytes())
+    return encoded[0], encoded[1]
@@ -0,0 +1,31 @@
+"""Putting worker processes on GPUs, one card per process.
+
+Torch and EasyOCR both address "the" GPU, so the way to put a process on a
+card is to make that card the only one it can see, before anything in it
+touches CUDA. `--device N` does that for the whole CLI process; `--devices`
+does it per worker, so one batch run or one daemon can use every card.
+
+Standard library only: this runs in the daemon's parent process.
+"""
+from __future__ import annotations
+
+import os
+
+
+def parse_devices(text: str) -> list[int]:
+    """``"0,1,3"`` -> ``[0, 1, 3]``: GPU indices as numbered by nvidia-smi."""
+    try:
+        devices = [int(part) for part in text.split(",") if part.strip()]
+    except ValueError:
+        raise ValueError(f"--devices takes GPU indices like 0,1,2,3, not {text!r}") from None
+    if not devices:
+        raise ValueError("--devices needs at least one GPU index")
+    if len(set(devices)) != len(devices) or min(devices) < 0:
+        raise ValueError(f"--devices must name distinct GPU indices, not {text!r}")
+    return devices
+
+
+def pin_device(device: int | None) -> None:
+    """Make `device` the only GPU this process can see; None leaves it alone."""
+    if device is not None:
+        os.environ["CUDA_VISIBLE_DEVICES"] = str(device)
@@ -2,17 +2,21 @@ import hashlib
 import os
 import re
 import json
+import multiprocessing
+from contextlib import nullcontext
 import numpy as np
 import pandas as pd
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from threading import Lock
-from widget_quality.utils import load_image, resize_to_match
+from widget_quality.features import ImageFeatures, as_features
+from widget_quality.utils import load_pixels, resize_prediction
 from widget_quality.perceptual import compute_perceptual
-from widget_quality.layout import compute_layout
-from widget_quality.legibility import compute_legibility
-from widget_quality.style import compute_style
+from widget_quality.layout import compute_layout, layout_summary
+from widget_quality.legibility import compute_legibility, legibility_summary
+from widget_quality.style import compute_style, style_summary
 from widget_quality.geometry import compute_aspect_dimensionality_fidelity
 from widget_quality.composite import composite_score
+from widget_quality import timing
 
 
 def convert_to_serializable(obj):
@@ -98,28 +102,59 @@ def _build_id_to_folder_map(directory):
     return id_to_folder
 
 
-def _evaluate_gt_pred(gt_img, pred_img, return_ocr=False):
+def _evaluate_gt_pred(gt_img, pred_img, return_ocr=False, gt_summary=None,
+                      precision="compact"):
     """Run all metrics on a GT/pred image pair. Returns composite result dict.
 
+    ``gt_summary`` is the GT-only half of the evaluation - the `layout`,
+    `legibility` and `style` records `metadata.json` carries under `eval` - when
+    it has already been read; only the prediction's half is then computed.
+
+    Either image may be 8-bit pixels, a float array or an `ImageFeatures`;
+    `precision` says how 8-bit prediction pixels are resized onto the ground
+    truth (see `widget_quality.features.PRECISIONS`).
+
     If ``return_ocr=True``, also returns (ocr_gt, ocr_gen) as a tuple:
         (result_dict, ocr_gt, ocr_gen)
     """
-    gen = resize_to_match(gt_img, pred_img)
-    geo = compute_aspect_dimensionality_fidelity(gt_img, pred_img)
-    perceptual = compute_perceptual(gt_img, gen)
-    layout = compute_layout(gt_img, gen)
+    gt_summary = gt_summary or {}
+    gt = as_features(gt_img)
+    gen = resize_prediction(gt, pred_img, precision)
+    with timing.stage("geometry"):
+        geo = compute_aspect_dimensionality_fidelity(gt, pred_img)
+    perceptual = compute_perceptual(gt, gen)
+    with timing.stage("layout"):
+        layout = compute_layout(gt, gen, gt_summary=gt_summary.get("layout"))
+    with timing.stage("legibility"):
+        legibility = compute_legibility(gt, gen, return_ocr=return_ocr,
+                                        gt_summary=gt_summary.get("legibility"))
     if return_ocr:
-        legibility, ocr_gt, ocr_gen = compute_legibility(gt_img, gen, return_ocr=True)
-    else:
-        legibility = compute_legibility(gt_img, gen)
-    style = compute_style(gt_img, gen)
+        legibility, ocr_gt, ocr_gen = legibility
+    with timing.stage("style"):
+        style = compute_style(gt, gen, gt_summary=gt_summary.get("style"))
     result = composite_score(geo, perceptual, layout, legibility, style)
     if return_ocr:
         return result, ocr_gt, ocr_gen
     return result
 
 
-def evaluate_single_pair(sample_id, gt_path, pred_path):
+def _cache_key(gt_path, pred_path, use_cuda, precision="compact"):
+    """The result-cache key of a batch evaluation of two files.
+
+    A batch result is the whole `composite_score` record, not the per-group
+    selection the daemon returns, so it gets a keyspace of its own.
+    """
+    from widget2code_bench.result_cache import cache_key, digest
+
+    with open(gt_path, "rb") as fh:
+        gt_sha = digest(fh.read())
+    with open(pred_path, "rb") as fh:
+        pred_sha = digest(fh.read())
+    return cache_key(gt_sha, pred_sha, "batch", use_cuda=use_cuda, precision=precision)
+
+
+def evaluate_single_pair(sample_id, gt_path, pred_path, cache=None, use_cuda=False,
+                         timings=False, precision="compact"):
     """Score one GT/prediction pair.
 
     Nothing is written here. The prediction directory is an input, and 0.2.9
@@ -127,15 +162,92 @@ def evaluate_single_pair(sample_id, gt_path, pred_path):
     overwrite each other. The caller collects results and hands them to
     `report.write_run`.
 
-    Returns (success, result_dict, error_message)
+    When the GT's `metadata.json` carries its half of the evaluation - OCR,
+    edge mask and histograms - that half is read instead of recomputed, which
+    halves the OCR passes per pair. With a `result_cache.ResultCache`, a pair
+    whose exact bytes were scored before by this evaluator is not scored again;
+    `use_cuda` and `precision` are part of that key.
+
+    With `timings`, a pair that was scored carries its per-stage times (see
+    `widget_quality.timing`) under ``"_timings"``, for the caller to take off.
+
+    Returns (success, result_dict, source, error_message), where source is
+    "cache", "metadata" (GT half read from metadata.json) or "computed".
     """
     try:
-        result = _evaluate_gt_pred(load_image(gt_path), load_image(pred_path))
+        key = None
+        if cache is not None:
+            key = _cache_key(gt_path, pred_path, use_cuda, precision)
+            cached = cache.get(key)
+            if cached is not None:
+                return (True, dict(cached, id=sample_id), "cache", None)
+
+        with timing.collect() if timings else nullcontext() as record:
+            gt_img = load_pixels(gt_path)
+            gt_summary = _summary_from_metadata(gt_path, gt_img)
+            result = convert_to_serializable(
+                _evaluate_gt_pred(gt_img, load_pixels(pred_path), gt_summary=gt_summary,
+                                  precision=precision))
+        if key is not None:
+            cache.put(key, result)
         result["id"] = sample_id
-        return (True, convert_to_serializable(result), None)
+        if timings:
+            result["_timings"] = record
+        return (True, result, "computed" if gt_summary is None else "metadata", None)
 
     except Exception as e:
-        return (False, None, f"Error evaluating {sample_id}: {str(e)}")
+        return (False, None, None, f"Error evaluating {sample_id}: {str(e)}")
+
+
+def _read_metadata(gt_path):
+    """`metadata.json` beside the GT, or None unless it was built from these bytes.
+
+    The record carries the image's sha256; a missing or unreadable file, or one
+    whose digest names other bytes, returns None and the caller computes from
+    scratch, because a stale cache must never be scored against.
+    """
+    meta_path = os.path.join(os.path.dirname(gt_path), "metadata.json")
+    try:
+        with open(meta_path, encoding="utf-8") as fh:
+            meta = json.load(fh)
+        with open(gt_path, "rb") as fh:
+            if meta.get("sha256") != hashlib.sha256(fh.read()).hexdigest():
+                return None
+        return meta
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _summary_from_metadata(gt_path, gt_img):
+    """The GT-only half of a pair evaluation, read from `metadata.json`.
+
+    tools/build_metadata.py stores each module's GT summary - exactly what
+    `layout_summary`, `legibility_summary` and `style_summary` return, computed
+    by those functions - so handing it to the metric functions yields what a
+    fresh evaluation would. The record must match the decoded image's size as
+    well as its sha256; anything absent or misshapen returns None.
+
+    Returns {"layout": ..., "legibility": ..., "style": ...} or None.
+    """
+    meta = _read_metadata(gt_path)
+    try:
+        h, w = gt_img.shape[:2]
+        if meta is None or list(meta["size"]) != [w, h]:
+            return None
+        cached = meta["eval"]
+        summary = {
+            "layout": {k: cached["layout"][k] for k in
+                       ("margin", "mask_empty", "bbox_ar", "area_ratio")},
+            "legibility": {k: cached["legibility"][k] for k in
+                           ("text", "contrast", "contrast_local", "ocr")},
+            "style": {k: cached["style"][k] for k in
+                      ("hue_hist", "sat_hist", "polarity")},
+        }
+    except (KeyError, TypeError):
+        return None
+    if len(summary["layout"]["margin"]) != 4 or len(summary["style"]["polarity"]) != 2:
+        return None
+    return summary
 
 
 def _fill_from_metadata(gt_path):
@@ -152,20 +264,17 @@ def _fill_from_metadata(gt_path):
 
     Returns (black_result, white_result) or None.
     """
-    meta_path = os.path.join(os.path.dirname(gt_path), "metadata.json")
+    meta = _read_metadata(gt_path)
+    if meta is None:
+        return None
     try:
-        with open(meta_path, encoding="utf-8") as fh:
-            meta = json.load(fh)
-        with open(gt_path, "rb") as fh:
-            if meta.get("sha256") != hashlib.sha256(fh.read()).hexdigest():
-                return None
         results = []
         for mode in ("black", "white"):
             f = meta["eval"]["fill"][mode]
             results.append(composite_score(f["geo"], f["perceptual"], f["layout"],
                                            f["legibility"], f["style"]))
         return tuple(results)
-    except (OSError, ValueError, KeyError, TypeError):
+    except (KeyError, TypeError):
         return None
 
 
@@ -183,9 +292,15 @@ def evaluate_single_pair_fill(sample_id, gt_path):
         if cached is not None:
             black_result, white_result = (dict(r) for r in cached)
         else:
-            gt_img = load_image(gt_path)
-            black_result = _evaluate_gt_pred(gt_img, np.zeros_like(gt_img))
-            white_result = _evaluate_gt_pred(gt_img, np.ones_like(gt_img))
+            # The GT half is shared by both fills, so it is computed once. The
+            # fills are 8-bit, 0 and 255, whose float forms are exactly 0.0
+            # and 1.0; being the GT's size, neither is resampled.
+            gt = ImageFeatures(load_pixels(gt_path))
+            summary = {"layout": layout_summary(gt), "legibility": legibility_summary(gt),
+                       "style": style_summary(gt)}
+            black_result = _evaluate_gt_pred(gt, np.zeros_like(gt.pixels), gt_summary=summary)
+            white_result = _evaluate_gt_pred(gt, np.full_like(gt.pixels, 255),
+                                             gt_summary=summary)
         black_result["id"] = sample_id
         white_result["id"] = sample_id
 
@@ -313,10 +428,63 @@ def _build_excel_data_row(run_name, avg, success_ratio=None, success_count=None)
     return data_row
 
 
+EXECUTORS = ("thread", "process")
+
+
+def _init_worker(use_cuda, device=None):
+    """Load this worker process's own LPIPS and EasyOCR models, once.
+
+    A process-backed run gives every worker its own interpreter, so the models
+    have to live there too. Loading them here rather than on the first pair
+    keeps the first few samples from each paying for it. `device` is the GPU
+    this worker is pinned to, with `devices`.
+    """
+    from widget2code_bench.devices import pin_device
+    from widget_quality import legibility
+    from widget_quality.perceptual import set_device
+
+    pin_device(device)
+    set_device(use_cuda=use_cuda)
+    legibility.set_ocr_device(use_cuda)
+    legibility._get_reader()
+
+
+def _make_executor(executor, num_workers, use_cuda, devices=None):
+    """A thread pool, or a spawn-started process pool with warm workers.
+
+    Threads share the models the caller configured. They are also bound by the
+    GIL, and with BLAS, OpenMP and OpenCV pinned to one thread each - as the
+    image pins them, so the numbers do not depend on how busy the machine is -
+    most of a pair's work holds it, so extra threads barely help. Processes
+    scale with cores instead. Spawn rather than fork, because a forked child
+    inherits whatever CUDA state the parent has.
+
+    With `devices`, the processes are dealt out over those GPUs in turn, and
+    each pair goes to whichever worker frees up first, on any card.
+    """
+    if devices:
+        from widget2code_bench.worker_pool import RecyclingPool
+
+        if executor != "process":
+            raise ValueError("devices pin worker processes to GPUs; use executor='process'")
+        return RecyclingPool(num_workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker,
+                             placements=[(True, device) for device in devices], name="batch")
+    if executor == "thread":
+        return ThreadPoolExecutor(max_workers=num_workers)
+    if executor == "process":
+        return ProcessPoolExecutor(max_workers=num_workers,
+                                   mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(use_cuda,))
+    raise ValueError(f"unknown executor '{executor}'; choose from: {', '.join(EXECUTORS)}")
+
+
 def evaluate_pairs(gt_dir="GT", pred_dir="baseline", num_workers=4,
-                   pred_name="output.png"):
+                   pred_name="output.png", executor="thread", use_cuda=False,
+                   cache=None, timings=False, devices=None, shard=None,
+                   journal=None, done=None, precision="compact"):
     """
-    Load and evaluate GT-prediction pairs using multithreading.
+    Load and evaluate GT-prediction pairs in parallel.
 
     GT dir holds one directory per sample - `image_0001/image.png`, with
     `metadata.json` beside it - the layout of the published dataset.
@@ -327,8 +495,31 @@ def evaluate_pairs(gt_dir="GT", pred_dir="baseline", num_workers=4,
     Args:
         gt_dir: Path to ground truth directory (one subdirectory per sample)
         pred_dir: Path to prediction directory (subfolders)
-        num_workers: Number of worker threads (default: 4)
+        num_workers: Number of workers (default: 4)
         pred_name: Prediction filename inside each subfolder (e.g. "output.png")
+        executor: "thread" (default) or "process". Threads use the models the
+            caller set up with `set_device`/`set_ocr_device`; processes load
+            their own, on the device `use_cuda` names. Both run the same
+            functions on the same inputs and produce the same results.
+        use_cuda: GPU for a process-backed run's models; also part of the
+            result-cache key, since GPU results are not promised to match
+        cache: a `result_cache.ResultCache` to read finished pairs from and
+            store new ones in
+        timings: record each scored pair's per-stage wall and CPU time; the
+            records come back under "timings", one per pair scored (not read
+            from the cache)
+        devices: GPU indices to spread a process-backed run's workers over,
+            `num_workers` in all; implies `use_cuda`
+        shard: ``(index, count)`` - score only every count-th GT id, from the
+            index-th, in sorted order; `report.merge_runs` puts the shards'
+            runs back together
+        journal: a `report.ProgressJournal` each finished sample is appended to
+        done: what an interrupted run already finished, as `report.read_progress`
+            returns it; those samples are not scored again, and are part of
+            what this returns
+        precision: how a prediction not the GT's size is resized onto it -
+            "compact" (default) or "float64", the releases before it; see
+            `widget_quality.features.PRECISIONS`. Also part of the cache key
     """
     # Build ID maps: GT from flat files, pred from subfolders
     print("Scanning directories for 4-digit IDs...")
@@ -337,12 +528,26 @@ def evaluate_pairs(gt_dir="GT", pred_dir="baseline", num_workers=4,
 
     # Build task list by matching IDs
     gt_ids = sorted(gt_id_map.keys())
+    if shard is not None:
+        # By position in the sorted ids, so every node computes the same split
+        # from the same dataset, with no coordinator, and shards differ in size
+        # by at most one sample.
+        index, count = shard
+        print(f"Shard {index}/{count}: {len(gt_ids[index::count])} of {len(gt_ids)} GT ids.")
+        gt_ids = gt_ids[index::count]
     total_gt = len(gt_ids)
 
     matched_tasks = []   # (sample_id, gt_path, pred_path, pred_folder)
     fill_tasks = []      # (sample_id, gt_path, pred_folder) — missing preds
 
+    finished = set()
+    if done is not None:
+        finished = {row["id"] for row in done["matched"] + done["black"]}
+        print(f"Resuming: {len(finished & set(gt_ids))} of {len(gt_ids)} samples already done.")
+
     for sample_id in gt_ids:
+        if sample_id in finished:
+            continue
         gt_path = os.path.join(gt_dir, gt_id_map[sample_id])
         if sample_id not in pred_id_map:
             pred_folder = os.path.join(pred_dir, f"fill_{sample_id}")
@@ -360,29 +565,38 @@ def evaluate_pairs(gt_dir="GT", pred_dir="baseline", num_workers=4,
     total_tasks = total_matched + total_fill
     evaluated = 0
     errors = 0
+    fill_errors = 0
     fills_from_metadata = 0
+    gt_from_metadata = 0
+    from_cache = 0
 
-    all_scores = []
-    all_black_scores = []
-    all_white_scores = []
+    all_scores = list(done["matched"]) if done else []
+    all_black_scores = list(done["black"]) if done else []
+    all_white_scores = list(done["white"]) if done else []
+    all_timings = list(done["timings"]) if done else []
     lock = Lock()
 
     print(f"Found {total_gt} GT files, {len(pred_id_map)} pred folders, {total_matched} matched pairs.")
     if total_fill > 0:
         print(f"  ({total_fill} missing predictions will be evaluated with black/white fill)")
-    print(f"Using {num_workers} worker threads for parallel processing.\n")
+    unit = "threads" if executor == "thread" else "processes"
+    if devices:
+        use_cuda = True
+        unit += f" on GPUs {','.join(map(str, devices))}"
+    print(f"Using {num_workers} worker {unit} for parallel processing.\n")
 
     task_counter = [0]  # mutable counter for progress
 
-    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+    with _make_executor(executor, num_workers, use_cuda, devices) as pool:
         future_to_info = {}
 
         for sid, gp, pp, pf in matched_tasks:
-            fut = executor.submit(evaluate_single_pair, sid, gp, pp)
+            fut = pool.submit(evaluate_single_pair, sid, gp, pp, cache, use_cuda, timings,
+                              precision)
             future_to_info[fut] = ("matched", sid)
 
         for sid, gp, pf in fill_tasks:
-            fut = executor.submit(evaluate_single_pair_fill, sid, gp)
+            fut = pool.submit(evaluate_single_pair_fill, sid, gp)
             future_to_info[fut] = ("fill", sid)
 
         for future in as_completed(future_to_info):
@@ -393,9 +607,16 @@ def evaluate_pairs(gt_dir="GT", pred_dir="baseline", num_workers=4,
                 i = task_counter[0]
 
                 if kind == "matched":
-                    success, result, error_msg = future.result()
+                    success, result, source, error_msg = future.result()
                     if success:
                         evaluated += 1
+                        gt_from_metadata += source == "metadata"
+                        from_cache += source == "cache"
+                        stages = result.pop("_timings", None)
+                        if stages is not None:
+                            all_timings.append({"id": result["id"], "stages": stages})
+                        if journal is not None:
+                            journal.matched(result, stages)
                         all_scores.append(result)
                         print(f"[{i}/{total_tasks}] {result['id']} evaluated -> "
                               f"Geo={result['Geometry']['geo_score']:.2f}")
@@ -407,6 +628,8 @@ def evaluate_pairs(gt_dir="GT", pred_dir="baseline", num_workers=4,
                     if success:
                         evaluated += 1
                         fills_from_metadata += from_meta
+                        if journal is not None:
+                            journal.fill(black_res, white_res)
                         all_black_scores.append(black_res)
                         all_white_scores.append(white_res)
                         source = "metadata" if from_meta else "computed"
@@ -415,17 +638,21 @@ def evaluate_pairs(gt_dir="GT", pred_dir="baseline", num_workers=4,
                               f"Geo(white)={white_res['Geometry']['geo_score']:.2f}")
                     else:
                         errors += 1
+                        fill_errors += 1
                         print(f"[{i}/{total_tasks}] Error: {error_msg}")
 
     num_matched = len(all_scores)
-    num_missing_total = total_fill
+    # Fills restored from a resumed journal count too, as in a fresh run.
+    num_missing_total = len(all_black_scores) + fill_errors
     success_rate = (num_matched / total_gt * 100) if total_gt > 0 else 0.0
 
     print(f"\nSummary:")
     print(f"  Total GT files: {total_gt}")
-    print(f"  Matched (with output): {num_matched}")
+    print(f"  Matched (with output): {num_matched} "
+          f"({gt_from_metadata} with the GT half read from metadata.json, "
+          f"{from_cache} from the result cache)")
     print(f"  Missing predictions: {num_missing_total}")
-    if total_fill > 0:
+    if num_missing_total > 0:
         print(f"  Fill-evaluated (black/white): {len(all_black_scores)} "
               f"({fills_from_metadata} read from metadata.json)")
     print(f"  Errors during evaluation: {errors}")
@@ -438,4 +665,5 @@ def evaluate_pairs(gt_dir="GT", pred_dir="baseline", num_workers=4,
         "white": all_white_scores,
         "total_gt": total_gt,
         "errors": errors,
+        "timings": all_timings,
     }
@@ -0,0 +1,94 @@
+"""The daemon's record of ground truths a caller may name instead of send.
+
+In a reward loop every request for a prompt carries the same ground truth. Once
+the daemon has seen a GT's bytes - or was started with `--gt_dir` - a request
+may name it by sha256, or by sample id, and carry only the prediction.
+
+The registry keeps encoded bytes, bounded by size, least recently used first
+out; preloaded samples are only indexed, and read from disk when named. A
+handle it cannot resolve raises `bench_ipc.UnknownGroundTruth`, and the client
+resends the bytes. Decoded arrays and their summaries live in the workers (see
+`single.GroundTruthCache`), since that is where they are used.
+
+Standard library only: this runs in the daemon's parent process.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from pathlib import Path
+
+from .bench_ipc import UnknownGroundTruth
+
+GT_IMAGE_NAME = "image.png"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class GroundTruthRegistry:
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._bytes: OrderedDict[str, bytes] = OrderedDict()
+        self._total = 0
+        self._paths: dict[str, Path] = {}   # sha256 -> preloaded image
+        self._ids: dict[str, str] = {}      # sample id -> sha256
+
+    def preload(self, gt_dir: Path) -> int:
+        """Index every `<sample>/image.png` under `gt_dir`; returns the count.
+
+        A sample answers to its directory name and to the 4-digit id in it, as
+        batch mode matches them. Its path also travels to the worker, which
+        then reads the GT's summaries from the `metadata.json` beside it.
+        """
+        count = 0
+        for entry in sorted(os.scandir(gt_dir), key=lambda e: e.name):
+            image = Path(entry.path) / GT_IMAGE_NAME
+            if not entry.is_dir() or not image.is_file():
+                continue
+            sha = hashlib.sha256(image.read_bytes()).hexdigest()
+            self._paths[sha] = image
+            self._ids[entry.name] = sha
+            match = re.search(r"(\d{4})", entry.name)
+            if match:
+                self._ids.setdefault(match.group(1), sha)
+            count += 1
+        return count
+
+    def add(self, sha256: str, data: bytes) -> None:
+        if sha256 in self._bytes:
+            self._bytes.move_to_end(sha256)
+            return
+        self._bytes[sha256] = data
+        self._total += len(data)
+        while self._total > self.max_bytes and len(self._bytes) > 1:
+            self._total -= len(self._bytes.popitem(last=False)[1])
+
+    def resolve(self, *, sha256: str | None = None,
+                sample_id: str | None = None) -> tuple[str, bytes, Path | None]:
+        """(sha256, bytes, preloaded path or None) for a handle."""
+        sha256, data, path = self.locate(sha256=sha256, sample_id=sample_id)
+        if data is None:
+            data = path.read_bytes()
+            self.add(sha256, data)
+        return sha256, data, path
+
+    def locate(self, *, sha256: str | None = None,
+               sample_id: str | None = None) -> tuple[str, bytes | None, Path | None]:
+        """`resolve` without touching the disk: bytes are None when they are
+        not resident, for the caller to read from the path and `add`."""
+        if sample_id is not None:
+            sha256 = self._ids.get(str(sample_id))
+            if sha256 is None:
+                raise UnknownGroundTruth(f"no preloaded ground truth with id {sample_id!r}")
+        path = self._paths.get(sha256)
+        data = self._bytes.get(sha256)
+        if data is not None:
+            self._bytes.move_to_end(sha256)
+        elif path is None:
+            raise UnknownGroundTruth(f"ground truth {sha256} is not registered; send its bytes")
+        return sha256, data, path
+
+    def stats(self) -> dict:
+        return {"resident": len(self._bytes), "bytes": self._total,
+                "preloaded": len(self._paths)}
@@ -6,6 +6,7 @@ Performs widget quality evaluation and generates statistics.
 Usage:
     widget2code-bench-exp --gt_dir <GT_DIR> --pred_dir <PRED_DIR> [OPTIONS]
     widget2code-bench-exp --gt_image <GT_PNG> --pred_image <PRED_PNG> [OPTIONS]
+    widget2code-bench-exp merge <OUT_RUN_DIR> <SHARD_RUN_DIR>... [--decimals N]
 """
 
 import os
@@ -15,6 +16,9 @@ from pathlib import Path
 
 
 def main():
+    if sys.argv[1:2] == ["merge"]:
+        _run_merge(sys.argv[2:])
+        return
     parser = argparse.ArgumentParser(
         description="Widget Evaluation Pipeline - two modes: batch (a directory of "
                     "predictions) or single (one image pair)",
@@ -35,6 +39,8 @@ Outputs (batch mode) - one self-contained run directory, predictions never writt
   <out>/<run-name>/
     run.json        what produced it: paths, workers, image stamp, timing, errors
     samples.jsonl   one line per matched sample
+    fills.jsonl     black/white fill scores of each missing prediction
+    timings.jsonl   with --timings: per-stage wall/CPU ms of each scored pair
     metrics.json    per-mode means (raw/black/white/zero) plus quartiles
     summary.md      the table, to --decimals
     summary.csv     the same table - metrics across the columns, one row per mode
@@ -43,12 +49,16 @@ Outputs (batch mode) - one self-contained run directory, predictions never writt
 
 Missing predictions are scored against all-black and all-white images; when the
 ground truth ships precomputed fill scores in metadata.json (validated by the
-image's sha256) they are read instead of recomputed.
+image's sha256) they are read instead of recomputed. The GT's half of a matched
+pair (OCR, edge mask, histograms) is read from the same record.
 
 Device selection:
   --cuda          use the GPU (first visible device) for LPIPS and OCR
   --device N      pin this process to GPU N (implies --cuda). One evaluation
-                  uses one GPU; to use several cards, run one process per card.
+                  uses one GPU.
+  --devices 0,1   batch mode: deal the --workers processes out over these GPUs
+                  (implies --cuda and --executor process); pairs go to whichever
+                  worker frees up first, and the run is one run directory.
 
 Notes:
   - Console prints "Success rate: N/total = X.XX%" (matched pairs / total GT).
@@ -59,11 +69,13 @@ Examples:
   widget2code-bench-exp --gt_dir /data/test --pred_dir /eval/step40 \\
       --pred_name sft_render/rendered.png --device 0 --workers 8
 
-  # One prediction folder per GPU, in parallel
-  for i in 0 1 2 3; do
-    widget2code-bench-exp --gt_dir /data/test --pred_dir /eval/model_$i \\
-        --pred_name rendered.png --device $i --workers 8 &
-  done; wait
+  # CPU-only, one worker process per core
+  widget2code-bench-exp --gt_dir /data/test --pred_dir /eval/step40 \\
+      --executor process --workers 64
+
+  # One prediction folder on four GPUs, eight workers per card
+  widget2code-bench-exp --gt_dir /data/test --pred_dir /eval/step40 \\
+      --pred_name rendered.png --devices 0,1,2,3 --workers 32
 
   # Single pair, some metrics, machine-readable
   widget2code-bench-exp --gt_image gt.png --pred_image pred.png \\
@@ -102,8 +114,34 @@ Examples:
                         help="Decimals in the rendered tables (default: 4). Sample values are "
                              "quantised to 3 as they have been since 0.2.9; samples.jsonl is "
                              "unaffected by this flag")
+    parser.add_argument("--shard", type=str, default=None, metavar="I/N",
+                        help="Batch mode: score only shard I of N (0-based) of the sorted GT "
+                             "ids, for one node of several; `merge` combines the N runs")
+    parser.add_argument("--resume", type=str, default=None, metavar="RUN_DIR",
+                        help="Batch mode: finish a run that was interrupted - its GT, "
+                             "predictions, --pred_name, --shard, --timings, --decimals "
+                             "and --precision are the ones it started with - scoring only the samples "
+                             "missing from its progress.jsonl")
     parser.add_argument("--workers", type=int, default=4,
-                        help="Batch mode: number of worker threads (default: 4)")
+                        help="Batch mode: number of workers (default: 4)")
+    parser.add_argument("--executor", choices=("thread", "process"), default="thread",
+                        help="Batch mode: run workers as threads sharing one set of models "
+                             "(default), or as processes that each load their own - the "
+                             "one that scales with cores when the numeric stack is pinned "
+                             "to a thread")
+    parser.add_argument("--lpips-batch", type=int, default=1, metavar="N",
+                        help="Batch mode, thread executor: serve LPIPS from one thread that "
+                             "runs up to N same-sized pairs per forward pass (default: 1, off)")
+    parser.add_argument("--cache", type=str, default=None, metavar="DIR",
+                        help="Batch mode: result cache shared with other runs and the daemon; "
+                             "a pair whose exact bytes this evaluator scored before is read "
+                             "from it instead of scored again")
+    parser.add_argument("--cache-max-mb", type=int, default=1024,
+                        help="Evict least recently used results beyond this size (default: 1024)")
+    parser.add_argument("--timings", action="store_true",
+                        help="Batch mode: record each pair's per-stage wall and CPU time "
+                             "(decode, resize, SSIM, LPIPS, OCR detect/recognise, ...) in "
+                             "timings.jsonl, with percentiles in run.json")
     parser.add_argument("--pred_name", type=str, default="output.png",
                         help="Prediction filename inside each subfolder (default: output.png)")
 
@@ -114,6 +152,17 @@ Examples:
                         help="GPU index to run on, as numbered by nvidia-smi; implies --cuda. "
                              "Sets CUDA_VISIBLE_DEVICES for this process, so run one process "
                              "per card to use several")
+    parser.add_argument("--devices", type=str, default=None, metavar="N,N,...",
+                        help="Batch mode: GPU indices to spread the --workers processes "
+                             "over, one card per process; implies --cuda and "
+                             "--executor process")
+
+    # Precision (both modes)
+    parser.add_argument("--precision", choices=("compact", "float64"), default="compact",
+                        help="How a prediction whose size differs from its GT's is resized "
+                             "onto it: from its 8-bit pixels (compact, default) or from a "
+                             "float64 copy, which reproduces releases before the compact "
+                             "representation. Same-sized pairs score identically in both")
 
     parser.add_argument("--skill-path", action="store_true",
                         help="Print the path of the bundled agent skill and exit")
@@ -126,12 +175,27 @@ Examples:
 
     # Pin the card before anything touches CUDA. Torch and EasyOCR both address
     # "the" GPU, so the way to choose one is to make it the only one visible.
+    if args.device is not None and args.devices:
+        print("Error: --device pins this process to one GPU, --devices spreads workers "
+              "over several; give one of them")
+        sys.exit(1)
     if args.device is not None:
         os.environ["CUDA_VISIBLE_DEVICES"] = str(args.device)
         args.cuda = True
+    if args.devices:
+        from widget2code_bench.devices import parse_devices
+
+        try:
+            args.devices = parse_devices(args.devices)
+        except ValueError as exc:
+            print(f"Error: {exc}")
+            sys.exit(1)
+        # Each worker process pins its own card; this one touches none.
+        args.cuda = True
+        args.executor = "process"
 
     single_args = bool(args.gt_image or args.pred_image)
-    batch_args = bool(args.gt_dir or args.pred_dir)
+    batch_args = bool(args.gt_dir or args.pred_dir or args.resume)
     if single_args and batch_args:
         print("Error: --gt_image/--pred_image (single) and --gt_dir/--pred_dir (batch) "
               "are two different modes; provide one set, not both")
@@ -141,10 +205,20 @@ Examples:
         if not args.gt_image or not args.pred_image:
             print("Error: --gt_image and --pred_image must both be provided")
             sys.exit(1)
+        if args.devices:
+            print("Error: one pair runs on one GPU; use --device N, not --devices")
+            sys.exit(1)
         _run_single(args)
         return
 
-    if not args.gt_dir or not args.pred_dir:
+    if args.resume:
+        given = [flag for flag, value in (("--gt_dir", args.gt_dir), ("--pred_dir", args.pred_dir),
+                                          ("--shard", args.shard), ("--out", args.out),
+                                          ("--run-name", args.run_name)) if value]
+        if given:
+            print(f"Error: --resume continues a run as it was started; drop {', '.join(given)}")
+            sys.exit(1)
+    elif not args.gt_dir or not args.pred_dir:
         print("Error: Provide either --gt_image/--pred_image or --gt_dir/--pred_dir")
         sys.exit(1)
     _run_batch(args)
@@ -183,6 +257,7 @@ def _run_single(args):
             pred_path,
             metrics=args.metrics,
             use_cuda=args.cuda,
+            precision=args.precision,
         )
     except ValueError as exc:
         print(f"Error: {exc}", file=sys.stderr)
@@ -197,9 +272,42 @@ def _run_batch(args):
     from datetime import datetime, timezone
 
     from widget2code_bench.eval import evaluate_pairs
-    from widget2code_bench.report import write_run
+    from widget2code_bench.report import PROGRESS, ProgressJournal, read_progress, write_run
     from widget_quality.legibility import set_ocr_device
-    from widget_quality.perceptual import set_device
+    from widget_quality.perceptual import set_device, set_lpips_batching
+
+    if args.lpips_batch > 1 and args.executor != "thread":
+        print("Error: --lpips-batch batches across the threads of one process; "
+              "it needs --executor thread")
+        sys.exit(1)
+    header = done = None
+    if args.resume:
+        try:
+            header, done = read_progress(Path(args.resume))
+        except FileNotFoundError:
+            finished = (Path(args.resume) / "run.json").exists()
+            print(f"Error: no {PROGRESS} in {args.resume}"
+                  + ("; that run already finished" if finished else ""))
+            sys.exit(1)
+        except ValueError as exc:
+            print(f"Error: {exc}")
+            sys.exit(1)
+        args.gt_dir, args.pred_dir = header["gt_dir"], header["pred_dir"]
+        args.pred_name, args.shard = header["pred_name"], header["shard"]
+        args.timings, args.decimals = header["timings"], header["decimals"]
+        # A journal from before --precision existed was scored in float64.
+        args.precision = header.get("precision", "float64")
+    shard = None
+    if args.shard:
+        try:
+            shard = _parse_shard(args.shard)
+        except ValueError as exc:
+            print(f"Error: {exc}")
+            sys.exit(1)
+    if args.devices and args.workers < len(args.devices):
+        print(f"Error: --workers {args.workers} cannot cover {len(args.devices)} GPUs; "
+              f"give at least one worker per card")
+        sys.exit(1)
 
     gt_dir = Path(args.gt_dir)
     pred_dir = Path(args.pred_dir)
@@ -214,24 +322,55 @@ def _run_batch(args):
     runs_dir = Path(args.out) if args.out else pred_dir.parent / "runs"
     stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
     run_name = args.run_name or f"{pred_dir.name}_{stamp}"
+    if shard is not None and not args.run_name:
+        run_name += f"_shard{shard[0]}of{shard[1]}"
     out_dir = runs_dir / run_name
+    if header is not None:
+        out_dir, run_name, stamp = Path(args.resume), header["run"], header["stamp"]
 
     device = "cpu"
-    if args.cuda:
+    if args.devices:
+        device = f"gpus {','.join(map(str, args.devices))}"
+    elif args.cuda:
         device = f"gpu {args.device}" if args.device is not None else "gpu"
     print(f"gt         {gt_dir}")
     print(f"pred       {pred_dir}  (read-only)")
     print(f"run        {out_dir}")
-    print(f"workers    {args.workers}   device {device}   decimals {args.decimals}")
+    print(f"workers    {args.workers} {args.executor}s   device {device}   "
+          f"decimals {args.decimals}")
     print()
 
     # Both neural nets follow the same switch: without it, EasyOCR would grab
-    # any GPU it can see while --cuda-less LPIPS stays on the CPU.
-    set_device(use_cuda=args.cuda)
-    set_ocr_device(args.cuda)
+    # any GPU it can see while --cuda-less LPIPS stays on the CPU. Worker
+    # processes load their own, so the parent then loads nothing.
+    if args.executor == "thread":
+        set_device(use_cuda=args.cuda)
+        set_ocr_device(args.cuda)
+        set_lpips_batching(args.lpips_batch)
+    cache = None
+    if args.cache:
+        from widget2code_bench.result_cache import ResultCache
+
+        cache = ResultCache(args.cache, max_bytes=args.cache_max_mb * 1024 * 1024)
+    # Each finished sample goes to disk as it lands, so a run that is killed
+    # can be finished with --resume instead of started again.
+    if header is None:
+        journal = ProgressJournal(out_dir, header={
+            "run": run_name, "stamp": stamp, "gt_dir": str(gt_dir), "pred_dir": str(pred_dir),
+            "pred_name": args.pred_name, "shard": args.shard, "timings": args.timings,
+            "decimals": args.decimals, "precision": args.precision,
+        })
+    else:
+        journal = ProgressJournal(out_dir)
     started = time.time()
-    results = evaluate_pairs(str(gt_dir), str(pred_dir), args.workers,
-                             pred_name=args.pred_name)
+    try:
+        results = evaluate_pairs(str(gt_dir), str(pred_dir), args.workers,
+                                 pred_name=args.pred_name, executor=args.executor,
+                                 use_cuda=args.cuda, cache=cache, timings=args.timings,
+                                 devices=args.devices, shard=shard, journal=journal, done=done,
+                                 precision=args.precision)
+    finally:
+        journal.close()
     elapsed = time.time() - started
 
     if not results["matched"]:
@@ -246,8 +385,14 @@ def _run_batch(args):
             "pred_dir": str(pred_dir),
             "pred_name": args.pred_name,
             "workers": args.workers,
+            "executor": args.executor,
+            "lpips_batch": args.lpips_batch,
+            "cache": args.cache,
             "cuda": bool(args.cuda),
             "device": args.device,
+            "devices": args.devices,
+            "shard": None if shard is None else {"index": shard[0], "count": shard[1]},
+            "precision": args.precision,
             "image_stamp": os.environ.get("W2C_BENCH_STAMP"),
             "errors": results["errors"],
             "seconds": round(elapsed, 1),
@@ -257,14 +402,54 @@ def _run_batch(args):
         black=results["black"],
         white=results["white"],
         digits=args.decimals,
+        timings=results["timings"] if args.timings else None,
     )
+    journal.finish()
+
+    _print_written(out_dir)
+
+
+def _print_written(out_dir):
+    from widget2code_bench.report import RUN_FILES
 
     print(f"\nwrote {out_dir}")
-    for name in ("run.json", "samples.jsonl", "metrics.json", "summary.md",
-                 "summary.csv", "summary.xlsx"):
+    for name in RUN_FILES:
         if (out_dir / name).exists():
             print(f"  {name}")
 
 
+def _parse_shard(text):
+    """``"2/8"`` -> ``(2, 8)``: shard index (0-based) and shard count."""
+    index, sep, count = text.partition("/")
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise ValueError(f"--shard takes I/N, such as 0/4, not {text!r}") from None
+    if not sep or count < 1 or not 0 <= index < count:
+        raise ValueError(f"--shard I/N needs 0 <= I < N, not {text!r}")
+    return index, count
+
+
+def _run_merge(argv):
+    """Combine the run directories of `--shard 0/N` ... `--shard N-1/N` into one run."""
+    from widget2code_bench.report import merge_runs
+
+    parser = argparse.ArgumentParser(
+        prog="widget2code-bench-exp merge",
+        description="Merge the run directories of every shard of a --shard I/N split into "
+                    "one run, whose metrics.json matches a single run over all samples")
+    parser.add_argument("out", type=Path, help="run directory to write")
+    parser.add_argument("parts", type=Path, nargs="+", help="the shards' run directories")
+    parser.add_argument("--decimals", type=int, default=None,
+                        help="Decimals in the rendered tables (default: the shards')")
+    args = parser.parse_args(argv)
+    try:
+        merge_runs(args.out, args.parts, digits=args.decimals)
+    except (OSError, ValueError, KeyError) as exc:
+        print(f"Error: {exc}")
+        sys.exit(1)
+    _print_written(args.out)
+
+
 if __name__ == "__main__":
     main()
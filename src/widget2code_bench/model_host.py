@@ -0,0 +1,103 @@
+"""One process that owns the neural networks for a whole worker pool.
+
+Every daemon worker used to build its own EasyOCR reader and LPIPS VGG on first
+use, so `--cuda --workers 8` put eight copies of CRAFT, the recogniser and VGG16
+on one card and ran out of memory long before it ran out of compute. With a
+model host the CPU-bound metric work stays in the workers, and only the two
+networks live here, once per GPU.
+
+The host is a `multiprocessing` manager: each worker holds a proxy, and the
+manager serves every worker's connection on a thread of its own. LPIPS calls
+from those threads go through `perceptual.LpipsBatcher`, so concurrent workers
+share forward passes. OCR goes to the one reader under a lock - EasyOCR's batched
+entry point resizes its inputs, which would change what it reads, so requests
+are serialised rather than batched.
+
+Nothing here changes a value: the reader and the network are the ones a worker
+would have built, and the arrays they see are the ones it would have passed.
+LPIPS inputs cross as float32, which is what `compute_lpips` casts them to
+anyway.
+"""
+from __future__ import annotations
+
+import threading
+from multiprocessing.managers import BaseManager
+
+import numpy as np
+
+
+class ModelHost:
+    """EasyOCR and LPIPS for every worker; lives in the manager's process."""
+
+    def __init__(self, use_cuda: bool, lpips_batch: int = 8):
+        from widget_quality import legibility, perceptual
+
+        perceptual.set_device(use_cuda=use_cuda)
+        perceptual.set_lpips_batching(lpips_batch)
+        legibility.set_ocr_device(use_cuda)
+        self._reader = legibility._get_reader()
+        self._ocr_lock = threading.Lock()
+        self._perceptual = perceptual
+        self._use_cuda = use_cuda
+
+    def readtext(self, img_u8: np.ndarray) -> list:
+        with self._ocr_lock:
+            return self._reader.readtext(img_u8)
+
+    def distance(self, gt: np.ndarray, gen: np.ndarray) -> float:
+        return self._perceptual.compute_lpips(gt, gen)
+
+    def memory(self) -> dict:
+        """CUDA bytes allocated and reserved here; empty on the CPU."""
+        import torch
+
+        if not self._use_cuda or not torch.cuda.is_available():
+            return {}
+        return {"allocated": torch.cuda.memory_allocated(),
+                "reserved": torch.cuda.memory_reserved()}
+
+
+class HostManager(BaseManager):
+    pass
+
+
+HostManager.register("ModelHost", ModelHost)
+
+
+class RemoteReader:
+    """The ``readtext`` side of a host proxy, for `legibility.set_reader`."""
+
+    def __init__(self, host):
+        self.host = host
+
+    def readtext(self, img_u8):
+        return self.host.readtext(img_u8)
+
+
+class RemoteLpips:
+    """The ``distance`` side of a host proxy, for `perceptual.set_lpips_server`."""
+
+    def __init__(self, host):
+        self.host = host
+
+    def distance(self, gt, gen):
+        return self.host.distance(gt.astype(np.float32), gen.astype(np.float32))
+
+
+def start_host(context, *, use_cuda: bool, lpips_batch: int = 8, device: int | None = None):
+    """Start a host process; returns (manager, proxy). The proxy pickles, so it
+    can be handed to spawned workers as an initializer argument. `device` puts
+    the host on that GPU, as `devices.pin_device` does for a worker."""
+    from .devices import pin_device
+
+    manager = HostManager(ctx=context)
+    manager.start(pin_device, (device,))
+    return manager, manager.ModelHost(use_cuda, lpips_batch)
+
+
+def use_host(host, use_cuda: bool) -> None:
+    """Point this process's OCR and LPIPS at `host` instead of local models."""
+    from widget_quality import legibility, perceptual
+
+    legibility.set_reader(RemoteReader(host), gpu=use_cuda)
+    perceptual.set_lpips_server(RemoteLpips(host))
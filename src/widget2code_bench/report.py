@@ -19,11 +19,17 @@ from __future__ import annotations
 
 import csv
 import json
+import os
 from pathlib import Path
 from typing import Any, Iterable
 
 import numpy as np
 
+from .timings import summarize
+
+RUN_FILES = ("run.json", "samples.jsonl", "fills.jsonl", "timings.jsonl", "metrics.json",
+             "summary.md", "summary.csv", "summary.xlsx")
+
 CATEGORIES = {
     "LayoutScore": ["MarginAsymmetry", "ContentAspectDiff", "AreaRatioDiff"],
     "LegibilityScore": ["TextJaccard", "ContrastDiff", "ContrastLocalDiff"],
@@ -48,6 +54,90 @@ MODE_LABEL = {
 WORST = {"lp": 1.0}
 
 
+PROGRESS = "progress.jsonl"
+
+
+class ProgressJournal:
+    """A run's finished samples, appended to progress.jsonl as each one lands.
+
+    Every line is flushed and fsync'd before the next sample is counted, so a
+    run killed at sample 950 of 1000 has 949 or 950 lines on disk, and
+    `--resume` scores only the rest. The first line describes the run itself.
+    A run directory holds progress.jsonl only while unfinished: `write_run`
+    writes the final files from the complete results, and the journal is then
+    removed, so a resumed run ends with the same files as one never stopped.
+    """
+
+    def __init__(self, out_dir: Path, header: dict | None = None):
+        """Start a journal with `header`, or - without one - append to the existing one."""
+        self.path = out_dir / PROGRESS
+        if header is None:
+            read_progress(out_dir, truncate=True)
+            self._fh = self.path.open("a")
+        else:
+            out_dir.mkdir(parents=True, exist_ok=True)
+            self._fh = self.path.open("w")
+            self._write(dict(header, kind="run"))
+
+    def _write(self, entry: dict) -> None:
+        self._fh.write(json.dumps(entry, sort_keys=True) + "\n")
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def matched(self, row: dict, stages: dict | None = None) -> None:
+        self._write({"kind": "matched", "row": row, "stages": stages})
+
+    def fill(self, black: dict, white: dict) -> None:
+        self._write({"kind": "fill", "black": black, "white": white})
+
+    def close(self) -> None:
+        self._fh.close()
+
+    def finish(self) -> None:
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+
+def read_progress(out_dir: Path, *, truncate: bool = False) -> tuple[dict, dict]:
+    """(header, done) from a run's journal; done is ``{"matched", "black", "white",
+    "timings"}`` as `eval.evaluate_pairs` returns them.
+
+    A line cut short by the crash is dropped - and, with `truncate`, cut from
+    the file, so appending starts on a clean line.
+    """
+    path = out_dir / PROGRESS
+    header, done = None, {"matched": [], "black": [], "white": [], "timings": []}
+    good = 0
+    with path.open("rb") as fh:
+        for line in fh:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b"\n"):
+                break
+            good += len(line)
+            if entry["kind"] == "run":
+                header = entry
+            elif entry["kind"] == "matched":
+                done["matched"].append(entry["row"])
+                if entry.get("stages") is not None:
+                    done["timings"].append({"id": entry["row"]["id"],
+                                            "stages": entry["stages"]})
+            elif entry["kind"] == "fill":
+                done["black"].append(entry["black"])
+                done["white"].append(entry["white"])
+    if header is None:
+        raise ValueError(f"{path} does not start with a run header")
+    if truncate and good < path.stat().st_size:
+        os.truncate(path, good)
+    return header, done
+
+
+def _by_id(rows: Iterable[dict]) -> list[dict]:
+    return sorted(rows, key=lambda r: str(r.get("id", "")))
+
+
 def flatten(scores: dict) -> dict[str, float]:
     return {m: scores.get(cat, {}).get(m) for cat, ms in CATEGORIES.items() for m in ms}
 
@@ -111,16 +201,35 @@ def write_run(
     black: list[dict],
     white: list[dict],
     digits: int = 4,
+    timings: list[dict] | None = None,
 ) -> Path:
-    """Write one run's directory and return it."""
+    """Write one run's directory and return it.
+
+    `timings` are per-sample stage records (``{"id", "stages"}``, as
+    `eval.evaluate_pairs` returns them); given, they are written to
+    timings.jsonl and their percentiles to run.json.
+    """
     out_dir.mkdir(parents=True, exist_ok=True)
 
+    # Sorted by id, not by completion order: two runs over the same predictions
+    # then produce diffable files, and - since a float sum depends on its
+    # order - the same means to the last bit, however the work was split.
+    matched, black, white = _by_id(matched), _by_id(black), _by_id(white)
+
     # Full precision, one line per sample: everything downstream reads this.
-    # Sorted by id, not by completion order, so two runs over the same
-    # predictions produce diffable files.
     with (out_dir / "samples.jsonl").open("w") as fh:
-        for row in sorted(matched, key=lambda r: str(r.get("id", ""))):
+        for row in matched:
             fh.write(json.dumps(row, sort_keys=True) + "\n")
+    # The black and white scores of each missing prediction, so that a run can
+    # be rebuilt - or merged with others - from its files alone.
+    with (out_dir / "fills.jsonl").open("w") as fh:
+        for b, w in zip(black, white):
+            fh.write(json.dumps({"id": b.get("id"), "black": b, "white": w},
+                                sort_keys=True) + "\n")
+    if timings is not None:
+        with (out_dir / "timings.jsonl").open("w") as fh:
+            for row in _by_id(timings):
+                fh.write(json.dumps(row, sort_keys=True) + "\n")
 
     modes = aggregate(matched, black, white)
     (out_dir / "metrics.json").write_text(json.dumps({
@@ -171,6 +280,67 @@ def write_run(
     manifest = dict(manifest)
     manifest.update({"matched": len(matched), "missing": len(black),
                      "success_rate": round(rate, 2), "digits": digits})
+    if timings is not None:
+        manifest["timings"] = summarize([row["stages"] for row in timings])
     (out_dir / "run.json").write_text(json.dumps(manifest, indent=2, sort_keys=True))
 
     return out_dir
+
+
+def _jsonl(path: Path) -> list[dict]:
+    with path.open() as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def merge_runs(out_dir: Path, parts: list[Path], *, digits: int | None = None) -> Path:
+    """Write one run from the run directories of its shards, and return it.
+
+    Each part is a run written with ``--shard i/N``; together they must be
+    shards 0..N-1 of one N-way split, each exactly once. The merged
+    metrics.json is byte for byte the one a single run over all samples
+    writes: every number is recomputed from samples.jsonl and fills.jsonl,
+    which carry full precision.
+    """
+    manifests = [json.loads((part / "run.json").read_text()) for part in parts]
+    shards = [m.get("shard") for m in manifests]
+    if any(shard is None for shard in shards):
+        missing = [str(p) for p, shard in zip(parts, shards) if shard is None]
+        raise ValueError(f"not shard runs (no 'shard' in run.json): {', '.join(missing)}")
+    counts = {shard["count"] for shard in shards}
+    if len(counts) != 1:
+        raise ValueError(f"parts come from different splits: shard counts {sorted(counts)}")
+    count = counts.pop()
+    indices = sorted(shard["index"] for shard in shards)
+    if indices != list(range(count)):
+        raise ValueError(f"need shards 0..{count - 1} once each, got {indices}")
+    for key in ("gt_dir", "pred_dir", "pred_name", "precision"):
+        if len({m.get(key) for m in manifests}) != 1:
+            raise ValueError(f"parts disagree on {key}")
+
+    matched, black, white, timings = [], [], [], []
+    for part in parts:
+        matched += _jsonl(part / "samples.jsonl")
+        for fill in _jsonl(part / "fills.jsonl"):
+            black.append(fill["black"])
+            white.append(fill["white"])
+        if timings is not None and (part / "timings.jsonl").exists():
+            timings += _jsonl(part / "timings.jsonl")
+        else:
+            timings = None      # only some parts were timed: report none
+    ids = [row.get("id") for row in matched + black]
+    if len(ids) != len(set(ids)):
+        raise ValueError("a sample id appears in more than one part")
+
+    first = manifests[0]
+    manifest = {key: first.get(key) for key in ("gt_dir", "pred_dir", "pred_name",
+                                                 "precision", "image_stamp")}
+    manifest.update({
+        "run": out_dir.name,
+        "merged_from": [str(part) for part in parts],
+        "shards": count,
+        "errors": sum(m.get("errors", 0) for m in manifests),
+        "seconds": max(m.get("seconds", 0) for m in manifests),
+    })
+    return write_run(out_dir, manifest=manifest, matched=matched, black=black, white=white,
+                     digits=first.get("digits", 4) if digits is None else digits,
+                     timings=timings)
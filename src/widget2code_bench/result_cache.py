@@ -0,0 +1,151 @@
+"""Content-addressed, on-disk cache of finished evaluations.
+
+An evaluation is a pure function of four things: the ground truth's bytes, the
+prediction's bytes, which metrics were asked for, and the evaluator that
+computed them. RL reward loops resubmit identical pairs constantly - the same
+program rendered twice, the blank output every failed rollout produces - so a
+result is stored under the sha256 of exactly those four and served again
+instead of recomputed.
+
+The evaluator part is the package version plus the image's `W2C_BENCH_STAMP`,
+the device, because `--cuda` is not promised to match the CPU, and the
+`--precision` a resized prediction was scored at. A new image therefore starts
+a new keyspace rather than serving a stale number.
+
+Storage is one SQLite file, so the batch CLI and the daemon - and several
+daemons - can share it; WAL mode lets readers proceed while a writer commits.
+It is bounded: once the stored results exceed `max_bytes`, the least recently
+used are evicted.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from importlib.metadata import PackageNotFoundError, version as _pkg_version
+from pathlib import Path
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+CACHE_FILE = "results.sqlite"
+
+try:
+    BENCH_VERSION = _pkg_version("widget2code-bench-exp")
+except PackageNotFoundError:
+    BENCH_VERSION = "0.0.0"
+
+
+def evaluator_version() -> str:
+    return f"{BENCH_VERSION}+{os.environ.get('W2C_BENCH_STAMP') or 'dev'}"
+
+
+def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def cache_key(gt_sha256: str, pred_sha256: str, metrics: str, *, use_cuda: bool,
+              precision: str = "compact") -> str:
+    """The key for one evaluation; `metrics` is a `selection.selection_key`."""
+    spec = json.dumps({
+        "gt": gt_sha256, "pred": pred_sha256, "metrics": metrics,
+        "device": "cuda" if use_cuda else "cpu", "precision": precision,
+        "evaluator": evaluator_version(),
+    }, sort_keys=True)
+    return hashlib.sha256(spec.encode()).hexdigest()
+
+
+class ResultCache:
+    """A size-bounded LRU of score dictionaries, keyed by `cache_key`.
+
+    Safe to share between threads and processes: every thread opens its own
+    connection on first use, and pickling carries only the path and bound, so
+    a process pool's workers reopen the same file.
+    """
+
+    def __init__(self, root: str | Path, *, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._local = threading.local()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._connection()
+
+    def __getstate__(self):
+        return {"root": self.root, "max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state["root"], max_bytes=state["max_bytes"])
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.root / CACHE_FILE), timeout=30.0,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY, value TEXT NOT NULL,
+                    size INTEGER NOT NULL, used REAL NOT NULL);
+                CREATE INDEX IF NOT EXISTS results_used ON results (used);
+                CREATE TABLE IF NOT EXISTS total (id INTEGER PRIMARY KEY CHECK (id = 0),
+                                                  bytes INTEGER NOT NULL);
+                INSERT OR IGNORE INTO total VALUES (0, 0);
+            """)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> dict | None:
+        conn = self._connection()
+        row = conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        conn.execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, scores: dict) -> None:
+        value = json.dumps(scores, sort_keys=True)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            old = conn.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+            conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                         (key, value, len(value), time.time()))
+            conn.execute("UPDATE total SET bytes = bytes + ? WHERE id = 0",
+                         (len(value) - (old[0] if old else 0),))
+            self._evict(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.stores += 1
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        (total,) = conn.execute("SELECT bytes FROM total WHERE id = 0").fetchone()
+        while total > self.max_bytes:
+            rows = conn.execute(
+                "SELECT key, size FROM results ORDER BY used LIMIT 256").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                total -= size
+                self.evictions += 1
+        conn.execute("UPDATE total SET bytes = ? WHERE id = 0", (total,))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits, "misses": self.misses, "stores": self.stores,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
@@ -0,0 +1,171 @@
+"""Admission, ordering and deadlines for the daemon's worker pool.
+
+Handing every request straight to the process pool queued it there, out of
+reach: a burst from one trainer sat in front of everyone else's work, and a
+caller that had long given up still had its job run. The scheduler keeps the
+queue on this side instead and releases work only as workers free up, so it can
+decide what runs next:
+
+- the queue is bounded; past `max_queue` a request is refused with `Busy`,
+  which the client retries after a pause, rather than accepted and left to age.
+  An admitted request's jobs hold their places from admission on, so requests
+  that have not queued their jobs yet cannot all be let in against one depth;
+- ``interactive`` work always starts before ``bulk`` work;
+- within a class, connections take turns, one job each, so a connection with a
+  thousand queued jobs delays another's next job by at most one;
+- a job whose deadline has passed by the time a worker is free is dropped with
+  `DeadlineExceeded` instead of started.
+
+Standard library only: this runs in the daemon's parent process.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from .bench_ipc import Busy, DeadlineExceeded
+
+PRIORITIES = ("interactive", "bulk")
+DEFAULT_MAX_QUEUE = 4096
+WAIT_WINDOW = 2048
+
+
+@dataclass
+class _Job:
+    run: Callable[[], Awaitable[Any]]
+    future: asyncio.Future
+    deadline: float | None
+    enqueued: float = field(default_factory=time.monotonic)
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Admission:
+    """Queue places `Scheduler.admit` reserved for one request's jobs.
+
+    Each job the request queues takes one; `release` hands back places it
+    will not use - one for a prediction answered from the cache, and all that
+    are left once the request is answered or has failed. Used as a context
+    manager, the last happens on the way out.
+    """
+
+    def __init__(self, scheduler: "Scheduler", jobs: int):
+        self._scheduler = scheduler
+        self.remaining = jobs
+
+    def take(self) -> bool:
+        if not self.remaining:
+            return False
+        self.remaining -= 1
+        return True
+
+    def release(self, jobs: int | None = None) -> None:
+        jobs = self.remaining if jobs is None else min(jobs, self.remaining)
+        self._scheduler._depth -= jobs
+        self.remaining -= jobs
+
+    def __enter__(self) -> "Admission":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class Scheduler:
+    def __init__(self, slots: int, max_queue: int = DEFAULT_MAX_QUEUE):
+        self.slots = slots
+        self.max_queue = max_queue
+        self._queues: dict[str, OrderedDict[Any, deque[_Job]]] = {
+            priority: OrderedDict() for priority in PRIORITIES
+        }
+        self._depth = 0
+        self._running = 0
+        self._waits: deque[float] = deque(maxlen=WAIT_WINDOW)
+        self.rejected = 0
+        self.expired = 0
+
+    def admit(self, jobs: int = 1) -> Admission:
+        """Reserve places for a request's `jobs`, or refuse it if they would
+        overflow the queue. Reserved places count as queued until released."""
+        if self._depth + jobs > self.max_queue:
+            self.rejected += 1
+            raise Busy(f"{self._depth} jobs queued (limit {self.max_queue}); retry later")
+        self._depth += jobs
+        return Admission(self, jobs)
+
+    async def run(self, connection: Any, priority: str, deadline: float | None,
+                  run: Callable[[], Awaitable[Any]], admission: Admission | None = None) -> Any:
+        """Await `run()` once it is this job's turn; `deadline` is monotonic.
+
+        A job of an admitted request fills one of its `admission`'s places."""
+        if priority not in self._queues:
+            raise ValueError(f"unknown priority {priority!r}; choose from {', '.join(PRIORITIES)}")
+        job = _Job(run, asyncio.get_running_loop().create_future(), deadline)
+        self._queues[priority].setdefault(connection, deque()).append(job)
+        if admission is None or not admission.take():
+            self._depth += 1
+        self._dispatch()
+        return await job.future
+
+    def _next(self) -> _Job | None:
+        for queues in self._queues.values():
+            while queues:
+                connection, queue = next(iter(queues.items()))
+                job = queue.popleft()
+                # Round robin: this connection goes to the back of its class.
+                del queues[connection]
+                if queue:
+                    queues[connection] = queue
+                self._depth -= 1
+                return job
+        return None
+
+    def _dispatch(self) -> None:
+        while self._running < self.slots:
+            job = self._next()
+            if job is None:
+                return
+            if job.future.done():        # the caller went away
+                continue
+            now = time.monotonic()
+            if job.deadline is not None and now > job.deadline:
+                self.expired += 1
+                job.future.set_exception(DeadlineExceeded(
+                    f"deadline passed {1000 * (now - job.deadline):.0f} ms before a worker "
+                    f"was free; not started"))
+                continue
+            self._waits.append(now - job.enqueued)
+            self._running += 1
+            task = asyncio.ensure_future(job.run())
+            task.add_done_callback(lambda task, job=job: self._finished(job, task))
+
+    def _finished(self, job: _Job, task: asyncio.Future) -> None:
+        self._running -= 1
+        if not job.future.done():
+            if task.cancelled():
+                job.future.cancel()
+            elif task.exception() is not None:
+                job.future.set_exception(task.exception())
+            else:
+                job.future.set_result(task.result())
+        self._dispatch()
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+        return {
+            "slots": self.slots,
+            "running": self._running,
+            "queued": {p: sum(len(q) for q in qs.values()) for p, qs in self._queues.items()},
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "wait_ms": None if not waits else {
+                name: round(1000 * _percentile(waits, q), 1)
+                for name, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0))
+            },
+        }
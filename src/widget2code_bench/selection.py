@@ -0,0 +1,112 @@
+"""Which metrics a caller asked for, without importing anything that computes them.
+
+Single mode, the daemon and the result cache all need to read a `--metrics`
+selection; the daemon's parent process and the cache do so without the numeric
+stack, so the parsing lives here rather than beside the metrics.
+"""
+from __future__ import annotations
+
+
+GROUP_OUTPUTS = {
+    "geometry": ("Geometry", {"geo_score"}),
+    "perceptual": ("PerceptualScore", {"ssim", "lp"}),
+    "layout": (
+        "LayoutScore",
+        {"MarginAsymmetry", "ContentAspectDiff", "AreaRatioDiff"},
+    ),
+    "legibility": (
+        "LegibilityScore",
+        {"TextJaccard", "ContrastDiff", "ContrastLocalDiff"},
+    ),
+    "style": (
+        "StyleScore",
+        {"PaletteDistance", "Vibrancy", "PolarityConsistency"},
+    ),
+}
+
+ALIASES = {
+    "geo": ("geometry", "geo_score"),
+    "geo_score": ("geometry", "geo_score"),
+    "ssim": ("perceptual", "ssim"),
+    "lp": ("perceptual", "lp"),
+    "lpips": ("perceptual", "lp"),
+    "margin": ("layout", "MarginAsymmetry"),
+    "margin_asymmetry": ("layout", "MarginAsymmetry"),
+    "content_aspect": ("layout", "ContentAspectDiff"),
+    "content_aspect_diff": ("layout", "ContentAspectDiff"),
+    "area_ratio": ("layout", "AreaRatioDiff"),
+    "area_ratio_diff": ("layout", "AreaRatioDiff"),
+    "text": ("legibility", "TextJaccard"),
+    "text_jaccard": ("legibility", "TextJaccard"),
+    "contrast": ("legibility", "ContrastDiff"),
+    "contrast_diff": ("legibility", "ContrastDiff"),
+    "contrast_local": ("legibility", "ContrastLocalDiff"),
+    "contrast_local_diff": ("legibility", "ContrastLocalDiff"),
+    "palette": ("style", "PaletteDistance"),
+    "palette_distance": ("style", "PaletteDistance"),
+    "vibrancy": ("style", "Vibrancy"),
+    "polarity": ("style", "PolarityConsistency"),
+    "polarity_consistency": ("style", "PolarityConsistency"),
+}
+
+
+def _normalise(token: str) -> str:
+    return token.strip().lower().replace("-", "_")
+
+
+def parse_metric_selection(spec: str | None) -> dict[str, set[str] | None]:
+    """Parse comma-separated groups/leaves into a computation selection.
+
+    A group maps to ``None`` (return every leaf); a leaf selection maps to the
+    exact output leaves requested.  ``None``, an empty string, and ``all`` all
+    select the complete 0.2.9 metric set.
+    """
+    if not spec or _normalise(spec) == "all":
+        return {group: None for group in GROUP_OUTPUTS}
+
+    selected: dict[str, set[str] | None] = {}
+    for raw in spec.split(","):
+        token = _normalise(raw)
+        if not token:
+            continue
+        if token == "all":
+            return {group: None for group in GROUP_OUTPUTS}
+        if token in GROUP_OUTPUTS:
+            selected[token] = None
+            continue
+        try:
+            group, leaf = ALIASES[token]
+        except KeyError as exc:
+            choices = ", ".join(sorted({*GROUP_OUTPUTS, *ALIASES, "all"}))
+            raise ValueError(f"unknown metric '{raw.strip()}'; choose from: {choices}") from exc
+        if group not in selected:
+            selected[group] = set()
+        if selected[group] is not None:
+            selected[group].add(leaf)
+
+    if not selected:
+        raise ValueError("--metrics must contain at least one metric")
+    return selected
+
+
+def selection_key(selection: dict[str, set[str] | None]) -> str:
+    """A canonical spelling of a parsed selection: ``lpips`` and ``lp`` agree."""
+    parts = []
+    for group in sorted(selection):
+        leaves = selection[group]
+        parts.append(group if leaves is None else f"{group}:{'+'.join(sorted(leaves))}")
+    return ",".join(parts)
+
+
+def selection_cost(selection: dict[str, set[str] | None]) -> str:
+    """The heaviest model a selection needs: ``"lpips"``, ``"ocr"`` or ``"light"``.
+
+    ``light`` selections - geometry, SSIM, layout, style, global contrast - run
+    in milliseconds on the CPU; the other two wait on a neural network.
+    """
+    perceptual = selection.get("perceptual", set())
+    if "perceptual" in selection and (perceptual is None or "lp" in perceptual):
+        return "lpips"
+    if "legibility" in selection and selection["legibility"] != {"ContrastDiff"}:
+        return "ocr"
+    return "light"
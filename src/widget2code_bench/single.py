@@ -7,95 +7,19 @@ load LPIPS and a contrast-only request does not load EasyOCR.
 """
 from __future__ import annotations
 
+from collections import OrderedDict
 from pathlib import Path
+from typing import Union
 
 import numpy as np
 
 from widget2code_bench.eval import convert_to_serializable
+from widget2code_bench.selection import ALIASES, GROUP_OUTPUTS, parse_metric_selection  # noqa: F401
 from widget_quality.composite import composite_score
+from widget_quality.features import ImageFeatures
 from widget_quality.geometry import compute_aspect_dimensionality_fidelity
-from widget_quality.utils import load_image, resize_to_match
-
-
-GROUP_OUTPUTS = {
-    "geometry": ("Geometry", {"geo_score"}),
-    "perceptual": ("PerceptualScore", {"ssim", "lp"}),
-    "layout": (
-        "LayoutScore",
-        {"MarginAsymmetry", "ContentAspectDiff", "AreaRatioDiff"},
-    ),
-    "legibility": (
-        "LegibilityScore",
-        {"TextJaccard", "ContrastDiff", "ContrastLocalDiff"},
-    ),
-    "style": (
-        "StyleScore",
-        {"PaletteDistance", "Vibrancy", "PolarityConsistency"},
-    ),
-}
-
-ALIASES = {
-    "geo": ("geometry", "geo_score"),
-    "geo_score": ("geometry", "geo_score"),
-    "ssim": ("perceptual", "ssim"),
-    "lp": ("perceptual", "lp"),
-    "lpips": ("perceptual", "lp"),
-    "margin": ("layout", "MarginAsymmetry"),
-    "margin_asymmetry": ("layout", "MarginAsymmetry"),
-    "content_aspect": ("layout", "ContentAspectDiff"),
-    "content_aspect_diff": ("layout", "ContentAspectDiff"),
-    "area_ratio": ("layout", "AreaRatioDiff"),
-    "area_ratio_diff": ("layout", "AreaRatioDiff"),
-    "text": ("legibility", "TextJaccard"),
-    "text_jaccard": ("legibility", "TextJaccard"),
-    "contrast": ("legibility", "ContrastDiff"),
-    "contrast_diff": ("legibility", "ContrastDiff"),
-    "contrast_local": ("legibility", "ContrastLocalDiff"),
-    "contrast_local_diff": ("legibility", "ContrastLocalDiff"),
-    "palette": ("style", "PaletteDistance"),
-    "palette_distance": ("style", "PaletteDistance"),
-    "vibrancy": ("style", "Vibrancy"),
-    "polarity": ("style", "PolarityConsistency"),
-    "polarity_consistency": ("style", "PolarityConsistency"),
-}
-
-def _normalise(token: str) -> str:
-    return token.strip().lower().replace("-", "_")
-
-
-def parse_metric_selection(spec: str | None) -> dict[str, set[str] | None]:
-    """Parse comma-separated groups/leaves into a computation selection.
-
-    A group maps to ``None`` (return every leaf); a leaf selection maps to the
-    exact output leaves requested.  ``None``, an empty string, and ``all`` all
-    select the complete 0.2.9 metric set.
-    """
-    if not spec or _normalise(spec) == "all":
-        return {group: None for group in GROUP_OUTPUTS}
-
-    selected: dict[str, set[str] | None] = {}
-    for raw in spec.split(","):
-        token = _normalise(raw)
-        if not token:
-            continue
-        if token == "all":
-            return {group: None for group in GROUP_OUTPUTS}
-        if token in GROUP_OUTPUTS:
-            selected[token] = None
-            continue
-        try:
-            group, leaf = ALIASES[token]
-        except KeyError as exc:
-            choices = ", ".join(sorted({*GROUP_OUTPUTS, *ALIASES, "all"}))
-            raise ValueError(f"unknown metric '{raw.strip()}'; choose from: {choices}") from exc
-        if group not in selected:
-            selected[group] = set()
-        if selected[group] is not None:
-            selected[group].add(leaf)
-
-    if not selected:
-        raise ValueError("--metrics must contain at least one metric")
-    return selected
+from widget_quality.timing import stage
+from widget_quality.utils import load_pixels, resize_prediction
 
 
 def _filter_result(
@@ -111,23 +35,130 @@ def _filter_result(
     return filtered
 
 
+ImageSource = Union[str, Path, bytes, bytearray, memoryview, np.ndarray]
+
+
+class GroundTruth:
+    """A decoded ground truth that keeps each GT-only summary it has needed.
+
+    ``img`` is the 8-bit pixels `load_pixels` returns (a float array from
+    `load_image` also works, at eight times the size).
+
+    A reward loop scores many predictions against one ground truth. Holding
+    one of these instead of the image means its edge mask, OCR and histograms
+    are computed on first use and then reused; ``summaries`` may also be seeded
+    from `metadata.json`. The summaries are what `layout_summary`,
+    `legibility_summary` and `style_summary` return, so results are unchanged.
+
+    The image's conversions are not kept - they would multiply the entry's
+    size several times over - but a caller building several summaries at once
+    can pass one `ImageFeatures` of the image to share them meanwhile.
+    """
+
+    def __init__(self, img: np.ndarray, summaries: dict | None = None):
+        self.img = img
+        self.summaries = dict(summaries or {})
+
+    @property
+    def nbytes(self) -> int:
+        return self.img.nbytes
+
+    def summary(self, group: str, features: ImageFeatures | None = None):
+        if group not in self.summaries:
+            if group == "layout":
+                from widget_quality.layout import layout_summary as build
+            elif group == "legibility":
+                from widget_quality.legibility import legibility_summary as build
+            else:
+                from widget_quality.style import style_summary as build
+            self.summaries[group] = build(self.img if features is None else features)
+        return self.summaries[group]
+
+    def contrast(self, features: ImageFeatures | None = None):
+        """The global contrast alone, which needs no OCR."""
+        if "legibility" in self.summaries:
+            return self.summaries["legibility"]["contrast"]
+        if "contrast" not in self.summaries:
+            from widget_quality.legibility import contrast_ratio
+
+            self.summaries["contrast"] = np.nan_to_num(
+                contrast_ratio(self.img if features is None else features))
+        return self.summaries["contrast"]
+
+
+def prepare_ground_truth(
+    ground_truth: GroundTruth, *, metrics: str | None = None, use_cuda: bool = False
+) -> GroundTruth:
+    """Compute the GT-only summaries an evaluation of `metrics` will use."""
+    selection = parse_metric_selection(metrics)
+    features = ImageFeatures(ground_truth.img)
+    for group in ("layout", "style"):
+        if group in selection:
+            ground_truth.summary(group, features)
+    if "legibility" in selection:
+        if selection["legibility"] == {"ContrastDiff"}:
+            ground_truth.contrast(features)
+        else:
+            from widget_quality.legibility import set_ocr_device
+
+            set_ocr_device(use_cuda)
+            ground_truth.summary("legibility", features)
+    return ground_truth
+
+
+class GroundTruthCache:
+    """Least-recently-used `GroundTruth`s by sha256, bounded by decoded size."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, GroundTruth] = OrderedDict()
+        self._bytes = 0
+
+    def get(self, sha256: str) -> GroundTruth | None:
+        entry = self._entries.get(sha256)
+        if entry is not None:
+            self._entries.move_to_end(sha256)
+        return entry
+
+    def put(self, sha256: str, entry: GroundTruth) -> None:
+        if sha256 in self._entries:
+            self._bytes -= self._entries.pop(sha256).nbytes
+        self._entries[sha256] = entry
+        self._bytes += entry.nbytes
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            self._bytes -= self._entries.popitem(last=False)[1].nbytes
+
+
 def evaluate_single(
-    gt_path: str | Path,
-    pred_path: str | Path,
+    gt_path: ImageSource | GroundTruth,
+    pred_path: ImageSource,
     *,
     metrics: str | None = None,
     use_cuda: bool = False,
+    precision: str = "compact",
 ) -> dict:
-    """Evaluate one pair and return only the selected 0.2.9-compatible values."""
+    """Evaluate one pair and return only the selected 0.2.9-compatible values.
+
+    Either image may be a path, its encoded bytes, or a uint8 array; see
+    `widget_quality.utils.load_pixels`. The ground truth may also be a
+    `GroundTruth`, whose summaries are then used and kept. `precision` says how
+    a prediction not the ground truth's size is resized onto it; see
+    `widget_quality.features.PRECISIONS`.
+    """
     selection = parse_metric_selection(metrics)
-    gt = load_image(str(gt_path))
-    pred = load_image(str(pred_path))
-    gen = None if set(selection) == {"geometry"} else resize_to_match(gt, pred)
+    ground_truth = gt_path if isinstance(gt_path, GroundTruth) else None
+    gt = ImageFeatures(ground_truth.img if ground_truth is not None else load_pixels(gt_path))
+    pred = load_pixels(pred_path)
+
+    def gt_summary(group):
+        return None if ground_truth is None else ground_truth.summary(group, gt)
+    gen = None if set(selection) == {"geometry"} else resize_prediction(gt, pred, precision)
 
     geo = perceptual = layout = legibility = style = None
 
     if "geometry" in selection:
-        geo = compute_aspect_dimensionality_fidelity(gt, pred)
+        with stage("geometry"):
+            geo = compute_aspect_dimensionality_fidelity(gt, pred)
 
     if "perceptual" in selection:
         from widget_quality import perceptual as perceptual_module
@@ -143,26 +174,35 @@ def evaluate_single(
     if "layout" in selection:
         from widget_quality.layout import compute_layout
 
-        layout = compute_layout(gt, gen)
+        with stage("layout"):
+            layout = compute_layout(gt, gen, gt_summary=gt_summary("layout"))
 
     if "legibility" in selection:
         from widget_quality import legibility as legibility_module
 
         leaves = selection["legibility"]
         if leaves == {"ContrastDiff"}:
-            gt_contrast = np.nan_to_num(legibility_module.contrast_ratio(gt))
             gen_contrast = np.nan_to_num(legibility_module.contrast_ratio(gen))
+            if ground_truth is None:
+                gt_contrast = np.nan_to_num(legibility_module.contrast_ratio(gt))
+            else:
+                # As in `compare_legibility`: a value read from metadata.json
+                # is a Python float, taken back to the live side's dtype.
+                gt_contrast = np.asarray(gen_contrast).dtype.type(ground_truth.contrast(gt))
             legibility = {
                 "ContrastDiff": float(np.clip(abs(gt_contrast - gen_contrast), 0, 5))
             }
         else:
             legibility_module.set_ocr_device(use_cuda)
-            legibility = legibility_module.compute_legibility(gt, gen)
+            with stage("legibility"):
+                legibility = legibility_module.compute_legibility(
+                    gt, gen, gt_summary=gt_summary("legibility"))
 
     if "style" in selection:
         from widget_quality.style import compute_style
 
-        style = compute_style(gt, gen)
+        with stage("style"):
+            style = compute_style(gt, gen, gt_summary=gt_summary("style"))
 
     result = composite_score(geo, perceptual, layout, legibility, style)
     return convert_to_serializable(_filter_result(result, selection))
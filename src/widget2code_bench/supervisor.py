@@ -1,4 +1,10 @@
-"""Restart a benchmark daemon that exits or stops making progress."""
+"""Restart a benchmark daemon that exits or stops making progress.
+
+A daemon that exits is started again. One that is wedged, or any on SIGHUP,
+is replaced without a gap: the next daemon starts with `--takeover`, warms up
+beside it and takes over its socket, and only then is the old one stopped -
+with SIGTERM, so it answers what it has already read, or killed if wedged.
+"""
 from __future__ import annotations
 
 import argparse
@@ -11,6 +17,7 @@ import time
 from pathlib import Path
 
 from . import bench_ipc as ipc
+from .telemetry import Registry, serve_in_thread
 
 
 def read_heartbeat(path: Path) -> dict | None:
@@ -43,41 +50,154 @@ def kill_process_group(pid: int) -> None:
             pass
 
 
+def daemon_command(args: argparse.Namespace, *, takeover: bool = False) -> list[str]:
+    command = [
+        sys.executable, "-u", "-m", "widget2code_bench.bench_daemon",
+        "--runtime-dir", str(args.runtime_dir), "--workers", str(args.workers),
+        "--drain-timeout", str(args.drain_timeout),
+    ]
+    if args.cuda:
+        command.append("--cuda")
+    if args.devices is not None:
+        command += ["--devices", args.devices]
+    if args.model_host:
+        command.append("--model-host")
+    if args.cache is not None:
+        command += ["--cache", str(args.cache)]
+    if args.gt_dir is not None:
+        command += ["--gt_dir", str(args.gt_dir)]
+    if args.light_workers is not None:
+        command += ["--light-workers", str(args.light_workers)]
+    if args.timings:
+        command.append("--timings")
+    for flag in ("max_tasks_per_worker", "max_worker_rss_mb", "max_worker_vram_mb"):
+        if getattr(args, flag) is not None:
+            command += [f"--{flag.replace('_', '-')}", str(getattr(args, flag))]
+    if args.daemon_metrics_port is not None:
+        command += ["--metrics-port", str(args.daemon_metrics_port),
+                    "--metrics-host", args.metrics_host]
+    if takeover:
+        command.append("--takeover")
+    return command
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument("--runtime-dir", type=Path, default=ipc.DEFAULT_RUNTIME_DIR)
     parser.add_argument("--workers", type=int, default=8)
     parser.add_argument("--cuda", action="store_true")
+    parser.add_argument("--devices", default=None, help="passed to the daemon")
+    parser.add_argument("--model-host", action="store_true")
+    parser.add_argument("--cache", type=Path, default=None)
+    parser.add_argument("--gt_dir", type=Path, default=None)
+    parser.add_argument("--light-workers", type=int, default=None)
+    parser.add_argument("--timings", action="store_true")
+    parser.add_argument("--max-tasks-per-worker", type=int, default=None)
+    parser.add_argument("--max-worker-rss-mb", type=int, default=None)
+    parser.add_argument("--max-worker-vram-mb", type=int, default=None)
     parser.add_argument("--stall-timeout", type=float, default=600.0)
     parser.add_argument("--silence-timeout", type=float, default=60.0)
     parser.add_argument("--poll", type=float, default=5.0)
+    parser.add_argument("--drain-timeout", type=float, default=60.0,
+                        help="seconds a replaced daemon has to answer what it already read")
+    parser.add_argument("--handoff-timeout", type=float, default=900.0,
+                        help="seconds a replacement has to warm up and take over the socket "
+                             "before the old daemon is simply restarted")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve the supervisor's Prometheus metrics on this port")
+    parser.add_argument("--daemon-metrics-port", type=int, default=None,
+                        help="passed to the daemon as its --metrics-port")
+    parser.add_argument("--metrics-host", default="127.0.0.1")
     args = parser.parse_args()
     args.runtime_dir.mkdir(parents=True, exist_ok=True)
     heartbeat = ipc.heartbeat_path(args.runtime_dir)
     proc: subprocess.Popen | None = None
-    stopping = False
+    # Replaced daemons finishing their in-flight requests: (process, kill-by).
+    draining: list[tuple[subprocess.Popen, float]] = []
+    stopping = reload = False
     restarts = 0
 
+    metrics = Registry()
+    restarts_total = metrics.counter("w2c_supervisor_restarts_total",
+                                     "Daemon restarts after it exited or was killed.")
+    kills_total = metrics.counter("w2c_supervisor_kills_total",
+                                  "Daemons killed as wedged, by reason (silence or stall).")
+    handoffs_total = metrics.counter("w2c_supervisor_handoffs_total",
+                                     "Daemons replaced by a warmed-up successor, by outcome "
+                                     "(ok or failed).")
+
+    def _daemon_families():
+        beat = read_heartbeat(heartbeat) or {}
+        up = proc is not None and proc.poll() is None
+        yield ("w2c_supervisor_daemon_up", "gauge", "1 while the daemon process runs.",
+               [({}, int(up))])
+        yield ("w2c_supervisor_daemon_ready", "gauge",
+               "1 once the daemon's workers are warm and it accepts requests.",
+               [({}, int(up and bool(beat.get("ready"))))])
+        if beat:
+            yield ("w2c_supervisor_heartbeat_age_seconds", "gauge",
+                   "Seconds since the daemon last wrote its heartbeat.",
+                   [({}, time.time() - beat.get("now", 0))])
+            yield ("w2c_supervisor_seconds_since_completion", "gauge",
+                   "Seconds since the daemon last finished a request.",
+                   [({}, time.time() - beat.get("last_completed_at", 0))])
+            yield ("w2c_supervisor_daemon_in_flight", "gauge",
+                   "Requests outstanding, as of the last heartbeat.",
+                   [({}, beat.get("in_flight", 0))])
+
+    metrics.collector(_daemon_families)
+    if args.metrics_port is not None:
+        serve_in_thread(metrics, args.metrics_host, args.metrics_port)
+
     def _stop(*_):
         nonlocal stopping
         stopping = True
 
+    def _reload(*_):
+        nonlocal reload
+        reload = True
+
+    def handoff() -> bool:
+        """Start a successor and wait until it serves the socket."""
+        nonlocal proc, announced
+        successor = subprocess.Popen(daemon_command(args, takeover=True), start_new_session=True)
+        print(f"supervisor: started successor pid {successor.pid}", flush=True)
+        deadline = time.time() + args.handoff_timeout
+        while time.time() < deadline and successor.poll() is None and not stopping:
+            beat = read_heartbeat(heartbeat)
+            if beat and beat.get("pid") == successor.pid and beat.get("ready"):
+                proc, announced = successor, True
+                print(f"supervisor: successor took over after "
+                      f"{beat['ready_at'] - beat['started_at']:.1f}s of warm-up", flush=True)
+                handoffs_total.inc(outcome="ok")
+                return True
+            time.sleep(min(args.poll, 1.0))
+        print("supervisor: successor did not take over; keeping the daemon", flush=True)
+        handoffs_total.inc(outcome="failed")
+        kill_process_group(successor.pid)
+        successor.wait()
+        return False
+
     signal.signal(signal.SIGINT, _stop)
     signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGHUP, _reload)
     try:
         while not stopping:
+            for old, kill_at in list(draining):
+                if old.poll() is not None:
+                    draining.remove((old, kill_at))
+                elif time.time() > kill_at:
+                    print(f"supervisor: replaced daemon {old.pid} still draining; killing",
+                          flush=True)
+                    kill_process_group(old.pid)
             if proc is None or proc.poll() is not None:
                 if proc is not None:
                     restarts += 1
+                    restarts_total.inc()
                     print(f"supervisor: daemon exited with {proc.returncode}; restart #{restarts}", flush=True)
                 heartbeat.unlink(missing_ok=True)
-                command = [
-                    sys.executable, "-u", "-m", "widget2code_bench.bench_daemon",
-                    "--runtime-dir", str(args.runtime_dir), "--workers", str(args.workers),
-                ]
-                if args.cuda:
-                    command.append("--cuda")
-                proc = subprocess.Popen(command, start_new_session=True)
+                proc = subprocess.Popen(daemon_command(args), start_new_session=True)
+                announced = False
                 print(f"supervisor: started daemon pid {proc.pid}", flush=True)
                 deadline = time.time() + args.silence_timeout
                 while time.time() < deadline and proc.poll() is None:
@@ -85,25 +205,49 @@ def main() -> int:
                         break
                     time.sleep(args.poll)
             time.sleep(args.poll)
+            if reload:
+                reload = False
+                old = proc
+                if old.poll() is None and handoff():
+                    # The old daemon stops by itself once it sees its socket
+                    # taken; the signal just saves it the wait.
+                    old.terminate()
+                    draining.append((old, time.time() + args.drain_timeout + 30))
+                continue
+            beat, now = read_heartbeat(heartbeat), time.time()
+            if beat and beat.get("ready") and not announced:
+                announced = True
+                print(f"supervisor: daemon ready after "
+                      f"{beat['ready_at'] - beat['started_at']:.1f}s of warm-up", flush=True)
             reason = diagnose(
-                read_heartbeat(heartbeat), now=time.time(),
-                stall_s=args.stall_timeout, silence_s=args.silence_timeout,
+                beat, now=now, stall_s=args.stall_timeout, silence_s=args.silence_timeout,
             )
             if reason and proc is not None and proc.poll() is None:
-                print(f"supervisor: KILLING wedged daemon - {reason}", flush=True)
-                kill_process_group(proc.pid)
+                print(f"supervisor: wedged daemon - {reason}; replacing it", flush=True)
+                silent = now - beat.get("now", 0) > args.silence_timeout
+                kills_total.inc(reason="silence" if silent else "stall")
+                # Its clients are waiting on it; once a successor serves the
+                # socket, the kill sends them there rather than into backoff.
+                old = proc
+                handoff()
+                print(f"supervisor: KILLING wedged daemon {old.pid}", flush=True)
+                kill_process_group(old.pid)
                 try:
-                    proc.wait(timeout=30)
+                    old.wait(timeout=30)
                 except Exception:
                     pass
     finally:
-        if proc is not None and proc.poll() is None:
-            print("supervisor: stopping daemon", flush=True)
+        for old in [proc] + [old for old, _ in draining]:
+            if old is not None and old.poll() is None:
+                print(f"supervisor: stopping daemon {old.pid}", flush=True)
+                old.terminate()
+        for old in [proc] + [old for old, _ in draining]:
+            if old is None:
+                continue
             try:
-                proc.terminate()
-                proc.wait(timeout=30)
+                old.wait(timeout=args.drain_timeout + 30)
             except Exception:
-                kill_process_group(proc.pid)
+                kill_process_group(old.pid)
     return 0
 
 
@@ -0,0 +1,219 @@
+"""Prometheus text-format metrics for the daemon and the supervisor.
+
+`heartbeat.json` tells the supervisor whether the daemon is alive; it is not
+something a scraper can graph or alert on. Each process keeps a `Registry` of
+counters, gauges and histograms, and `--metrics-port` serves it as
+``GET /metrics`` in the Prometheus text format (0.0.4), so an autoscaler can
+read request rates and queue depth and an alert can fire on a latency tail
+before the supervisor has to kill a wedged daemon.
+
+Values that already live elsewhere - scheduler queues, cache counters, process
+memory - are read when scraped, by collector callbacks, rather than copied on
+every change.
+
+Standard library only: this runs in the daemon's parent and the supervisor.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterable
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; one evaluation spans a few ms (geometry) to tens of seconds (OCR on
+# a loaded CPU).
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = tuple[tuple[str, str], ...]
+# A collector returns (name, type, help, [(labels, value), ...]) families.
+Family = tuple[str, str, str, list[tuple[dict, float]]]
+
+
+def _labels(labels: dict | Labels) -> Labels:
+    items = labels.items() if isinstance(labels, dict) else labels
+    return tuple(sorted((k, str(v)) for k, v in items))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(name: str, labels: Labels, value: float) -> str:
+    label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+    if math.isnan(value):
+        number = "NaN"
+    elif math.isinf(value):
+        number = "+Inf" if value > 0 else "-Inf"
+    elif value == int(value) and abs(value) < 1e15:
+        number = str(int(value))
+    else:
+        number = repr(float(value))
+    return f"{name}{{{label_text}}} {number}" if label_text else f"{name} {number}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def lines(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [_format(self.name, labels, value) for labels, value in values]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[_labels(labels)] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[Labels, list] = {}   # labels -> [counts..., sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def lines(self) -> list[str]:
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        out = []
+        for labels, values in series:
+            for bound, count in zip(self.buckets + (math.inf,),
+                                    values[:len(self.buckets)] + [values[-1]]):
+                le = "+Inf" if math.isinf(bound) else repr(float(bound))
+                out.append(_format(f"{self.name}_bucket", labels + (("le", le),), count))
+            out.append(_format(f"{self.name}_sum", labels, values[-2]))
+            out.append(_format(f"{self.name}_count", labels, values[-1]))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Callable[[], Iterable[Family]]] = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._add(Counter(name, help))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._add(Gauge(name, help))
+
+    def histogram(self, name: str, help: str,
+                  buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, buckets))
+
+    def collector(self, fn: Callable[[], Iterable[Family]]) -> None:
+        """Call `fn` on every scrape for families computed then."""
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        out = []
+        for metric in self._metrics:
+            out += [f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} {metric.kind}"]
+            out += metric.lines()
+        for collect in self._collectors:
+            try:
+                families = list(collect())
+            except Exception as exc:    # a scrape must not take the process down
+                out.append(f"# collector failed: {type(exc).__name__}: {exc}")
+                continue
+            for name, kind, help, samples in families:
+                out += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                out += [_format(name, _labels(labels), value) for labels, value in samples]
+        return "\n".join(out) + "\n"
+
+
+def resident_bytes(pid: int) -> int | None:
+    """Resident set size of `pid`, from /proc; None where there is no /proc."""
+    try:
+        with open(f"/proc/{pid}/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _response(method: str, path: str, registry: Registry) -> tuple[int, bytes]:
+    if method != "GET":
+        return 405, b"only GET\n"
+    if path.split("?", 1)[0] not in ("/metrics", "/"):
+        return 404, b"try /metrics\n"
+    return 200, registry.render().encode()
+
+
+async def serve(registry: Registry, host: str, port: int) -> asyncio.AbstractServer:
+    """``GET /metrics`` on the running event loop (the daemon's)."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = (await reader.readline()).decode("latin-1").split()
+            while (await reader.readline()).strip():
+                pass
+            status, body = _response(*(request[:2] if len(request) >= 2 else ("", "")),
+                                     registry)
+            writer.write(
+                f"HTTP/1.0 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                f"Content-Type: {CONTENT_TYPE}\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+def serve_in_thread(registry: Registry, host: str, port: int) -> ThreadingHTTPServer:
+    """``GET /metrics`` from a daemon thread (the supervisor's, which has no loop)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            status, body = _response("GET", self.path, registry)
+            self.send_response(status)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
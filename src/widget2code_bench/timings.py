@@ -0,0 +1,75 @@
+"""Percentiles and histograms over per-stage timing records.
+
+A record is what `widget_quality.timing.collect` fills in for one evaluation:
+``stage -> {"wall_ms", "cpu_ms", "calls"}``. A batch run summarises all of its
+records into run.json; the daemon keeps the last `window` of them and reports
+them in its heartbeat, so a regression shows up while it is still running.
+
+Standard library only: this runs in the daemon's parent process.
+"""
+from __future__ import annotations
+
+import threading
+from collections import deque
+from typing import Iterable
+
+PERCENTILES = (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0))
+# Upper bounds of the heartbeat's wall-time histogram, in ms; the last bucket
+# is everything slower.
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+DEFAULT_WINDOW = 2048
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _histogram(values: Iterable[float]) -> list[int]:
+    counts = [0] * (len(BUCKETS_MS) + 1)
+    for value in values:
+        counts[next((i for i, bound in enumerate(BUCKETS_MS) if value <= bound),
+                    len(BUCKETS_MS))] += 1
+    return counts
+
+
+def summarize(records: Iterable[dict], *, histogram: bool = False) -> dict:
+    """``stage -> {"n", "wall_ms": {p50, p90, p99, max}, "cpu_ms": {...}}``.
+
+    `n` counts the records the stage ran in. With `histogram`, each stage also
+    gets ``"wall_hist"``: counts per `BUCKETS_MS` bucket.
+    """
+    by_stage: dict[str, tuple[list, list]] = {}
+    for record in records:
+        for name, entry in record.items():
+            walls, cpus = by_stage.setdefault(name, ([], []))
+            walls.append(entry["wall_ms"])
+            cpus.append(entry["cpu_ms"])
+    summary = {}
+    for name in sorted(by_stage):
+        walls, cpus = (sorted(values) for values in by_stage[name])
+        summary[name] = {
+            "n": len(walls),
+            "wall_ms": {k: round(_percentile(walls, q), 3) for k, q in PERCENTILES},
+            "cpu_ms": {k: round(_percentile(cpus, q), 3) for k, q in PERCENTILES},
+        }
+        if histogram:
+            summary[name]["wall_hist"] = _histogram(walls)
+    return summary
+
+
+class RollingTimings:
+    """The last `window` records, summarised on demand."""
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self._records: deque[dict] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, record: dict) -> None:
+        with self._lock:
+            self._records.append(record)
+
+    def stats(self) -> dict:
+        with self._lock:
+            records = list(self._records)
+        return {"samples": len(records), "buckets_ms": list(BUCKETS_MS),
+                "stages": summarize(records, histogram=True)}
@@ -0,0 +1,310 @@
+"""A process pool whose workers are retired one at a time.
+
+A daemon worker lives for days. EasyOCR and torch grow its resident set over
+that time - allocator fragmentation, cached CUDA blocks - and the only remedy
+used to be the supervisor killing the whole daemon. Here each worker is a
+one-process `ProcessPoolExecutor` of its own, so one can be replaced without
+touching the others:
+
+- after `max_tasks` jobs;
+- when, after a job, its RSS or its CUDA reservation is over the ceiling;
+- when it dies - only the job it was running fails, instead of every job in
+  the pool as with one shared executor;
+- when its warm-up fails, so a worker whose models did not load takes no jobs.
+  A slot whose warm-up keeps failing is restarted after a growing pause, and
+  after `WARMUP_ATTEMPTS` failures in a row it is given up: its work goes to
+  the other workers, and once no slot is left, waiting and new jobs fail with
+  the warm-up's error instead of waiting forever.
+
+A worker is only retired between jobs: it takes no new work while it has any,
+so nothing in flight is dropped. Its replacement starts at once, and runs
+`warm` (if given) before it is handed real work. Each retirement is recorded
+as an event for the heartbeat and the metrics.
+
+Workers may be placed differently - one GPU each, say: with `placements`,
+worker i is initialised with ``placements[i % len(placements)]`` instead of
+`initargs`, and so is any worker that replaces it. A job goes to the least busy
+worker, and once every worker has one, later jobs wait here and go to whichever
+finishes first, so a batch submitted all at once still spreads by speed rather
+than by count.
+
+`max_tasks_per_child` would cover only the first case, and needs Python 3.11.
+
+Standard library only on this side: this runs in the daemon's parent process.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Sequence
+
+EVENT_WINDOW = 32
+REASONS = ("tasks", "rss", "vram", "died", "warmup")
+WARMUP_ATTEMPTS = 3
+WARMUP_BACKOFF_S = 1.0     # before the second attempt; doubles after each failure
+
+
+def _footprint() -> tuple[int | None, int | None]:
+    """(RSS, CUDA bytes reserved) of this worker; None where unknown."""
+    rss = None
+    try:
+        with open("/proc/self/statm") as fh:
+            rss = int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    vram = None
+    torch = sys.modules.get("torch")    # only a worker that loaded it can hold any
+    if torch is not None and torch.cuda.is_available() and torch.cuda.is_initialized():
+        vram = torch.cuda.memory_reserved()
+    return rss, vram
+
+
+def _measured(fn: Callable, *args) -> tuple[Any, tuple[int | None, int | None]]:
+    """`fn(*args)` in the worker, with the worker's footprint after it.
+
+    A failing job is as likely as any to have grown the worker - more so, if
+    it ran out of memory - so its exception carries the footprint too.
+    """
+    try:
+        result = fn(*args)
+    except BaseException as exc:
+        exc.worker_footprint = _footprint()
+        raise
+    return result, _footprint()
+
+
+class _Worker:
+    def __init__(self, executor: ProcessPoolExecutor, slot: int):
+        self.executor = executor
+        self.slot = slot
+        self.busy = 0
+        self.tasks = 0
+        self.retiring = False
+        self.ready = True
+        self.rss: int | None = None
+        self.vram: int | None = None
+
+    @property
+    def pid(self) -> int | None:
+        # The executor keeps no public record of its process.
+        processes = getattr(self.executor, "_processes", None) or {}
+        return next(iter(processes), None)
+
+
+class RecyclingPool(Executor):
+    def __init__(self, workers: int, *, mp_context, initializer=None, initargs=(),
+                 placements: Sequence[tuple] | None = None,
+                 max_tasks: int = 0, max_rss: int = 0, max_vram: int = 0,
+                 warm: tuple | None = None, name: str = "pool"):
+        """`max_*` of 0 disable that limit; `warm` is ``(fn, *args)``."""
+        self.size = workers
+        self.max_tasks = max_tasks
+        self.max_rss = max_rss
+        self.max_vram = max_vram
+        self.name = name
+        self._context = mp_context
+        self._initializer = initializer
+        self._placements = list(placements) if placements else [initargs]
+        self._warm = warm
+        # Re-entrant: a finished job's callback hands the next waiting one to
+        # its worker while holding it.
+        self._lock = threading.RLock()
+        self._shutdown = False
+        self._backlog: deque[tuple[Future, Callable, tuple]] = deque()
+        self.retired: Counter[str] = Counter()
+        self.events: deque[dict] = deque(maxlen=EVENT_WINDOW)
+        # Per slot: warm-ups failed in a row, and the error of a slot given up.
+        self._warm_failures: Counter[int] = Counter()
+        self._dead: dict[int, BaseException] = {}
+        self._timers: set[threading.Timer] = set()
+        self._workers = [self._start(slot, warm=False) for slot in range(workers)]
+
+    def _start(self, slot: int, *, warm: bool = True) -> _Worker:
+        worker = _Worker(ProcessPoolExecutor(
+            max_workers=1, mp_context=self._context, initializer=self._initializer,
+            initargs=self._placements[slot % len(self._placements)]), slot)
+        if warm and self._warm is not None:
+            # The replacement loads its models before it takes real work;
+            # meanwhile jobs wait for it or for whichever worker frees first.
+            worker.ready = False
+            fn, *args = self._warm
+            future = worker.executor.submit(_measured, fn, *args)
+            worker.busy += 1
+            future.add_done_callback(lambda f, w=worker: self._done(w, f, count=False))
+        return worker
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        if kwargs:
+            raise TypeError("RecyclingPool.submit takes positional arguments only")
+        outer: Future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            if len(self._dead) == len(self._workers):
+                outer.set_exception(self._unusable())
+                return outer
+            candidates = [w for w in self._workers if not w.retiring]
+            worker = min(candidates, key=lambda w: (not w.ready, w.busy), default=None)
+            if worker is None or worker.busy:
+                self._backlog.append((outer, fn, args))
+            else:
+                self._dispatch(worker, outer, fn, args)
+        return outer
+
+    def _unusable(self) -> RuntimeError:
+        error = next(iter(self._dead.values()))
+        failure = RuntimeError(f"every {self.name} worker failed to warm up "
+                               f"{WARMUP_ATTEMPTS} times running: {error!r}")
+        failure.__cause__ = error
+        return failure
+
+    def _dispatch(self, worker: _Worker, outer: Future, fn: Callable, args: tuple) -> None:
+        inner = worker.executor.submit(_measured, fn, *args)
+        worker.busy += 1
+
+        def finished(inner: Future) -> None:
+            self._done(worker, inner)
+            if inner.cancelled():
+                outer.cancel()
+                return
+            if not outer.set_running_or_notify_cancel():
+                return
+            try:
+                result, _ = inner.result()
+            except BaseException as exc:
+                outer.set_exception(exc)
+            else:
+                outer.set_result(result)
+
+        inner.add_done_callback(finished)
+
+    def _done(self, worker: _Worker, inner: Future, *, count: bool = True) -> None:
+        reason = None
+        with self._lock:
+            worker.busy -= 1
+            worker.tasks += count
+            if inner.cancelled():
+                pass
+            elif inner.exception() is None:
+                worker.rss, worker.vram = inner.result()[1]
+                worker.ready = True
+                if not count:
+                    self._warm_failures[worker.slot] = 0
+            elif isinstance(inner.exception(), BrokenProcessPool):
+                reason = "died"
+            else:
+                footprint = getattr(inner.exception(), "worker_footprint", None)
+                if footprint is not None:
+                    worker.rss, worker.vram = footprint
+                if not count:           # the warm-up itself failed
+                    reason = "warmup"
+                    self._warm_failures[worker.slot] += 1
+            if reason is None:
+                if self.max_tasks and worker.tasks >= self.max_tasks:
+                    reason = "tasks"
+                elif self.max_rss and (worker.rss or 0) > self.max_rss:
+                    reason = "rss"
+                elif self.max_vram and (worker.vram or 0) > self.max_vram:
+                    reason = "vram"
+            if reason is not None and not worker.retiring:
+                worker.retiring = True
+                self.retired[reason] += 1
+                self.events.append({
+                    "at": time.time(), "pool": self.name, "pid": worker.pid,
+                    "reason": reason, "tasks": worker.tasks,
+                    "rss": worker.rss, "vram": worker.vram,
+                })
+            if self._shutdown:
+                return
+            if not worker.retiring:
+                self._feed(worker)
+                return
+            if worker.busy:
+                return
+            failures = self._warm_failures[worker.slot] if reason == "warmup" else 0
+            if failures >= WARMUP_ATTEMPTS:
+                self._give_up(worker.slot, inner.exception())
+            elif failures:
+                # A warm-up that failed will likely fail again straight away
+                # (a card out of memory, a broken model cache): pause first.
+                timer = threading.Timer(WARMUP_BACKOFF_S * 2 ** (failures - 1),
+                                        self._replace, (worker,))
+                timer.daemon = True
+                self._timers.add(timer)
+                timer.start()
+            else:
+                self._replace(worker)
+        worker.executor.shutdown(wait=False)
+
+    def _replace(self, worker: _Worker) -> None:
+        """Swap a fresh process into idle, retiring `worker`'s slot."""
+        with self._lock:
+            self._timers = {t for t in self._timers if t.is_alive()}
+            if self._shutdown:
+                return
+            fresh = self._workers[self._workers.index(worker)] = self._start(worker.slot)
+            self._feed(fresh)
+
+    def _give_up(self, slot: int, error: BaseException) -> None:
+        """Leave `slot` empty; with no slot left, fail what waits for one."""
+        self._dead[slot] = error
+        self.events.append({"at": time.time(), "pool": self.name, "slot": slot,
+                            "reason": "gave up", "error": repr(error)})
+        if len(self._dead) < len(self._workers):
+            return
+        waiting = list(self._backlog)
+        self._backlog.clear()
+        for outer, _, _ in waiting:
+            if outer.set_running_or_notify_cancel():
+                outer.set_exception(self._unusable())
+
+    def _feed(self, worker: _Worker) -> None:
+        """Hand an idle `worker` the oldest waiting job."""
+        while self._backlog and not worker.busy:
+            outer, fn, args = self._backlog.popleft()
+            if outer.cancelled():
+                continue
+            try:
+                self._dispatch(worker, outer, fn, args)
+            except BaseException as exc:    # a broken worker: fail this job only
+                if outer.set_running_or_notify_cancel():
+                    outer.set_exception(exc)
+
+    def pids(self) -> list[int]:
+        with self._lock:
+            workers = list(self._workers)
+        return [pid for pid in (w.pid for w in workers) if pid is not None]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.size,
+                "max_tasks": self.max_tasks, "max_rss": self.max_rss,
+                "max_vram": self.max_vram,
+                "retired": {reason: self.retired[reason] for reason in REASONS},
+                "waiting": len(self._backlog),
+                "given_up": sorted(self._dead),
+                "events": list(self.events),
+                "rss": [w.rss for w in self._workers],
+            }
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        with self._lock:
+            self._shutdown = True
+            workers = list(self._workers)
+            for timer in self._timers:
+                timer.cancel()
+            waiting = list(self._backlog)
+            self._backlog.clear()
+        for outer, _, _ in waiting:
+            if cancel_futures:
+                outer.cancel()
+            elif outer.set_running_or_notify_cancel():
+                outer.set_exception(RuntimeError("pool shut down before the job started"))
+        for worker in workers:
+            worker.executor.shutdown(wait=wait, cancel_futures=cancel_futures)
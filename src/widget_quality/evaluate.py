@@ -8,30 +8,33 @@ from pathlib import Path
 import numpy as np
 
 from .composite import composite_score
+from .features import ImageFeatures
 from .geometry import compute_aspect_dimensionality_fidelity
 from .layout import compute_layout
 from .legibility import compute_legibility
 from .perceptual import compute_perceptual
 from .style import compute_style
-from .utils import load_image, resize_to_match
+from .utils import load_pixels, resize_prediction
 
 
-def evaluate_pair(gt_path, gen_path):
+def evaluate_pair(gt_path, gen_path, precision="compact"):
     """
     Evaluate a single GT / generated image pair.
 
     Args:
         gt_path: Path to ground truth image.
         gen_path: Path to generated image.
+        precision: How a generated image not the GT's size is resized onto
+            it; see `features.PRECISIONS`.
 
     Returns:
         dict with all metrics (raw + transformed composite scores).
     """
-    gt = load_image(gt_path)
-    gen = load_image(gen_path)
+    gt = ImageFeatures(load_pixels(gt_path))
+    gen = load_pixels(gen_path)
 
     geo = compute_aspect_dimensionality_fidelity(gt, gen)
-    gen_resized = resize_to_match(gt, gen)
+    gen_resized = resize_prediction(gt, gen, precision)
 
     layout = compute_layout(gt, gen_resized)
     legibility = compute_legibility(gt, gen_resized)
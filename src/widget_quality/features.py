@@ -0,0 +1,175 @@
+"""One image and everything the metrics derive from it, each derived once.
+
+The metric modules each start from the RGB array and convert it themselves:
+the layout mask wants an 8-bit greyscale, OCR an 8-bit RGB, the contrast
+metrics a float32 luma, polarity skimage's greyscale, and palette and vibrancy
+each an HSV image. Scoring one pair used to convert the same array several
+times over - two HSV conversions per side in `compute_style` alone, and a
+second OCR pass over the ground truth when it was also scored against the
+black and white fills.
+
+`ImageFeatures` holds the image and computes each of those on first use. Every
+metric function takes either one of these or a plain array, so a caller that
+scores one image several ways passes the same object and the work is shared;
+a plain array still gets exactly the old behaviour. Each property is computed
+by the same code, from the same input, as before, so scores are unchanged.
+
+The evaluators hold the decoded 8-bit pixels, 3 bytes a pixel, rather than the
+24 of `load_image`'s float64. That float64 array is exactly the pixels over
+255.0, so it is rebuilt whenever a metric asks for it instead of being kept;
+the colour conversions are made from it a band of rows at a time, so it is
+never whole, and those the metrics read once per image are not kept either.
+What is kept is small: the 8-bit and greyscale forms, the float32 luma, the
+edge mask, the stats of the content mask's components, and the OCR.
+
+The derived arrays are the caller's to read, not to modify.
+"""
+from __future__ import annotations
+
+from functools import cached_property
+
+import cv2
+import numpy as np
+from skimage.color import rgb2gray, rgb2hsv
+
+
+# How a prediction reaches the ground truth's size. "compact" resizes its 8-bit
+# pixels; "float64" resizes `load_image`'s float array, as every release before
+# the compact representation did. The two differ only for a prediction whose
+# size is not the ground truth's, and only by the resize's rounding.
+PRECISIONS = ("compact", "float64")
+
+_BAND_ROWS = 128
+
+
+class ImageFeatures:
+    """A decoded image and its conversions, computed lazily.
+
+    ``pixels`` is either the 8-bit RGB array `utils.load_pixels` returns or a
+    float RGB array in [0, 1] such as `utils.load_image` returns.
+    """
+
+    def __init__(self, pixels: np.ndarray):
+        self.pixels = pixels
+
+    @property
+    def shape(self):
+        return self.pixels.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.pixels.nbytes
+
+    @property
+    def rgb(self) -> np.ndarray:
+        """Float64 RGB in [0, 1]: for 8-bit pixels, exactly `load_image`'s array."""
+        if self.pixels.dtype == np.uint8:
+            return self.pixels / 255.0
+        return self.pixels
+
+    @property
+    def rgb32(self) -> np.ndarray:
+        """`rgb` as float32, without the float64 array in between.
+
+        A uint8 over 255 rounds to the same float32 whether it is divided in
+        float32 or in float64 and then rounded, so this is what casting `rgb`
+        gives.
+        """
+        if self.pixels.dtype == np.uint8:
+            return self.pixels.astype(np.float32) / np.float32(255)
+        return self.pixels.astype(np.float32)
+
+    @cached_property
+    def u8(self) -> np.ndarray:
+        """8-bit RGB, truncated as every consumer has always truncated it.
+
+        Truncating ``x / 255.0 * 255`` gives back ``x`` for every 8-bit value,
+        so for 8-bit pixels this is the pixels themselves.
+        """
+        if self.pixels.dtype == np.uint8:
+            return self.pixels
+        return (self.pixels * 255).astype(np.uint8)
+
+    @cached_property
+    def gray_u8(self) -> np.ndarray:
+        """OpenCV's 8-bit greyscale, which the edge map is taken on."""
+        return cv2.cvtColor(self.u8, cv2.COLOR_RGB2GRAY)
+
+    @cached_property
+    def luma(self) -> np.ndarray:
+        """The float32 luma the contrast metrics measure."""
+        from .legibility import to_gray
+
+        return self._convert(to_gray)
+
+    @property
+    def gray(self) -> np.ndarray:
+        """skimage's greyscale, which polarity is measured on; not kept."""
+        return self._convert(rgb2gray)
+
+    @property
+    def hsv(self) -> np.ndarray:
+        """skimage's HSV; not kept, at 24 bytes a pixel."""
+        return self._convert(rgb2hsv)
+
+    def bands(self):
+        """``(top row, float64 RGB)`` for `rgb` a band of rows at a time.
+
+        From 8-bit pixels the float64 image only ever exists one band at a
+        time; a float image is already whole and comes as one band.
+        """
+        if self.pixels.dtype != np.uint8 or not len(self.pixels):
+            yield 0, self.rgb
+            return
+        for top in range(0, len(self.pixels), _BAND_ROWS):
+            yield top, self.pixels[top:top + _BAND_ROWS] / 255.0
+
+    def _convert(self, convert) -> np.ndarray:
+        """``convert(self.rgb)``, built from `bands`.
+
+        Every conversion passed here works pixel by pixel, so the bands join
+        up into exactly what one call on the whole image returns, while the
+        conversion's own temporaries only ever exist for one band.
+        """
+        out = None
+        for top, rgb in self.bands():
+            band = convert(rgb)
+            if out is None:
+                out = np.empty((len(self.pixels),) + band.shape[1:], band.dtype)
+            out[top:top + len(band)] = band
+        return out
+
+    @cached_property
+    def edges(self) -> np.ndarray:
+        return cv2.Canny(self.gray_u8, 100, 200)
+
+    @cached_property
+    def content_mask(self) -> np.ndarray:
+        """See `layout.content_mask`."""
+        from .layout import content_mask
+
+        return content_mask(self)
+
+    @cached_property
+    def content_components(self) -> np.ndarray:
+        """See `layout.content_components`."""
+        from .layout import content_components
+
+        return content_components(self)
+
+    @cached_property
+    def ocr(self):
+        """``(text, readtext results)``, as `legibility.ocr_text_easyocr` returns."""
+        from .legibility import ocr_text_easyocr
+
+        return ocr_text_easyocr(self)
+
+
+def as_features(img) -> ImageFeatures:
+    """`img` itself if it already is an `ImageFeatures`, else a fresh one."""
+    return img if isinstance(img, ImageFeatures) else ImageFeatures(img)
+
+
+def as_array(img) -> np.ndarray:
+    """`img` as a float RGB array, whichever form it is in."""
+    return img.rgb if isinstance(img, ImageFeatures) else img
@@ -2,82 +2,159 @@ import cv2
 import numpy as np
 from scipy.spatial.distance import cdist
 
-from .utils import edge_map, margin_from_mask, remove_border_touching_components
+from . import timing
+from .features import as_features
+from .utils import margin_from_mask, remove_border_touching_components, touches_frame
 
 MAX_DIFF = 5.0
 
 
 def compute_margin_asymmetry(mask_gt, mask_gen):
     """Variance imbalance of margins (normalized by mean)."""
-    m_gt = margin_from_mask(mask_gt)
-    m_gen = margin_from_mask(mask_gen)
+    return _margin_asymmetry(margin_from_mask(mask_gt), margin_from_mask(mask_gen))
+
+
+def _margin_asymmetry(m_gt, m_gen):
     diffs = np.abs(np.array(m_gt) - np.array(m_gen))
     mean = np.mean(diffs)
     return 0.0 if mean < 1e-6 else float(np.std(diffs) / mean)
 
 
+def _bbox_aspect(mask):
+    ys, xs = np.where(mask > 0)
+    h = ys.max() - ys.min() + 1
+    w = xs.max() - xs.min() + 1
+    return w / h if h > 0 else 1.0
+
+
 def compute_content_aspect_diff(mask_gt, mask_gen):
     """Difference in content bounding-box aspect ratio."""
     if np.sum(mask_gt) == 0 or np.sum(mask_gen) == 0:
         return MAX_DIFF
 
-    def bbox_ar(mask):
-        ys, xs = np.where(mask > 0)
-        h = ys.max() - ys.min() + 1
-        w = xs.max() - xs.min() + 1
-        return w / h if h > 0 else 1.0
-
-    ar_gt, ar_gen = bbox_ar(mask_gt), bbox_ar(mask_gen)
+    ar_gt, ar_gen = _bbox_aspect(mask_gt), _bbox_aspect(mask_gen)
     return float(abs(np.log(ar_gt / ar_gen)))
 
 
+def _component_areas(mask, min_area=10):
+    """Bounding-box areas of the mask's components larger than `min_area`."""
+    mask_bin = (mask > 0).astype(np.uint8)
+    num, labels, stats, _ = cv2.connectedComponentsWithStats(mask_bin, connectivity=8)
+    return _box_areas(stats[1:], min_area)  # skip background
+
+
+def _box_areas(stats, min_area=10):
+    x, y, w, h, area = stats.T
+    return (w * h)[area > min_area]
+
+
+def _area_ratio(areas):
+    return areas.mean() / areas.sum() if len(areas) > 0 else None
+
+
+def _area_ratio_diff(ratio_gt, ratio_gen):
+    if ratio_gt is None or ratio_gen is None:
+        return MAX_DIFF
+    return abs(ratio_gen - ratio_gt)
+
+
 def analyze_internal_structure(mask_gt, mask_gen, min_area=10):
     """
     Compare internal content structure (connected components).
     Returns element area ratio difference.
     """
-    def get_components(mask):
-        mask_bin = (mask > 0).astype(np.uint8)
-        num, labels, stats, _ = cv2.connectedComponentsWithStats(mask_bin, connectivity=8)
-        stats = stats[1:]  # skip background
-        boxes = [(x, y, w, h, w * h) for x, y, w, h, area in stats if area > min_area]
-        return boxes
-
-    boxes_gt = get_components(mask_gt)
-    boxes_gen = get_components(mask_gen)
-
-    areas_gt = np.array([b[4] for b in boxes_gt])
-    areas_gen = np.array([b[4] for b in boxes_gen])
-    if len(areas_gt) > 0 and len(areas_gen) > 0:
-        area_ratio_diff = abs(
-            (areas_gen.mean() / areas_gen.sum()) - (areas_gt.mean() / areas_gt.sum())
-        )
-    else:
-        area_ratio_diff = MAX_DIFF
+    ratio_gt = _area_ratio(_component_areas(mask_gt, min_area))
+    ratio_gen = _area_ratio(_component_areas(mask_gen, min_area))
+    return {"AreaRatioDiff": float(_area_ratio_diff(ratio_gt, ratio_gen))}
+
+
+def content_mask(img):
+    """Dilated Canny edges with every component touching the frame removed."""
+    with timing.stage("layout.mask"):
+        return remove_border_touching_components(_dilated_edges(img))
+
 
-    return {"AreaRatioDiff": float(area_ratio_diff)}
+def _dilated_edges(img):
+    return cv2.dilate(as_features(img).edges, np.ones((3, 3), np.uint8))
 
 
-def compute_layout(gt, gen):
+def content_components(img):
+    """The ``(x, y, w, h, area)`` stats rows of `content_mask`'s components.
+
+    Removing the components that touch the frame leaves every other one
+    whole, so labelling the dilated edges once gives the content mask's
+    components directly - neither the mask nor a second labelling of it is
+    needed to measure them.
     """
-    Compute layout metrics between GT and generated widget.
+    with timing.stage("layout.mask"):
+        mask = (_dilated_edges(img) > 0).astype(np.uint8)
+        _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        stats = stats[1:]  # skip background
+        return stats[~touches_frame(stats, mask.shape)]
 
-    Returns dict with: MarginAsymmetry, ContentAspectDiff, AreaRatioDiff
+
+def layout_summary(img):
+    """Everything `compare_layout` needs from one image, as plain JSON types.
+
+    The layout metrics never look at the two masks together: each side reduces
+    to its margins, its content bounding-box aspect and its component area
+    ratio, and only those numbers are compared. So the ground truth's half can
+    be computed once and stored - this is the record `metadata.json` carries
+    under `eval.layout`.
+
+    All of it is read off the content mask's component stats: the mask's
+    extent is the union of the components' boxes, and the areas are the
+    boxes' own. The areas are integers, so their mean and sum come out the
+    same in any order.
     """
-    e_gt, e_gen = edge_map(gt), edge_map(gen)
-    kernel = np.ones((3, 3), np.uint8)
-    mask_gt = cv2.dilate(e_gt, kernel)
-    mask_gen = cv2.dilate(e_gen, kernel)
+    features = as_features(img)
+    stats = features.content_components
+    areas = _box_areas(stats)
+    ratio = _area_ratio(areas)
+    empty = not len(stats)
+    if empty:
+        margin, bbox_ar = [0, 0, 0, 0], None
+    else:
+        x, y, w, h, _ = stats.T
+        H, W = features.shape[:2]
+        top, left = y.min(), x.min()
+        bottom, right = (y + h).max() - 1, (x + w).max() - 1
+        margin = [top, W - right, H - bottom, left]
+        bbox_ar = float((right - left + 1) / (bottom - top + 1))
+    return {
+        "margin": [int(v) for v in margin],
+        "mask_empty": empty,
+        "bbox_ar": bbox_ar,
+        "area_ratio": None if ratio is None else float(ratio),
+        "n_comp": int(len(areas)),
+    }
 
-    mask_gt = remove_border_touching_components(mask_gt)
-    mask_gen = remove_border_touching_components(mask_gen)
 
-    margin_asym = compute_margin_asymmetry(mask_gt, mask_gen)
-    aspect_diff = compute_content_aspect_diff(mask_gt, mask_gen)
-    inner = analyze_internal_structure(mask_gt, mask_gen)
+def compare_layout(summary_gt, summary_gen):
+    """Layout metrics from two `layout_summary` records."""
+    margin_asym = _margin_asymmetry(summary_gt["margin"], summary_gen["margin"])
+    if summary_gt["mask_empty"] or summary_gen["mask_empty"]:
+        aspect_diff = MAX_DIFF
+    else:
+        aspect_diff = float(abs(np.log(summary_gt["bbox_ar"] / summary_gen["bbox_ar"])))
+    area_diff = _area_ratio_diff(summary_gt["area_ratio"], summary_gen["area_ratio"])
 
     return {
         "MarginAsymmetry": float(margin_asym),
         "ContentAspectDiff": float(aspect_diff),
-        "AreaRatioDiff": inner["AreaRatioDiff"],
+        "AreaRatioDiff": float(area_diff),
     }
+
+
+def compute_layout(gt, gen, gt_summary=None):
+    """
+    Compute layout metrics between GT and generated widget.
+
+    ``gt_summary`` is the GT's `layout_summary`, when it is already known (read
+    from `metadata.json`); only the generated side is then computed.
+
+    Returns dict with: MarginAsymmetry, ContentAspectDiff, AreaRatioDiff
+    """
+    if gt_summary is None:
+        gt_summary = layout_summary(gt)
+    return compare_layout(gt_summary, layout_summary(gen))
@@ -2,6 +2,9 @@ import numpy as np
 import easyocr
 import cv2
 
+from . import timing
+from .features import as_features
+
 _reader = None
 _reader_gpu = True
 
@@ -20,10 +23,25 @@ def set_ocr_device(gpu):
     _reader_gpu = gpu
 
 
+def set_reader(reader, gpu):
+    """Use `reader` - anything with EasyOCR's ``readtext`` - for every OCR call.
+
+    For a process whose OCR is served by another one. ``gpu`` is the device the
+    reader runs on, so a later `set_ocr_device` naming the same one keeps it.
+    """
+    global _reader, _reader_gpu
+    _reader = reader
+    _reader_gpu = bool(gpu)
+
+
 def _get_reader():
     global _reader
     if _reader is None:
         _reader = easyocr.Reader(["en"], gpu=_reader_gpu)
+        # `readtext` is detection then recognition; timing each shows which
+        # half a slow sample spent its OCR on.
+        _reader.detect = timing.timed("ocr.detect", _reader.detect)
+        _reader.recognize = timing.timed("ocr.recognize", _reader.recognize)
     return _reader
 
 
@@ -39,27 +57,81 @@ def to_gray(img):
     return np.clip(gray, 0, 1)
 
 
+# The contrast percentiles, as `np.percentile` turns [5, 95] into quantiles.
+_CONTRAST_QUANTILES = np.true_divide([5, 95], 100)
+
+
+def _order_statistics(values, ranks):
+    """The values at ascending sorted positions `ranks`, reordering `values`.
+
+    Each rank is selected from what lies above the one before it, so the
+    image is partitioned once around the lower percentile and the remainder
+    once around the upper; the rank just above a selected one is the minimum
+    of the rest. `np.partition` with several ranks at once is much slower.
+    """
+    found, start = [], 0
+    for rank in ranks:
+        rest = values[start:]
+        if rank == start:
+            found.append(rest.min())
+            continue
+        rest.partition(rank - start)
+        found.append(rest[rank - start])
+        start = rank + 1
+    return np.array(found, dtype=values.dtype)
+
+
+def _contrast_percentiles(gray):
+    """``np.percentile(gray, [5, 95])``, to the bit, by selection alone.
+
+    The default linear method needs only the two values either side of each
+    percentile's fractional rank; they are selected in linear time and then
+    interpolated exactly as numpy interpolates them.
+    """
+    values = gray.flatten()
+    n = values.size
+    virtual = (n - 1) * _CONTRAST_QUANTILES
+    lower = np.floor(virtual)
+    upper = lower + 1
+    # A rank at or past the last one takes the largest value, as numpy does.
+    top = virtual >= n - 1
+    lower[top] = upper[top] = -1
+    gamma = virtual - lower
+    lower, upper = (np.where(r < 0, n - 1, r).astype(np.intp) for r in (lower, upper))
+    ranks = np.unique(np.concatenate((lower, upper)))
+    stats = dict(zip(ranks.tolist(), _order_statistics(values, ranks)))
+    below = np.array([stats[r] for r in lower.tolist()], dtype=values.dtype)
+    above = np.array([stats[r] for r in upper.tolist()], dtype=values.dtype)
+    # numpy's `_lerp`: interpolate from the nearer end.
+    diff = above - below
+    result = np.add(below, diff * gamma)
+    np.subtract(above, diff * (1 - gamma), out=result, where=gamma >= 0.5,
+                casting="unsafe", dtype=result.dtype)
+    return result
+
+
 def contrast_ratio(img):
     """
     Approximate WCAG contrast ratio using 5-95 percentile luminance.
     """
-    gray = to_gray(img)
-    min_l, max_l = np.percentile(gray, [5, 95])
+    gray = as_features(img).luma
+    min_l, max_l = _contrast_percentiles(gray)
     return (max_l + 0.05) / (min_l + 0.05)
 
 
 def ocr_text_easyocr(img, conf_thresh=0.5):
     """Extract visible text using EasyOCR."""
     reader = _get_reader()
-    img_u8 = np.clip((img * 255).astype(np.uint8), 0, 255)
-    results = reader.readtext(img_u8)
+    img_u8 = as_features(img).u8
+    with timing.stage("ocr"):
+        results = reader.readtext(img_u8)
     words = [t for (_, t, conf) in results if conf >= conf_thresh and t.strip()]
     return " ".join(words), results
 
 
 def local_contrast_from_text_regions(img, ocr_results, min_area=20):
     """Average contrast ratio within OCR-detected text regions."""
-    gray = to_gray(img)
+    gray = as_features(img).luma
     H, W = gray.shape
     contrasts = []
 
@@ -76,7 +148,7 @@ def local_contrast_from_text_regions(img, ocr_results, min_area=20):
         patch = gray[y_min:y_max, x_min:x_max]
         if patch.size < 10:
             continue
-        min_l, max_l = np.percentile(patch, [5, 95])
+        min_l, max_l = _contrast_percentiles(patch)
         contrasts.append((max_l + 0.05) / (min_l + 0.05))
 
     if len(contrasts) == 0:
@@ -84,26 +156,38 @@ def local_contrast_from_text_regions(img, ocr_results, min_area=20):
     return float(np.mean(contrasts))
 
 
-def compute_legibility(gt, gen, return_ocr=False):
-    """
-    Compute legibility metrics between GT and generated widget.
+def legibility_summary(img):
+    """Everything `compare_legibility` needs from one image.
 
-    Returns dict with: TextJaccard, ContrastDiff, ContrastLocalDiff.
-    If ``return_ocr=True``, returns (metrics_dict, ocr_gt, ocr_gen) where each
-    ocr list is the raw EasyOCR ``readtext`` output (bbox, text, confidence).
+    OCR runs on each image separately and the two sides only meet as word sets
+    and contrast values, so the ground truth's half is a record of its own -
+    the one `metadata.json` carries under `eval.legibility`. ``ocr`` is the raw
+    ``readtext`` output, kept for callers that visualise it.
     """
-    txt_gt, results_gt = ocr_text_easyocr(gt)
-    txt_gen, results_gen = ocr_text_easyocr(gen)
+    features = as_features(img)
+    text, results = features.ocr
+    return {
+        "text": text,
+        "contrast": np.nan_to_num(contrast_ratio(features)),
+        "contrast_local": local_contrast_from_text_regions(features, results),
+        "ocr": results,
+    }
+
 
-    s_gt, s_gen = set(txt_gt.split()), set(txt_gen.split())
+def compare_legibility(summary_gt, summary_gen):
+    """Legibility metrics from two `legibility_summary` records."""
+    s_gt, s_gen = set(summary_gt["text"].split()), set(summary_gen["text"].split())
     jaccard = len(s_gt & s_gen) / (len(s_gt | s_gen) + 1e-6)
 
-    contrast_gt = np.nan_to_num(contrast_ratio(gt))
-    contrast_gen = np.nan_to_num(contrast_ratio(gen))
+    # A stored value comes back from JSON as a Python float. Give it the dtype
+    # the live side carries, so the difference is taken in the precision it
+    # would have had if both sides had been computed here.
+    contrast_gen = summary_gen["contrast"]
+    contrast_gt = np.asarray(contrast_gen).dtype.type(summary_gt["contrast"])
     contrast_diff = float(np.clip(abs(contrast_gt - contrast_gen), 0, 5))
 
-    contrast_local_gt = local_contrast_from_text_regions(gt, results_gt)
-    contrast_local_gen = local_contrast_from_text_regions(gen, results_gen)
+    contrast_local_gt = summary_gt["contrast_local"]
+    contrast_local_gen = summary_gen["contrast_local"]
 
     MAX_DIFF = 5.0
     if contrast_local_gt is not None and contrast_local_gen is not None:
@@ -115,11 +199,28 @@ def compute_legibility(gt, gen, return_ocr=False):
 
     contrast_local_diff = float(np.clip(contrast_local_diff, 0, MAX_DIFF))
 
-    metrics = {
+    return {
         "TextJaccard": float(jaccard),
         "ContrastDiff": contrast_diff,
         "ContrastLocalDiff": contrast_local_diff,
     }
+
+
+def compute_legibility(gt, gen, return_ocr=False, gt_summary=None):
+    """
+    Compute legibility metrics between GT and generated widget.
+
+    Returns dict with: TextJaccard, ContrastDiff, ContrastLocalDiff.
+    If ``return_ocr=True``, returns (metrics_dict, ocr_gt, ocr_gen) where each
+    ocr list is the raw EasyOCR ``readtext`` output (bbox, text, confidence).
+    ``gt_summary`` is the GT's `legibility_summary`, when it is already known
+    (read from `metadata.json`); only the generated side is then OCR'd.
+    """
+    if gt_summary is None:
+        gt_summary = legibility_summary(gt)
+    gen_summary = legibility_summary(gen)
+
+    metrics = compare_legibility(gt_summary, gen_summary)
     if return_ocr:
-        return metrics, results_gt, results_gen
+        return metrics, gt_summary["ocr"], gen_summary["ocr"]
     return metrics
@@ -1,16 +1,32 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
 import numpy as np
 import torch
 from lpips import LPIPS
-from skimage.metrics import structural_similarity as ssim
+from scipy.ndimage import uniform_filter
+
+from . import timing
+from .features import as_features
 
 _device = torch.device("cpu")
 _lpips_vgg = None
+_batcher = None
+_remote = None
 
 
 def set_device(use_cuda=False):
-    """Set device for LPIPS computation. Call before running evaluation."""
+    """Set device for LPIPS computation. Call before running evaluation.
+
+    A process whose LPIPS is served by another one (`set_lpips_server`) loads
+    nothing here.
+    """
     global _device, _lpips_vgg
 
+    if _remote is not None:
+        return
     requested = torch.device("cuda" if use_cuda and torch.cuda.is_available() else "cpu")
     if _lpips_vgg is not None and _device == requested:
         return
@@ -26,12 +42,106 @@ def _ensure_model():
 
 
 def compute_ssim(gt, gen):
-    """Compute the canonical bench SSIM without loading the LPIPS model."""
-    return float(ssim(gt, gen, channel_axis=2, data_range=1.0))
+    """Compute the canonical bench SSIM without loading the LPIPS model.
+
+    This is skimage's ``structural_similarity(gt, gen, channel_axis=2,
+    data_range=1.0)``, one colour channel at a time as skimage does it, with
+    the same operations in the same order - so the same float64 result - but
+    with its intermediates computed in place. skimage holds both float64
+    images plus some fourteen channel-sized arrays at once, which made SSIM
+    the largest allocation of a pair; here each channel is taken from the
+    8-bit pixels when it is needed and at most eight channel-sized arrays are
+    alive.
+    """
+    with timing.stage("ssim"):
+        gt, gen = as_features(gt), as_features(gen)
+        if gt.shape != gen.shape:
+            raise ValueError("Input images must have the same dimensions.")
+        if min(gt.shape[:2]) < _SSIM_WIN:
+            raise ValueError("win_size exceeds image extent.")
+        mssim = np.array([_ssim_channel(_channel(gt, c), _channel(gen, c))
+                          for c in range(gt.shape[2])])
+        return float(mssim.mean())
+
+
+_SSIM_WIN = 7                              # skimage's default uniform window
+_SSIM_C1 = (0.01 * 1.0) ** 2               # (K1 * data_range) ** 2
+_SSIM_C2 = (0.03 * 1.0) ** 2               # (K2 * data_range) ** 2
+
+
+def _channel(img, c):
+    """Channel `c` of an `ImageFeatures` as float64 in [0, 1]."""
+    if img.pixels.dtype == np.uint8:
+        return img.pixels[..., c] / 255.0
+    return img.pixels[..., c].astype(np.float64, copy=False)
+
+
+def _ssim_channel(x, y):
+    """skimage's single-channel SSIM, operation for operation, reusing buffers.
+
+    The comments give skimage's expression each step completes. Elementwise
+    IEEE arithmetic does not care whether its result lands in a new array or
+    an old one, and ``a * 2`` is ``2 * a`` exactly.
+    """
+    cov_norm = _SSIM_WIN ** 2 / (_SSIM_WIN ** 2 - 1)       # sample covariance
+    ux = uniform_filter(x, size=_SSIM_WIN)
+    uy = uniform_filter(y, size=_SSIM_WIN)
+
+    vx = uniform_filter(x * x, size=_SSIM_WIN)
+    vx -= ux * ux
+    vx *= cov_norm                                      # vx = cov_norm * (uxx - ux * ux)
+    vy = uniform_filter(y * y, size=_SSIM_WIN)
+    vy -= uy * uy
+    vy *= cov_norm                                      # vy = cov_norm * (uyy - uy * uy)
+    vxy = uniform_filter(x * y, size=_SSIM_WIN)
+    del x, y
+    vxy -= ux * uy
+    vxy *= cov_norm                                     # vxy = cov_norm * (uxy - ux * uy)
+
+    a1 = ux * 2
+    a1 *= uy
+    a1 += _SSIM_C1                                      # A1 = 2 * ux * uy + C1
+    a2 = vxy
+    a2 *= 2
+    a2 += _SSIM_C2                                      # A2 = 2 * vxy + C2
+    b1 = ux
+    np.square(b1, out=b1)
+    np.square(uy, out=uy)
+    b1 += uy
+    del uy
+    b1 += _SSIM_C1                                      # B1 = ux ** 2 + uy ** 2 + C1
+    b2 = vx
+    b2 += vy
+    del vy
+    b2 += _SSIM_C2                                      # B2 = vx + vy + C2
+
+    d = b1
+    d *= b2                                             # D = B1 * B2
+    del b2
+    s = a1
+    s *= a2
+    s /= d                                              # S = (A1 * A2) / D
+    pad = (_SSIM_WIN - 1) // 2
+    return s[pad:-pad, pad:-pad].mean(dtype=np.float64)
 
 
 def compute_lpips(gt, gen):
     """Compute LPIPS-VGG without also computing SSIM."""
+    with timing.stage("lpips"):
+        return _lpips_distance(_lpips_input(gt), _lpips_input(gen))
+
+
+def _lpips_input(img):
+    """The network runs in float32, so the image is handed over in its float32
+    form directly rather than as a float64 array that is cast straight away.
+    Raw 8-bit pixels are scaled to [0, 1] on the way, as for SSIM."""
+    return as_features(img).rgb32
+
+
+def _lpips_distance(gt, gen):
+    server = _remote or _batcher
+    if server is not None:
+        return server.distance(gt, gen)
     _ensure_model()
     gt_t = torch.tensor(gt).permute(2, 0, 1).unsqueeze(0).float().to(_device)
     gen_t = torch.tensor(gen).permute(2, 0, 1).unsqueeze(0).float().to(_device)
@@ -39,6 +149,120 @@ def compute_lpips(gt, gen):
         return float(_lpips_vgg(gt_t, gen_t).item())
 
 
+def compute_lpips_batch(pairs):
+    """LPIPS-VGG for several same-shaped (gt, gen) pairs in one forward pass.
+
+    The tensors are built exactly as `compute_lpips` builds them, one sample
+    per row, so each distance is the one a batch of one gives - provided the
+    convolutions themselves do not change with the batch size, which is a
+    property of the numeric stack. docker/selfcheck.py proves it per image.
+    """
+    _ensure_model()
+    gt_t = torch.tensor(np.stack([gt for gt, _ in pairs])).permute(0, 3, 1, 2).float().to(_device)
+    gen_t = torch.tensor(np.stack([gen for _, gen in pairs])).permute(0, 3, 1, 2).float().to(_device)
+    with torch.no_grad():
+        return [float(d) for d in _lpips_vgg(gt_t, gen_t).flatten().tolist()]
+
+
+class LpipsBatcher:
+    """One thread owns the LPIPS model and batches everyone else's pairs.
+
+    Worker threads each calling the VGG trunk on one pair give the GPU a stream
+    of small, serialised kernels. Here a caller enqueues its pair and waits;
+    the owner collects whatever arrives within `linger_s` of the first request,
+    groups it by shape - padding would change the spatial average, so only
+    same-shaped pairs share a batch - and answers each caller with its own
+    distance. `max_pixels` bounds one batch's input, because a large widget's
+    VGG activations are already most of a card.
+    """
+
+    def __init__(self, max_batch=8, linger_s=0.005, max_pixels=8_000_000):
+        self.max_batch = max_batch
+        self.linger_s = linger_s
+        self.max_pixels = max_pixels
+        self.batches = 0
+        self.pairs = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._serve, name="lpips-batcher", daemon=True)
+        self._thread.start()
+
+    def distance(self, gt, gen):
+        future = Future()
+        self._queue.put((gt, gen, future))
+        return future.result()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        pending = [first]
+        deadline = time.monotonic() + self.linger_s
+        while len(pending) < self.max_batch * 4:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)         # serve what we hold, then stop
+                break
+            pending.append(item)
+        return pending
+
+    def _chunks(self, pending):
+        by_shape = {}
+        for item in pending:
+            by_shape.setdefault(item[0].shape, []).append(item)
+        for shape, items in by_shape.items():
+            per_batch = max(1, min(self.max_batch, self.max_pixels // max(1, shape[0] * shape[1])))
+            for i in range(0, len(items), per_batch):
+                yield items[i:i + per_batch]
+
+    def _serve(self):
+        while True:
+            pending = self._collect()
+            if pending is None:
+                return
+            for chunk in self._chunks(pending):
+                try:
+                    distances = compute_lpips_batch([(gt, gen) for gt, gen, _ in chunk])
+                except BaseException as exc:
+                    for _, _, future in chunk:
+                        future.set_exception(exc)
+                    continue
+                self.batches += 1
+                self.pairs += len(chunk)
+                for (_, _, future), value in zip(chunk, distances):
+                    future.set_result(value)
+
+
+def set_lpips_batching(max_batch=1, linger_ms=5.0):
+    """Route `compute_lpips` through one batching thread; 1 turns it off.
+
+    Only useful when several threads of one process evaluate at once - a
+    process that evaluates one pair at a time has nothing to batch.
+    """
+    global _batcher
+    if _batcher is not None:
+        _batcher.close()
+        _batcher = None
+    if max_batch > 1:
+        _batcher = LpipsBatcher(max_batch=max_batch, linger_s=linger_ms / 1000.0)
+
+
+def set_lpips_server(server):
+    """Answer `compute_lpips` with ``server.distance(gt, gen)``; None undoes it.
+
+    For a process that shares one model with others - the daemon's workers and
+    its model host - instead of loading its own.
+    """
+    global _remote
+    _remote = server
+
+
 def compute_perceptual(gt, gen):
     """Compute both canonical perceptual metrics."""
 
@@ -0,0 +1,74 @@
+"""Opt-in, per-stage wall and CPU time for one evaluation.
+
+Metric code marks its expensive steps with `stage`:
+
+    with timing.stage("resize"):
+        gen = resize_to_match(gt, pred)
+
+which costs a context-variable lookup unless the caller opened a `collect()`
+around the evaluation. Inside one, every stage adds its wall time
+(`perf_counter`) and the CPU time of the thread that ran it (`thread_time`) to
+the collector under its name; a stage entered twice - decode runs once per
+image - accumulates, and counts its calls. Stages nest, and each is charged
+its own full time, so ``layout`` includes ``layout.mask``.
+
+CPU time is this thread's. Work a stage hands to another thread or process -
+the LPIPS batcher, a model host - shows up as wall time only, and the gap
+between the two is the time spent waiting for it.
+
+Aggregating records - percentiles for run.json, the daemon's rolling window -
+is `widget2code_bench.timings`.
+"""
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+_current: ContextVar[dict | None] = ContextVar("widget_quality_timing", default=None)
+
+
+@contextmanager
+def stage(name: str):
+    stages = _current.get()
+    if stages is None:
+        yield
+        return
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        entry = stages.setdefault(name, [0.0, 0.0, 0])
+        entry[0] += time.perf_counter() - wall
+        entry[1] += time.thread_time() - cpu
+        entry[2] += 1
+
+
+def timed(name: str, fn):
+    """`fn`, run inside ``stage(name)``."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with stage(name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def collect():
+    """Record the stages run inside this block; yields the record.
+
+    The record is a dict, ``name -> {"wall_ms", "cpu_ms", "calls"}``, filled in
+    when the block exits.
+    """
+    stages: dict = {}
+    record: dict = {}
+    token = _current.set(stages)
+    try:
+        yield record
+    finally:
+        _current.reset(token)
+        for name, (wall, cpu, calls) in stages.items():
+            record[name] = {"wall_ms": round(1000 * wall, 3),
+                            "cpu_ms": round(1000 * cpu, 3), "calls": calls}
+
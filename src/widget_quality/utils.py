@@ -1,29 +1,51 @@
+import io
+
 import cv2
 import numpy as np
 from PIL import Image
 from skimage.color import rgb2lab
 
+from . import timing
+from .features import PRECISIONS, ImageFeatures, as_array, as_features
+
+
+def load_pixels(source):
+    """Load image as its 8-bit RGB pixels, an (H, W, 3) uint8 array.
+
+    `source` is a path, the encoded file's bytes (or any buffer), or an 8-bit
+    array as PIL would decode it. All three give the same array for the same
+    image, so a caller holding the bytes need not write them to disk first.
+    """
+    with timing.stage("decode"):
+        if isinstance(source, np.ndarray):
+            if source.dtype != np.uint8:
+                raise ValueError(f"image array must be uint8, got {source.dtype}")
+            img = Image.fromarray(source).convert("RGB")
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            img = Image.open(io.BytesIO(source)).convert("RGB")
+        else:
+            img = Image.open(source).convert("RGB")
+        return np.asarray(img)
+
 
-def load_image(path):
-    """Load image as normalized RGB float array [0, 1]."""
-    img = Image.open(path).convert("RGB")
-    return np.asarray(img) / 255.0
+def load_image(source):
+    """Load image as normalized RGB float array [0, 1]; see `load_pixels`."""
+    return load_pixels(source) / 255.0
 
 
 def to_gray(img):
-    return cv2.cvtColor((img * 255).astype(np.uint8), cv2.COLOR_RGB2GRAY)
+    return as_features(img).gray_u8
 
 
 def lab_color_diff(img1, img2):
     """Mean and 95-percentile ΔE (CIE76)."""
-    lab1, lab2 = rgb2lab(img1), rgb2lab(img2)
+    lab1, lab2 = rgb2lab(as_array(img1)), rgb2lab(as_array(img2))
     diff = np.sqrt(np.sum((lab1 - lab2) ** 2, axis=-1))
     return float(np.mean(diff)), float(np.percentile(diff, 95))
 
 
 def edge_map(img):
-    gray = to_gray(img)
-    return cv2.Canny(gray, 100, 200)
+    return as_features(img).edges
 
 
 def margin_from_mask(mask):
@@ -38,10 +60,37 @@ def margin_from_mask(mask):
 def resize_to_match(gt, gen):
     """Resize generated image to GT size."""
     h_gt, w_gt = gt.shape[:2]
-    gen_resized = cv2.resize(gen, (w_gt, h_gt), interpolation=cv2.INTER_AREA)
+    with timing.stage("resize"):
+        gen_resized = cv2.resize(as_array(gen), (w_gt, h_gt), interpolation=cv2.INTER_AREA)
     return gen_resized
 
 
+def resize_prediction(gt, pred, precision="compact"):
+    """`pred` on the ground truth's pixel grid, as an `ImageFeatures`.
+
+    `pred` is 8-bit pixels, a float array or an `ImageFeatures`. 8-bit pixels
+    are resized as they are under "compact" and as `load_image`'s float64 array
+    under "float64" (see `features.PRECISIONS`); a prediction already the
+    ground truth's size comes back unchanged either way, since OpenCV copies
+    rather than resamples it.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"precision must be one of {', '.join(PRECISIONS)}, not {precision!r}")
+    pixels = pred.pixels if isinstance(pred, ImageFeatures) else pred
+    if precision == "float64" and pixels.dtype == np.uint8:
+        pixels = pixels / 255.0
+    h_gt, w_gt = gt.shape[:2]
+    with timing.stage("resize"):
+        return ImageFeatures(cv2.resize(pixels, (w_gt, h_gt), interpolation=cv2.INTER_AREA))
+
+
+def touches_frame(stats, shape):
+    """Which rows of a `cv2.connectedComponentsWithStats` stats array touch the frame."""
+    H, W = shape
+    x, y, w, h = stats[:, 0], stats[:, 1], stats[:, 2], stats[:, 3]
+    return (x == 0) | (y == 0) | (x + w == W) | (y + h == H)
+
+
 def remove_border_touching_components(mask):
     """
     mask: binary mask, 0/255 or 0/1
@@ -61,10 +110,7 @@ def remove_border_touching_components(mask):
     mask = (mask > 0).astype(np.uint8)
 
     num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
-
-    H, W = mask.shape
-    x, y, w, h = stats[:, 0], stats[:, 1], stats[:, 2], stats[:, 3]
-    touches_border = (x == 0) | (y == 0) | (x + w == W) | (y + h == H)
+    touches_border = touches_frame(stats, mask.shape)
 
     lut = np.zeros(num_labels, dtype=np.uint8)
     if num_labels > 1:  # label 0 is the background and always stays 0
@@ -0,0 +1,150 @@
+"""Ground truths named by sha256 or sample id instead of sent with every request."""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from widget2code_bench import bench_ipc as ipc
+from widget2code_bench.bench_client import BenchClient, BenchEvaluationError
+from widget2code_bench.bench_daemon import BenchDaemon
+from widget2code_bench.gt_registry import GroundTruthRegistry
+from widget2code_bench.single import GroundTruth, GroundTruthCache, evaluate_single
+from widget_quality.utils import load_image
+
+METRICS = "ssim,geometry,layout,style,contrast"
+
+
+def _image(path, shift=0):
+    image = Image.new("RGB", (96, 64), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((12 + shift, 10, 82, 52), fill=(30, 60, 90))
+    draw.ellipse((30, 20 + shift, 55, 45), fill=(230, 100, 60))
+    image.save(path)
+    return path
+
+
+def test_a_resident_ground_truth_scores_like_its_image(tmp_path):
+    gt = _image(tmp_path / "gt.png")
+    pred = _image(tmp_path / "pred.png", shift=6)
+    resident = GroundTruth(load_image(gt))
+    expected = evaluate_single(gt, pred, metrics=METRICS)
+    assert evaluate_single(resident, pred, metrics=METRICS) == expected
+    assert {"layout", "style", "contrast"} <= set(resident.summaries)
+    assert evaluate_single(resident, pred, metrics=METRICS) == expected
+
+
+def test_ground_truth_cache_is_bounded_by_decoded_size():
+    img = np.zeros((8, 8, 3))
+    cache = GroundTruthCache(max_bytes=2 * img.nbytes)
+    for sha in "abc":
+        cache.put(sha, GroundTruth(img))
+    assert cache.get("a") is None and cache.get("c") is not None
+
+
+def test_registry_resolves_sent_and_preloaded_ground_truths(tmp_path):
+    (tmp_path / "image_0007").mkdir()
+    gt = _image(tmp_path / "image_0007" / "image.png")
+    registry = GroundTruthRegistry(max_bytes=1)
+    assert registry.preload(tmp_path) == 1
+    sha, data, path = registry.resolve(sample_id="0007")
+    assert data == gt.read_bytes() and path == gt
+    assert registry.resolve(sample_id="image_0007")[0] == sha
+    registry.add("f" * 64, b"other")
+    assert registry.locate(sample_id="0007") == (sha, None, gt)
+    with pytest.raises(ipc.UnknownGroundTruth):
+        registry.resolve(sha256="e" * 64)
+    with pytest.raises(ipc.UnknownGroundTruth):
+        registry.resolve(sample_id="9999")
+
+
+def test_client_names_a_ground_truth_it_already_sent(tmp_path):
+    (tmp_path / "gt" / "image_0001").mkdir(parents=True)
+    gt = _image(tmp_path / "gt" / "image_0001" / "image.png")
+    pred = _image(tmp_path / "pred.png", shift=6)
+    runtime = tmp_path / "run"
+    runtime.mkdir()
+    calls = []
+
+    class Recording(GroundTruthRegistry):
+        def add(self, sha256, data):
+            calls.append("bytes")
+            super().add(sha256, data)
+
+        def locate(self, **handle):
+            calls.append(next(iter(handle)))
+            return super().locate(**handle)
+
+    registry = Recording()
+    registry.preload(tmp_path / "gt")
+    daemon = BenchDaemon(runtime_dir=runtime, workers=1, use_cuda=False,
+                         ground_truths=registry)
+
+    async def scenario():
+        daemon._pool = ThreadPoolExecutor(1)
+        server = await asyncio.start_unix_server(daemon._handle,
+                                                 path=str(ipc.socket_path(runtime)))
+        async with server:
+            client = BenchClient(runtime)
+            results = [await client.evaluate(gt, pred, metrics="ssim") for _ in range(2)]
+            daemon.ground_truths = Recording()
+            results.append(await client.evaluate(gt, pred, metrics="ssim"))
+            daemon.ground_truths = registry
+            results.append(await client.evaluate_gt_id("0001", pred.read_bytes(),
+                                                       metrics="ssim"))
+            with pytest.raises(BenchEvaluationError, match="UnknownGroundTruth"):
+                await client.evaluate_gt_id("0002", pred.read_bytes(), metrics="ssim")
+            return results
+
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        daemon._pool.shutdown()
+    assert all(r == results[0] for r in results)
+    # sent, named, named after a restart (unknown) and so sent again, then by id
+    assert calls == ["bytes", "sha256", "sha256", "bytes", "sample_id", "sample_id"]
+
+
+def test_a_worker_keeps_ground_truths_between_requests(tmp_path, monkeypatch):
+    from widget2code_bench import bench_daemon
+
+    gt = _image(tmp_path / "gt.png")
+    pred = _image(tmp_path / "pred.png", shift=6)
+    monkeypatch.setattr(bench_daemon, "_ground_truths", None)
+    bench_daemon._init_worker(None, False, 1 << 26)
+    payload = (gt.read_bytes(), pred.read_bytes())
+    expected = evaluate_single(gt, pred, metrics=METRICS)
+    for _ in range(2):
+        assert bench_daemon._evaluate_in_worker(payload, METRICS, False, "a" * 64) == expected
+    assert "layout" in bench_daemon._ground_truths.get("a" * 64).summaries
+
+
+@pytest.mark.parametrize("protocol", [ipc.V1, ipc.PROTOCOL_VERSION])
+def test_evaluate_many_answers_each_prediction_in_order(tmp_path, protocol):
+    gt = _image(tmp_path / "gt.png")
+    preds = [_image(tmp_path / f"pred{i}.png", shift=3 * i) for i in range(3)]
+    runtime = tmp_path / "run"
+    runtime.mkdir()
+    daemon = BenchDaemon(runtime_dir=runtime, workers=2, use_cuda=False)
+
+    async def scenario():
+        daemon._pool = ThreadPoolExecutor(2)
+        server = await asyncio.start_unix_server(daemon._handle,
+                                                 path=str(ipc.socket_path(runtime)))
+        async with server:
+            client = BenchClient(runtime, protocol=protocol)
+            payloads = [p.read_bytes() for p in preds]
+            first = await client.evaluate_many(gt.read_bytes(), payloads[:1] + [b"not a png"]
+                                               + payloads[1:], metrics=METRICS)
+            again = await client.evaluate_many(gt.read_bytes(), payloads, metrics=METRICS)
+            return first, again
+
+    try:
+        first, again = asyncio.run(scenario())
+    finally:
+        daemon._pool.shutdown()
+    expected = [evaluate_single(gt, p, metrics=METRICS) for p in preds]
+    assert isinstance(first[1], BenchEvaluationError)
+    assert first[:1] + first[2:] == expected
+    assert again == expected
@@ -0,0 +1,295 @@
+"""A GT half read from metadata.json must score exactly like one computed here.
+
+Batch evaluation reads the ground truth's OCR, edge-mask statistics and
+histograms from `metadata.json` instead of recomputing them, so each metric
+module is split into a per-image summary and a comparison. Two things have to
+hold for that to be invisible: the split functions agree with the 0.2.9 pair
+functions bit for bit, and a summary that has been through JSON compares
+exactly like the live one. The 0.2.9 forms are kept here as the reference.
+"""
+import json
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+from scipy.stats import wasserstein_distance
+from skimage.color import rgb2gray, rgb2hsv
+
+from widget_quality import legibility
+from widget_quality.features import ImageFeatures
+from widget_quality.layout import compute_layout, layout_summary
+from widget_quality.legibility import compute_legibility, legibility_summary
+from widget_quality.style import (_emd, compute_palette_distance, compute_style,
+                                  compute_vibrancy_consistency, style_summary)
+from widget_quality.utils import edge_map, margin_from_mask, remove_border_touching_components
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "tools"))
+from build_metadata import gt_fill, gt_legibility  # noqa: E402
+
+
+def reference_layout(gt, gen):
+    """0.2.9 compute_layout, verbatim apart from inlining its helpers."""
+    kernel = np.ones((3, 3), np.uint8)
+    mask_gt = remove_border_touching_components(cv2.dilate(edge_map(gt), kernel))
+    mask_gen = remove_border_touching_components(cv2.dilate(edge_map(gen), kernel))
+
+    diffs = np.abs(np.array(margin_from_mask(mask_gt)) - np.array(margin_from_mask(mask_gen)))
+    mean = np.mean(diffs)
+    margin_asym = 0.0 if mean < 1e-6 else float(np.std(diffs) / mean)
+
+    def bbox_ar(mask):
+        ys, xs = np.where(mask > 0)
+        h = ys.max() - ys.min() + 1
+        w = xs.max() - xs.min() + 1
+        return w / h if h > 0 else 1.0
+
+    if np.sum(mask_gt) == 0 or np.sum(mask_gen) == 0:
+        aspect_diff = 5.0
+    else:
+        aspect_diff = float(abs(np.log(bbox_ar(mask_gt) / bbox_ar(mask_gen))))
+
+    def areas(mask):
+        _, _, stats, _ = cv2.connectedComponentsWithStats(
+            (mask > 0).astype(np.uint8), connectivity=8)
+        return np.array([w * h for x, y, w, h, area in stats[1:] if area > 10])
+
+    a_gt, a_gen = areas(mask_gt), areas(mask_gen)
+    if len(a_gt) > 0 and len(a_gen) > 0:
+        area_diff = abs((a_gen.mean() / a_gen.sum()) - (a_gt.mean() / a_gt.sum()))
+    else:
+        area_diff = 5.0
+    return {"MarginAsymmetry": float(margin_asym), "ContentAspectDiff": float(aspect_diff),
+            "AreaRatioDiff": float(area_diff)}
+
+
+def reference_style(gt, gen):
+    """0.2.9 compute_style, verbatim apart from inlining its helpers."""
+    def emd(channel, bins, scale):
+        hsv_gt, hsv_gen = rgb2hsv(gt), rgb2hsv(gen)
+        h_gt, _ = np.histogram(hsv_gt[..., channel].ravel(), bins=bins, range=(0, 1), density=True)
+        h_gen, _ = np.histogram(hsv_gen[..., channel].ravel(), bins=bins, range=(0, 1), density=True)
+        d = wasserstein_distance(np.arange(bins), np.arange(bins),
+                                 h_gt / (h_gt.sum() + 1e-6), h_gen / (h_gen.sum() + 1e-6))
+        return np.clip(float(np.exp(-d / (bins * scale))), 0, 1)
+
+    def stats(L):
+        flat = np.sort(L.ravel())
+        k = max(1, int(0.1 * flat.size))
+        bg, dark, bright = np.median(flat), np.mean(flat[:k]), np.mean(flat[-k:])
+        fg = dark if abs(bg - dark) >= abs(bg - bright) else bright
+        return np.sign(bg - fg), abs(bg - fg)
+
+    (p_gt, s_gt), (p_gen, s_gen) = stats(rgb2gray(gt)), stats(rgb2gray(gen))
+    if s_gt < 1e-6 or s_gen < 1e-6:
+        polarity = 0.0
+    else:
+        polarity = float(np.clip((1.0 if p_gt == p_gen else 0.0)
+                                 * np.exp(-abs(s_gt - s_gen) * 5), 0, 1))
+    return {"PaletteDistance": emd(0, 36, 0.08), "Vibrancy": emd(1, 30, 0.05),
+            "PolarityConsistency": polarity}
+
+
+class FakeReader:
+    """Deterministic stand-in for EasyOCR: boxes and words follow the pixels."""
+
+    def readtext(self, img_u8):
+        h, w = img_u8.shape[:2]
+        level = int(img_u8.mean())
+        return [
+            ([[2, 2], [w // 2, 2], [w // 2, h // 2], [2, h // 2]], f"w{level % 7}", 0.9),
+            ([[w // 3, h // 3], [w - 3, h // 3], [w - 3, h - 3], [w // 3, h - 3]], "label", 0.8),
+            ([[0, 0], [4, 0], [4, 4], [0, 4]], "noise", 0.2),
+        ]
+
+
+@pytest.fixture
+def fake_ocr(monkeypatch):
+    monkeypatch.setattr(legibility, "_reader", FakeReader())
+
+
+def _widget(seed, h=72, w=96):
+    rng = np.random.default_rng(seed)
+    img = np.full((h, w, 3), rng.integers(0, 256, 3), np.uint8)
+    for _ in range(4):
+        x0, y0 = rng.integers(4, w // 2), rng.integers(4, h // 2)
+        x1, y1 = rng.integers(x0 + 4, w - 4), rng.integers(y0 + 4, h - 4)
+        cv2.rectangle(img, (int(x0), int(y0)), (int(x1), int(y1)),
+                      tuple(int(c) for c in rng.integers(0, 256, 3)), -1)
+    return img / 255.0
+
+
+def _through_json(record):
+    return json.loads(json.dumps(record))
+
+
+PAIRS = [(_widget(2 * i), _widget(2 * i + 1)) for i in range(8)]
+PAIRS.append((np.ones((40, 60, 3)), np.zeros((40, 60, 3))))
+
+
+@pytest.mark.parametrize("i", range(len(PAIRS)))
+def test_layout_matches_0_2_9_with_and_without_a_stored_gt(i):
+    gt, gen = PAIRS[i]
+    want = reference_layout(gt, gen)
+    assert compute_layout(gt, gen) == want
+    assert compute_layout(gt, gen, gt_summary=_through_json(layout_summary(gt))) == want
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_the_layout_summary_read_off_one_labelling_is_the_content_masks(seed):
+    rng = np.random.default_rng(seed)
+    # Scattered blobs: many components, some cut by the frame, some under 10 px.
+    img = np.zeros((90 + seed, 130, 3), np.uint8)
+    for _ in range(12 * seed):
+        x, y = int(rng.integers(-5, 130)), int(rng.integers(-5, 90))
+        cv2.circle(img, (x, y), int(rng.integers(1, 9)), (255, 255, 255), -1)
+    mask = remove_border_touching_components(cv2.dilate(edge_map(img / 255.0), np.ones((3, 3))))
+    areas = np.array([w * h for x, y, w, h, area in
+                      cv2.connectedComponentsWithStats(mask, connectivity=8)[2][1:] if area > 10])
+    empty = bool(np.sum(mask) == 0)
+    if not empty:
+        ys, xs = np.where(mask > 0)
+        bbox_ar = float((xs.max() - xs.min() + 1) / (ys.max() - ys.min() + 1))
+    assert _through_json(layout_summary(ImageFeatures(img))) == {
+        "margin": [int(v) for v in margin_from_mask(mask)],
+        "mask_empty": empty,
+        "bbox_ar": None if empty else bbox_ar,
+        "area_ratio": float(areas.mean() / areas.sum()) if len(areas) else None,
+        "n_comp": len(areas),
+    }
+
+
+@pytest.mark.parametrize("i", range(len(PAIRS)))
+def test_style_matches_0_2_9_with_and_without_a_stored_gt(i):
+    gt, gen = PAIRS[i]
+    want = reference_style(gt, gen)
+    assert compute_style(gt, gen) == want
+    assert compute_style(gt, gen, gt_summary=_through_json(style_summary(gt))) == want
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_one_banded_style_pass_is_rgb2hsv_histogram_and_sort_to_the_bit(seed):
+    rng = np.random.default_rng(seed)
+    # Noise over several bands, quantised on one side so channels tie for the maximum.
+    gt = rng.integers(0, 256, (300 + seed, 211, 3), np.uint8)
+    gen = rng.integers(0, 256, (300 + seed, 211, 3), np.uint8) // 51 * 51
+    want = reference_style(gt / 255.0, gen / 255.0)
+    assert compute_style(ImageFeatures(gt), ImageFeatures(gen)) == want
+    assert compute_style(gt / 255.0, gen / 255.0) == want
+
+    summary = style_summary(ImageFeatures(gen))
+    hsv = rgb2hsv(gen / 255.0)
+    for channel, key, bins in ((0, "hue_hist", 36), (1, "sat_hist", 30)):
+        hist, _ = np.histogram(hsv[..., channel].ravel(), bins=bins, range=(0, 1), density=True)
+        assert summary[key] == hist.tolist()
+
+
+def test_the_closed_form_emd_is_scipys():
+    rng = np.random.default_rng(0)
+    for bins in (1, 2, 30, 36):
+        for _ in range(20):
+            u = rng.random(bins) * (rng.random(bins) > 0.3)
+            u[rng.integers(bins)] = 0.5
+            v = rng.random(bins) + 1e-3
+            assert _emd(u, v) == wasserstein_distance(np.arange(bins), np.arange(bins), u, v)
+    # The histograms the metrics actually compare, normalised as they normalise them.
+    for gt, gen in PAIRS:
+        for key in ("hue_hist", "sat_hist"):
+            u, v = (np.asarray(style_summary(img)[key]) for img in (gt, gen))
+            u, v = u / (u.sum() + 1e-6), v / (v.sum() + 1e-6)
+            assert _emd(u, v) == wasserstein_distance(np.arange(len(u)), np.arange(len(u)), u, v)
+        want = reference_style(gt, gen)
+        assert compute_palette_distance(gt, gen) == want["PaletteDistance"]
+        assert compute_vibrancy_consistency(gt, gen) == want["Vibrancy"]
+    with pytest.raises(ValueError):
+        _emd(np.zeros(4), np.ones(4))
+
+
+@pytest.mark.parametrize("i", range(len(PAIRS)))
+def test_legibility_reads_the_stored_record_exactly(fake_ocr, i):
+    gt, gen = PAIRS[i]
+    want = compute_legibility(gt, gen)
+    stored = _through_json(gt_legibility(gt))
+    assert compute_legibility(gt, gen, gt_summary=stored) == want
+    assert legibility_summary(gt)["text"] == stored["text"]
+
+
+def test_the_stored_fills_hand_lpips_the_same_pixels_as_float_images(fake_ocr, monkeypatch):
+    from widget_quality import perceptual
+    from widget_quality.perceptual import compute_perceptual
+
+    seen = []
+
+    def stub_net(gt, gen):
+        # The network casts to float32; sum the float32 gap so any scaling shows.
+        gt, gen = np.asarray(gt, np.float32), np.asarray(gen, np.float32)
+        seen.append((float(gt.max()), float(gen.max())))
+        return float(np.abs(gt - gen).sum(dtype=np.float64))
+
+    monkeypatch.setattr(perceptual, "_lpips_distance", stub_net)
+    gt = PAIRS[0][0]
+    stored = gt_fill(ImageFeatures((gt * 255).round().astype(np.uint8)))
+    for name, fill in (("black", np.zeros_like(gt)), ("white", np.ones_like(gt))):
+        baseline = compute_perceptual(gt, fill)["LPIPS"]
+        assert stored[name]["perceptual"]["LPIPS"] == baseline
+    assert max(max(pair) for pair in seen) == 1.0
+
+
+@pytest.mark.parametrize("i", range(len(PAIRS)))
+def test_shared_image_features_score_exactly_like_plain_arrays(fake_ocr, i):
+    gt, gen = PAIRS[i]
+    shared_gt, shared_gen = ImageFeatures(gt), ImageFeatures(gen)
+    for _ in range(2):                       # the second pass reads the cached conversions
+        assert compute_layout(shared_gt, shared_gen) == reference_layout(gt, gen)
+        assert compute_style(shared_gt, shared_gen) == reference_style(gt, gen)
+        assert compute_legibility(shared_gt, shared_gen) == compute_legibility(gt, gen)
+
+
+def test_one_image_features_is_ocrd_once_however_often_it_is_scored(monkeypatch):
+    calls = []
+
+    class CountingReader(FakeReader):
+        def readtext(self, img_u8):
+            calls.append(img_u8.shape)
+            return super().readtext(img_u8)
+
+    monkeypatch.setattr(legibility, "_reader", CountingReader())
+    gt = ImageFeatures(PAIRS[0][0])
+    for gen in (np.zeros_like(gt.rgb), np.ones_like(gt.rgb)):
+        compute_legibility(gt, gen)
+    assert len(calls) == 3                   # the GT once, each fill once
+
+def _sample_dir(root, gt):
+    from PIL import Image
+    import hashlib
+
+    sample = root / "image_0001"
+    sample.mkdir()
+    path = sample / "image.png"
+    Image.fromarray((gt * 255).round().astype(np.uint8)).save(path)
+    h, w = gt.shape[:2]
+    (sample / "metadata.json").write_text(json.dumps({
+        "sha256": hashlib.sha256(path.read_bytes()).hexdigest(),
+        "size": [w, h],
+        "eval": {"layout": layout_summary(gt), "legibility": gt_legibility(gt),
+                 "style": style_summary(gt)},
+    }))
+    return path
+
+
+def test_batch_reads_the_gt_half_only_for_the_bytes_it_was_built_from(fake_ocr, tmp_path):
+    from widget2code_bench.eval import _summary_from_metadata
+    from widget_quality.utils import load_image
+
+    path = _sample_dir(tmp_path, PAIRS[0][0])
+    gt = load_image(str(path))
+    summary = _summary_from_metadata(str(path), gt)
+    assert summary is not None
+    assert compute_layout(gt, PAIRS[0][1], gt_summary=summary["layout"]) == \
+        compute_layout(gt, PAIRS[0][1])
+
+    meta = json.loads((path.parent / "metadata.json").read_text())
+    meta["sha256"] = "0" * 64
+    (path.parent / "metadata.json").write_text(json.dumps(meta))
+    assert _summary_from_metadata(str(path), gt) is None
@@ -0,0 +1,84 @@
+"""Batched LPIPS must answer every caller with its own pair's distance.
+
+The VGG trunk is swapped for a per-sample stand-in, so these tests pin the
+plumbing - grouping by shape, splitting by the pixel budget, routing each
+result back to the thread that asked - while docker/selfcheck.py proves on the
+real network and stack that a batch gives what a batch of one gives.
+"""
+import threading
+
+import numpy as np
+import pytest
+import torch
+
+from widget_quality import perceptual
+
+
+class PerSample(torch.nn.Module):
+    def forward(self, a, b):
+        self.calls = getattr(self, "calls", 0) + 1
+        return torch.stack([((x - y) ** 2).sum() for x, y in zip(a, b)]).view(-1, 1, 1, 1)
+
+
+@pytest.fixture
+def model(monkeypatch):
+    net = PerSample()
+    monkeypatch.setattr(perceptual, "_lpips_vgg", net)
+    yield net
+    perceptual.set_lpips_batching(1)
+
+
+def _pairs(n, shapes=((24, 32), (16, 16))):
+    rng = np.random.default_rng(0)
+    return [(rng.random((*shapes[i % len(shapes)], 3)),
+             rng.random((*shapes[i % len(shapes)], 3))) for i in range(n)]
+
+
+def test_a_batch_gives_each_pair_its_single_distance(model):
+    pairs = [p for p in _pairs(6) if p[0].shape == (24, 32, 3)]
+    single = [perceptual.compute_lpips(gt, gen) for gt, gen in pairs]
+    assert perceptual.compute_lpips_batch(pairs) == single
+
+
+def test_concurrent_callers_are_batched_and_answered_in_kind(model):
+    pairs = _pairs(24)
+    want = [perceptual.compute_lpips(gt, gen) for gt, gen in pairs]
+    model.calls = 0
+
+    perceptual.set_lpips_batching(8, linger_ms=50)
+    got = [None] * len(pairs)
+    barrier = threading.Barrier(len(pairs))
+
+    def run(i):
+        barrier.wait()
+        got[i] = perceptual.compute_lpips(*pairs[i])
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(pairs))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert got == want
+    assert model.calls < len(pairs)
+
+
+def test_pixel_budget_splits_large_pairs():
+    batcher = perceptual.LpipsBatcher.__new__(perceptual.LpipsBatcher)
+    batcher.max_batch, batcher.max_pixels = 8, 24 * 32 * 2
+    items = [(gt, gen, None) for gt, gen in _pairs(5, shapes=((24, 32),))]
+    assert [len(c) for c in batcher._chunks(items)] == [2, 2, 1]
+
+
+def test_a_failing_batch_fails_its_callers(monkeypatch):
+    class Broken(torch.nn.Module):
+        def forward(self, a, b):
+            raise RuntimeError("out of memory")
+
+    monkeypatch.setattr(perceptual, "_lpips_vgg", Broken())
+    perceptual.set_lpips_batching(4)
+    try:
+        with pytest.raises(RuntimeError, match="out of memory"):
+            perceptual.compute_lpips(*_pairs(1)[0])
+    finally:
+        perceptual.set_lpips_batching(1)
@@ -0,0 +1,76 @@
+import json
+import random
+
+import numpy as np
+import pytest
+
+from widget_quality.composite import composite_score
+from widget2code_bench.report import merge_runs, write_run
+
+
+def _sample(seed: int, sample_id: str) -> dict:
+    rng = np.random.default_rng(seed)
+    scores = composite_score(
+        float(rng.uniform(0, 1)),
+        {"SSIM": float(rng.uniform(0, 1)), "LPIPS": float(rng.uniform(0, 1))},
+        {k: float(rng.uniform(0, 2)) for k in
+         ("MarginAsymmetry", "ContentAspectDiff", "AreaRatioDiff")},
+        {"TextJaccard": float(rng.uniform(0, 1)),
+         "ContrastDiff": float(rng.uniform(0, 5)),
+         "ContrastLocalDiff": float(rng.uniform(0, 5))},
+        {k: float(rng.uniform(0, 1)) for k in
+         ("PaletteDistance", "Vibrancy", "PolarityConsistency")},
+    )
+    scores["Geometry"]["geo_score"] = float(rng.uniform(0, 100))   # unquantised
+    return dict(scores, id=sample_id)
+
+
+def _dataset():
+    ids = [f"{i:04d}" for i in range(1, 41)]
+    missing = set(ids[::7])
+    matched = [_sample(i, sid) for i, sid in enumerate(ids) if sid not in missing]
+    black = [_sample(100 + i, sid) for i, sid in enumerate(ids) if sid in missing]
+    white = [_sample(200 + i, sid) for i, sid in enumerate(ids) if sid in missing]
+    return ids, matched, black, white
+
+
+def test_merged_shards_reproduce_a_single_run_byte_for_byte(tmp_path):
+    ids, matched, black, white = _dataset()
+    manifest = {"gt_dir": "/gt", "pred_dir": "/pred", "pred_name": "output.png"}
+    # Completion order differs run to run; the means must not.
+    shuffled = random.Random(0).sample(matched, len(matched))
+    whole = write_run(tmp_path / "whole", manifest=dict(manifest, run="whole"),
+                      matched=shuffled, black=black, white=white)
+
+    parts = []
+    for index in range(3):
+        shard_ids = set(ids[index::3])
+        parts.append(write_run(
+            tmp_path / f"shard{index}",
+            manifest=dict(manifest, run=f"shard{index}", errors=index,
+                          shard={"index": index, "count": 3}),
+            matched=[r for r in matched if r["id"] in shard_ids],
+            black=[r for r in black if r["id"] in shard_ids],
+            white=[r for r in white if r["id"] in shard_ids]))
+    merged = merge_runs(tmp_path / "merged", parts[::-1])
+
+    for name in ("metrics.json", "samples.jsonl", "fills.jsonl", "summary.csv"):
+        assert (merged / name).read_bytes() == (whole / name).read_bytes(), name
+    run = json.loads((merged / "run.json").read_text())
+    assert run["shards"] == 3 and run["errors"] == 3
+    assert run["matched"] == len(matched) and run["missing"] == len(black)
+
+
+def test_a_merge_needs_every_shard_of_one_split(tmp_path):
+    ids, matched, black, white = _dataset()
+    parts = [
+        write_run(tmp_path / f"shard{index}",
+                  manifest={"gt_dir": "/gt", "pred_dir": "/pred", "pred_name": "output.png",
+                            "shard": {"index": index, "count": 3}},
+                  matched=matched[index::3], black=[], white=[])
+        for index in range(3)
+    ]
+    with pytest.raises(ValueError, match="shards 0..2"):
+        merge_runs(tmp_path / "merged", parts[:2])
+    with pytest.raises(ValueError, match="shards 0..2"):
+        merge_runs(tmp_path / "merged", [parts[0], parts[0], parts[2]])
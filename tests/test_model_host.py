@@ -0,0 +1,51 @@
+"""Workers served by a model host must get the values their own models give.
+
+The host runs in a forked process here so it inherits stand-in networks: the
+real ones need weights this test does not download. What is under test is the
+path - proxies, the float32 hand-off, the reader lock, the batching thread -
+not EasyOCR or VGG.
+"""
+import multiprocessing
+
+import numpy as np
+import pytest
+import torch
+
+from widget_quality import legibility, perceptual
+from widget2code_bench.model_host import start_host, use_host
+
+
+class PerSample(torch.nn.Module):
+    def forward(self, a, b):
+        return torch.stack([((x - y) ** 2).sum() for x, y in zip(a, b)]).view(-1, 1, 1, 1)
+
+
+class FakeReader:
+    def readtext(self, img_u8):
+        return [([[0, 0], [5, 0], [5, 5], [0, 5]], f"mean{int(img_u8.mean())}", 0.9)]
+
+
+@pytest.fixture
+def local_models(monkeypatch):
+    monkeypatch.setattr(perceptual, "_lpips_vgg", PerSample())
+    monkeypatch.setattr(perceptual, "_device", torch.device("cpu"))
+    monkeypatch.setattr(perceptual, "_remote", None)
+    monkeypatch.setattr(legibility, "_reader", FakeReader())
+    monkeypatch.setattr(legibility, "_reader_gpu", False)
+
+
+def test_workers_get_their_own_models_values_from_the_host(local_models):
+    rng = np.random.default_rng(0)
+    pairs = [(rng.random((20, 30, 3)), rng.random((20, 30, 3))) for _ in range(3)]
+    want_lpips = [perceptual.compute_lpips(gt, gen) for gt, gen in pairs]
+    want_ocr = [legibility.ocr_text_easyocr(gt) for gt, _ in pairs]
+
+    manager, host = start_host(multiprocessing.get_context("fork"), use_cuda=False)
+    try:
+        use_host(host, use_cuda=False)
+        perceptual.set_device(use_cuda=False)       # must not load a local copy
+        legibility.set_ocr_device(False)            # must keep the remote reader
+        assert [perceptual.compute_lpips(gt, gen) for gt, gen in pairs] == want_lpips
+        assert [legibility.ocr_text_easyocr(gt) for gt, _ in pairs] == want_ocr
+    finally:
+        manager.shutdown()
@@ -0,0 +1,110 @@
+"""The result cache returns what was stored, under exactly the key it was stored by."""
+import asyncio
+import pickle
+import threading
+
+from widget2code_bench.result_cache import ResultCache, cache_key, digest
+from widget2code_bench.selection import parse_metric_selection, selection_key
+
+
+def _key(gt=b"gt", pred=b"pred", metrics=None, use_cuda=False):
+    return cache_key(digest(gt), digest(pred),
+                     selection_key(parse_metric_selection(metrics)), use_cuda=use_cuda)
+
+
+def test_roundtrip_and_counters(tmp_path):
+    cache = ResultCache(tmp_path)
+    scores = {"PerceptualScore": {"ssim": 0.912}}
+    assert cache.get(_key()) is None
+    cache.put(_key(), scores)
+    assert cache.get(_key()) == scores
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_key_covers_every_input():
+    keys = {_key(), _key(gt=b"other"), _key(pred=b"other"), _key(metrics="ssim"),
+            _key(use_cuda=True)}
+    assert len(keys) == 5
+    assert _key(metrics="lpips") == _key(metrics="lp")
+
+
+def test_key_changes_with_the_image_stamp(monkeypatch):
+    monkeypatch.setenv("W2C_BENCH_STAMP", "a")
+    first = _key()
+    monkeypatch.setenv("W2C_BENCH_STAMP", "b")
+    assert _key() != first
+
+
+def test_least_recently_used_is_evicted(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=3 * len('{"v": 0}'))
+    for i in range(3):
+        cache.put(f"k{i}", {"v": i})
+    cache.get("k0")
+    cache.put("k3", {"v": 3})
+    assert cache.get("k1") is None
+    assert [cache.get(k) for k in ("k0", "k2", "k3")] == [{"v": 0}, {"v": 2}, {"v": 3}]
+
+
+def test_a_pickled_cache_reopens_the_same_file(tmp_path):
+    cache = ResultCache(tmp_path)
+    cache.put("k", {"v": 1})
+    assert pickle.loads(pickle.dumps(cache)).get("k") == {"v": 1}
+
+
+def test_the_daemon_uses_the_cache_off_its_event_loop(tmp_path):
+    from widget2code_bench import bench_ipc as ipc
+    from widget2code_bench.bench_daemon import BenchDaemon
+
+    threads = []
+
+    class RecordingCache(ResultCache):
+        def get(self, key):
+            threads.append(threading.current_thread())
+            return super().get(key)
+
+        def put(self, key, scores):
+            threads.append(threading.current_thread())
+            super().put(key, scores)
+
+    daemon = BenchDaemon(runtime_dir=tmp_path, workers=1, use_cuda=False,
+                         cache=RecordingCache(tmp_path / "cache"))
+
+    async def run_now(pool, fn, images, *args):
+        return {"pred": images[1].decode()}
+
+    daemon._run_now = run_now
+    request = {"v": ipc.PROTOCOL_VERSION, "metrics": "ssim"}
+    for _ in range(2):                           # a miss and a store, then a hit
+        reply = asyncio.run(daemon._answer(ipc.PROTOCOL_VERSION, request, [b"gt", b"a"]))
+        assert reply["scores"] == {"pred": "a"}
+    assert len(threads) == 3
+    assert threading.main_thread() not in threads
+
+
+def test_a_fully_cached_evaluate_many_takes_no_worker(tmp_path):
+    from widget2code_bench import bench_ipc as ipc
+    from widget2code_bench.bench_daemon import BenchDaemon
+
+    daemon = BenchDaemon(runtime_dir=tmp_path, workers=1, use_cuda=False,
+                         cache=ResultCache(tmp_path / "cache"))
+    ran = []
+
+    async def run_now(pool, fn, images, *args):
+        ran.append(fn.__name__)
+        return {} if fn.__name__ == "_prepare_in_worker" else {"pred": images[1].decode()}
+
+    daemon._run_now = run_now
+    many = {"v": ipc.PROTOCOL_VERSION, "op": "evaluate_many", "metrics": "ssim"}
+
+    def answer(preds):
+        reply = asyncio.run(daemon._answer(ipc.PROTOCOL_VERSION, many, [b"gt", *preds]))
+        return [result["scores"] for result in reply["results"]]
+
+    assert answer([b"a", b"b"]) == [{"pred": "a"}, {"pred": "b"}]
+    assert ran == ["_prepare_in_worker", "_evaluate_in_worker", "_evaluate_in_worker"]
+    ran.clear()
+    assert answer([b"b", b"a"]) == [{"pred": "b"}, {"pred": "a"}]
+    assert ran == []
+    assert answer([b"a", b"c"]) == [{"pred": "a"}, {"pred": "c"}]
+    assert ran == ["_prepare_in_worker", "_evaluate_in_worker"]
+    assert daemon.schedulers["model"]._depth == 0
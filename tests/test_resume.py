@@ -0,0 +1,69 @@
+import pytest
+from PIL import Image
+
+from widget2code_bench import eval as bench_eval
+from widget2code_bench.report import PROGRESS, ProgressJournal, read_progress, write_run
+from test_merge_runs import _sample
+
+IDS = ["0001", "0002", "0003", "0004"]
+
+
+def _dataset(root):
+    for sid in IDS:
+        for path in (root / "gt" / f"image_{sid}" / "image.png",
+                     root / "pred" / f"image_{sid}" / "output.png"):
+            path.parent.mkdir(parents=True)
+            Image.new("RGB", (8, 8)).save(path)
+
+
+def test_a_resumed_run_scores_only_what_is_missing_and_ends_the_same(tmp_path, monkeypatch):
+    _dataset(tmp_path)
+    scored, preempted = [], []
+
+    def fake_pair(sample_id, gt_path, pred_path, cache=None, use_cuda=False, timings=False,
+                  precision="compact"):
+        if sample_id == "0003" and not preempted:
+            preempted.append(sample_id)
+            raise RuntimeError("node preempted")
+        scored.append(sample_id)
+        return True, _sample(int(sample_id), sample_id), "computed", None
+
+    monkeypatch.setattr(bench_eval, "evaluate_single_pair", fake_pair)
+    run = tmp_path / "run"
+    journal = ProgressJournal(run, header={"run": "run", "gt_dir": str(tmp_path / "gt")})
+    with pytest.raises(RuntimeError):
+        bench_eval.evaluate_pairs(str(tmp_path / "gt"), str(tmp_path / "pred"), 1,
+                                  journal=journal)
+    journal.close()
+    with (run / PROGRESS).open("a") as fh:
+        fh.write('{"kind": "matched", "row": {"id": "00')     # cut off mid-line
+
+    header, done = read_progress(run)
+    assert header["run"] == "run"
+    assert [row["id"] for row in done["matched"]] == ["0001", "0002"]
+    journal = ProgressJournal(run)
+    scored.clear()
+    results = bench_eval.evaluate_pairs(str(tmp_path / "gt"), str(tmp_path / "pred"), 1,
+                                        journal=journal, done=done)
+    assert sorted(scored) == ["0003", "0004"]
+    assert len(read_progress(run)[1]["matched"]) == 4
+    write_run(run, manifest={"run": "run"}, matched=results["matched"], black=[], white=[])
+    journal.finish()
+
+    whole = write_run(tmp_path / "whole", manifest={"run": "whole"},
+                      matched=[_sample(int(sid), sid) for sid in IDS], black=[], white=[])
+    assert not (run / PROGRESS).exists()
+    for name in ("metrics.json", "samples.jsonl"):
+        assert (run / name).read_bytes() == (whole / name).read_bytes()
+
+
+def test_a_resumed_run_still_counts_the_fills_it_restored(tmp_path, monkeypatch, capsys):
+    _dataset(tmp_path)
+    (tmp_path / "pred" / "image_0004" / "output.png").unlink()
+    monkeypatch.setattr(bench_eval, "evaluate_single_pair",
+                        lambda sample_id, *args, **kwargs:
+                        (True, _sample(int(sample_id), sample_id), "computed", None))
+    done = {"matched": [], "black": [{"id": "0004"}], "white": [{"id": "0004"}],
+            "timings": []}
+    bench_eval.evaluate_pairs(str(tmp_path / "gt"), str(tmp_path / "pred"), 1, done=done)
+    assert "Missing predictions: 1\n" in capsys.readouterr().out
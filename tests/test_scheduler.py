@@ -0,0 +1,130 @@
+"""The daemon's scheduler: bounded, prioritised, fair, and deadline-aware."""
+import asyncio
+import time
+
+import pytest
+
+from widget2code_bench import bench_ipc as ipc
+from widget2code_bench.bench_client import BenchClient
+from widget2code_bench.scheduler import Scheduler
+
+
+def _order(submissions, *, slots=1):
+    """Run (connection, priority, deadline) jobs behind one blocker; return start order."""
+    started = []
+
+    async def scenario():
+        scheduler = Scheduler(slots)
+        gate = asyncio.Event()
+
+        async def blocker():
+            await gate.wait()
+
+        def job(name):
+            async def run():
+                started.append(name)
+                return name
+            return run
+
+        first = asyncio.create_task(scheduler.run("x", "bulk", None, blocker))
+        await asyncio.sleep(0)
+        tasks = [asyncio.create_task(scheduler.run(conn, prio, deadline, job(name)))
+                 for name, conn, prio, deadline in submissions]
+        await asyncio.sleep(0)
+        gate.set()
+        await first
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return scheduler, results
+
+    scheduler, results = asyncio.run(scenario())
+    return started, scheduler, results
+
+
+def test_interactive_work_starts_before_bulk():
+    started, _, _ = _order([("bulk", "a", "bulk", None), ("inter", "b", "interactive", None)])
+    assert started == ["inter", "bulk"]
+
+
+def test_connections_take_turns_within_a_class():
+    started, _, _ = _order([("a1", "a", "bulk", None), ("a2", "a", "bulk", None),
+                            ("a3", "a", "bulk", None), ("b1", "b", "bulk", None)])
+    assert started == ["a1", "b1", "a2", "a3"]
+
+
+def test_expired_work_is_dropped_before_it_starts():
+    started, scheduler, results = _order([("late", "a", "bulk", time.monotonic() - 1),
+                                          ("fine", "a", "bulk", None)])
+    assert started == ["fine"]
+    assert isinstance(results[0], ipc.DeadlineExceeded)
+    assert scheduler.stats()["expired"] == 1
+
+
+def test_a_full_queue_refuses_new_requests():
+    scheduler = Scheduler(1, max_queue=2)
+    with scheduler.admit(2):
+        with pytest.raises(ipc.Busy):
+            scheduler.admit()
+    assert scheduler.stats()["rejected"] == 1
+    scheduler.admit(2).release()
+
+
+def test_concurrent_evaluate_many_requests_cannot_overrun_the_queue(tmp_path):
+    from widget2code_bench.bench_daemon import BenchDaemon, _prepare_in_worker
+
+    daemon = BenchDaemon(runtime_dir=tmp_path, workers=1, use_cuda=False, max_queue=6)
+    many = {"v": ipc.PROTOCOL_VERSION, "op": "evaluate_many", "metrics": "ssim"}
+    preparing = asyncio.Event()
+    prepared = asyncio.Event()
+
+    async def run_now(pool, fn, images, *args):
+        if fn is _prepare_in_worker:             # a slow GT preparation
+            preparing.set()
+            await prepared.wait()
+            return {}
+        return {"pred": images[1].decode()}
+
+    daemon._run_now = run_now
+
+    async def scenario():
+        first = asyncio.create_task(daemon._answer(ipc.PROTOCOL_VERSION, many,
+                                                   [b"gt", b"a", b"b", b"c"]))
+        await preparing.wait()
+        # Nothing of the first request is queued yet, but its four jobs count.
+        with pytest.raises(ipc.Busy):
+            await asyncio.wait_for(
+                daemon._answer(ipc.PROTOCOL_VERSION, many, [b"gt2", b"d", b"e", b"f"]), 5)
+        prepared.set()
+        answered = await first
+        again = await daemon._answer(ipc.PROTOCOL_VERSION, many, [b"gt2", b"d", b"e", b"f"])
+        return answered, again
+
+    answered, again = asyncio.run(scenario())
+    assert [r["scores"] for r in answered["results"]] == [{"pred": p} for p in "abc"]
+    assert len(again["results"]) == 3
+    assert daemon.schedulers["model"]._depth == 0
+    assert daemon.schedulers["model"].stats()["rejected"] == 1
+
+
+def test_client_retries_a_busy_daemon(tmp_path):
+    answered = []
+
+    async def scenario():
+        async def handle(reader, writer):
+            while (message := await ipc.read_message(reader)) is not None:
+                request = message[1]
+                if not answered:
+                    reply = ipc.failure(ipc.Busy("queue full"))
+                else:
+                    reply = ipc.success({"PerceptualScore": {"ssim": 1.0}})
+                answered.append(request.get("priority"))
+                writer.writelines(ipc.encode_frame({**reply, "id": request["id"]}))
+                await writer.drain()
+
+        server = await asyncio.start_unix_server(handle, path=str(ipc.socket_path(tmp_path)))
+        async with server:
+            async with BenchClient(tmp_path, priority="bulk") as client:
+                return await asyncio.wait_for(
+                    client.evaluate_bytes(b"gt", b"pred", metrics="ssim"), timeout=10)
+
+    assert asyncio.run(scenario()) == {"PerceptualScore": {"ssim": 1.0}}
+    assert answered == ["bulk", "bulk"]
@@ -56,12 +56,119 @@ def test_json_only_single_mode_is_machine_readable(tmp_path, capsys):
         metrics="ssim",
         cuda=False,
         json_only=True,
+        precision="compact",
     ))
     assert json.loads(capsys.readouterr().out) == {
         "PerceptualScore": {"ssim": 1.0}
     }
 
 
+def test_an_image_loads_the_same_from_path_bytes_or_array(tmp_path):
+    import numpy as np
+
+    from widget_quality.utils import load_image
+
+    path = tmp_path / "image.png"
+    _image(path)
+    from_path = load_image(str(path))
+    assert np.array_equal(load_image(path.read_bytes()), from_path)
+    assert np.array_equal(load_image(np.asarray(Image.open(path))), from_path)
+    assert evaluate_single(path.read_bytes(), path, metrics="ssim") == {
+        "PerceptualScore": {"ssim": 1.0}
+    }
+
+
+def test_8_bit_pixels_score_like_float64_and_float64_precision_reproduces_the_resize(tmp_path):
+    import numpy as np
+
+    from widget_quality.features import ImageFeatures
+    from widget_quality.layout import compute_layout
+    from widget_quality.legibility import contrast_ratio
+    from widget_quality.perceptual import compute_ssim
+    from widget_quality.style import compute_style
+    from widget_quality.utils import load_image, load_pixels, resize_prediction, resize_to_match
+
+    def scores(gt, gen):
+        return dict(compute_layout(gt, gen), **compute_style(gt, gen), SSIM=compute_ssim(gt, gen),
+                    contrast=float(contrast_ratio(gen)))
+
+    # Taller than one band of rows, so the banded conversions have seams.
+    gt_path, pred_path = tmp_path / "gt.png", tmp_path / "pred.png"
+    image = Image.new("RGB", (240, 300), (245, 245, 250))
+    ImageDraw.Draw(image).rectangle((30, 40, 200, 250), fill=(30, 60, 90))
+    ImageDraw.Draw(image).ellipse((60, 120, 150, 210), fill=(230, 100, 60))
+    image.save(gt_path)
+    image = Image.new("RGB", (251, 317), (250, 240, 230))
+    ImageDraw.Draw(image).rectangle((28, 45, 210, 260), fill=(40, 80, 120))
+    image.save(pred_path)
+
+    gt = load_image(str(gt_path))
+    legacy = scores(gt, resize_to_match(gt, load_image(str(pred_path))))
+    pixels = ImageFeatures(load_pixels(gt_path))
+    assert pixels.nbytes * 8 == gt.nbytes
+    assert scores(pixels, resize_prediction(pixels, load_pixels(pred_path), "float64")) == legacy
+    compact = resize_prediction(pixels, load_pixels(pred_path))
+    assert compact.pixels.dtype == np.uint8 and compact.shape == gt.shape
+
+    same = load_pixels(gt_path)[::-1].copy()           # the GT's size: never resampled
+    assert scores(pixels, resize_prediction(pixels, same)) == \
+        scores(gt, resize_to_match(gt, same / 255.0))
+
+
+def test_ssim_is_skimages_to_the_bit():
+    import numpy as np
+    from skimage.metrics import structural_similarity
+
+    from widget_quality.features import ImageFeatures
+    from widget_quality.perceptual import compute_ssim
+
+    rng = np.random.default_rng(0)
+    for h, w in ((7, 7), (64, 97), (301, 130)):
+        gt = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+        gen = np.clip(gt + rng.integers(-40, 41, gt.shape), 0, 255).astype(np.uint8)
+        want = float(structural_similarity(gt / 255.0, gen / 255.0, channel_axis=2,
+                                           data_range=1.0))
+        assert compute_ssim(ImageFeatures(gt), ImageFeatures(gen)) == want
+        assert compute_ssim(gt / 255.0, gen / 255.0) == want
+
+
+def test_contrast_percentiles_are_numpys_to_the_bit():
+    import numpy as np
+
+    from widget_quality.features import ImageFeatures
+    from widget_quality.legibility import _contrast_percentiles, contrast_ratio
+
+    rng = np.random.default_rng(0)
+    for n in list(range(1, 41)) + [997]:
+        for values in (rng.random(n), rng.integers(0, 4, n) / 3):     # with and without ties
+            values = values.astype(np.float32)
+            assert _contrast_percentiles(values).tolist() == np.percentile(values, [5, 95]).tolist()
+    luma = ImageFeatures(rng.integers(0, 256, (120, 90, 3), dtype=np.uint8)).luma
+    patch = luma[17:40, 5:61]                                        # an OCR box, not contiguous
+    assert _contrast_percentiles(patch).tolist() == np.percentile(patch, [5, 95]).tolist()
+    min_l, max_l = np.percentile(luma, [5, 95])
+    assert contrast_ratio(luma) == (max_l + 0.05) / (min_l + 0.05)
+
+
+def test_daemon_workers_read_images_from_shared_memory(tmp_path):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import resource_tracker
+
+    from widget2code_bench.bench_daemon import SharedPayload, _evaluate_in_worker
+
+    path = tmp_path / "image.png"
+    _image(path)
+    resource_tracker.ensure_running()
+    payload = SharedPayload(path.read_bytes(), path.read_bytes())
+    try:
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            scores = pool.submit(_evaluate_in_worker, payload, "ssim", False).result()
+    finally:
+        payload.release()
+    assert scores == {"PerceptualScore": {"ssim": 1.0}}
+
+
 def test_images_travel_over_the_wire_without_caller_paths(tmp_path):
     path = tmp_path / "image.png"
     _image(path)
@@ -78,8 +185,10 @@ def test_socket_client_evaluates_selected_metrics(tmp_path):
 
     async def scenario():
         async def handle(reader, writer):
-            seen.update(ipc.decode(await reader.readline()))
-            writer.write(ipc.encode(ipc.success({
+            _, header, payloads = await ipc.read_message(reader)
+            seen.update(header)
+            seen["payloads"] = payloads
+            writer.writelines(ipc.encode_frame(ipc.success({
                 "PerceptualScore": {"ssim": 1.0},
                 "Geometry": {"geo_score": 100.0},
             })))
@@ -97,6 +206,66 @@ def test_socket_client_evaluates_selected_metrics(tmp_path):
         "Geometry": {"geo_score": 100.0},
     }
     assert set(seen).isdisjoint({"gt_path", "pred_path"})
+    assert seen["payloads"] == [path.read_bytes(), path.read_bytes()]
+
+
+def test_client_falls_back_to_v1_for_a_line_only_daemon(tmp_path):
+    path = tmp_path / "image.png"
+    _image(path)
+    received = []
+
+    async def scenario():
+        # What a v1 daemon does: read a line, answer a line.
+        async def handle(reader, writer):
+            try:
+                request = ipc.decode(await reader.readline())
+                received.append(request["v"])
+                reply = ipc.success({"PerceptualScore": {"ssim": 1.0}}, ipc.V1)
+            except Exception as exc:
+                received.append("unreadable")
+                reply = ipc.failure(exc, ipc.V1)
+            writer.write(ipc.encode(reply))
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_unix_server(
+            handle, path=str(ipc.socket_path(tmp_path)), limit=ipc.STREAM_LIMIT
+        )
+        async with server:
+            client = BenchClient(tmp_path)
+            scores = await client.evaluate(path, path, metrics="ssim")
+            return scores, client.protocol
+
+    assert asyncio.run(scenario()) == ({"PerceptualScore": {"ssim": 1.0}}, ipc.V1)
+    assert received == ["unreadable", ipc.V1]
+
+
+def test_daemon_answers_each_framing_in_kind(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from widget2code_bench.bench_daemon import BenchDaemon
+
+    path = tmp_path / "image.png"
+    _image(path)
+    daemon = BenchDaemon(runtime_dir=tmp_path, workers=1, use_cuda=False)
+
+    async def scenario():
+        daemon._pool = ThreadPoolExecutor(1)
+        server = await asyncio.start_unix_server(
+            daemon._handle, path=str(ipc.socket_path(tmp_path)), limit=ipc.STREAM_LIMIT
+        )
+        async with server:
+            results = []
+            for protocol in (ipc.V1, ipc.PROTOCOL_VERSION):
+                client = BenchClient(tmp_path, protocol=protocol)
+                results.append(await client.evaluate(path, path, metrics="ssim"))
+                assert client.protocol == protocol
+            return results
+
+    try:
+        assert asyncio.run(scenario()) == [{"PerceptualScore": {"ssim": 1.0}}] * 2
+    finally:
+        daemon._pool.shutdown()
 
 
 def test_client_waits_for_daemon_start(tmp_path):
@@ -110,8 +279,8 @@ def test_client_waits_for_daemon_start(tmp_path):
         assert not pending.done()
 
         async def handle(reader, writer):
-            await reader.readline()
-            writer.write(ipc.encode(ipc.success({"PerceptualScore": {"ssim": 1.0}})))
+            await ipc.read_message(reader)
+            writer.writelines(ipc.encode_frame(ipc.success({"PerceptualScore": {"ssim": 1.0}})))
             await writer.drain()
             writer.close()
 
@@ -130,12 +299,12 @@ def test_client_retries_dropped_connection(tmp_path):
     async def scenario():
         async def handle(reader, writer):
             nonlocal attempts
-            await reader.readline()
+            await ipc.read_message(reader)
             attempts += 1
             if attempts == 1:
                 writer.close()
                 return
-            writer.write(ipc.encode(ipc.success({"Geometry": {"geo_score": 100.0}})))
+            writer.writelines(ipc.encode_frame(ipc.success({"Geometry": {"geo_score": 100.0}})))
             await writer.drain()
             writer.close()
 
@@ -155,3 +324,177 @@ def test_supervisor_only_kills_stalled_work():
     stuck = {"now": now, "in_flight": 2, "last_completed_at": now - 700}
     assert diagnose(idle, now=now, stall_s=600, silence_s=60) is None
     assert "outstanding" in diagnose(stuck, now=now, stall_s=600, silence_s=60)
+
+
+def test_one_connection_carries_concurrent_requests_answered_out_of_order(tmp_path):
+    from widget2code_bench.bench_daemon import BenchDaemon
+
+    daemon = BenchDaemon(runtime_dir=tmp_path, workers=1, use_cuda=False)
+    connections = 0
+
+    async def answer(framing, request, payloads):
+        # The first request finishes last.
+        await asyncio.sleep(0.3 if payloads[1] == b"slow" else 0.0)
+        return ipc.success({"pred": payloads[1].decode()}, framing)
+
+    daemon._answer = answer
+
+    async def handle(reader, writer):
+        nonlocal connections
+        connections += 1
+        await daemon._handle(reader, writer)
+
+    async def scenario():
+        server = await asyncio.start_unix_server(handle, path=str(ipc.socket_path(tmp_path)))
+        async with server:
+            reader, writer = await asyncio.open_unix_connection(str(ipc.socket_path(tmp_path)))
+            for request_id, pred in ((1, b"slow"), (2, b"fast")):
+                header, payloads = ipc.build_frame(b"gt", pred)
+                writer.writelines(ipc.encode_frame({**header, "id": request_id}, payloads))
+            await writer.drain()
+            order = [(await ipc.read_message(reader))[1]["id"] for _ in range(2)]
+            writer.close()
+
+            async with BenchClient(tmp_path) as client:
+                preds = [b"slow", b"fast", b"fast"]
+                scores = await asyncio.gather(*(client.evaluate_bytes(b"gt", p) for p in preds))
+            return order, scores
+
+    order, scores = asyncio.run(scenario())
+    assert order == [2, 1]
+    assert scores == [{"pred": "slow"}, {"pred": "fast"}, {"pred": "fast"}]
+    assert connections == 2
+
+
+def test_selections_are_classified_by_the_model_they_need():
+    from widget2code_bench.selection import selection_cost
+
+    assert selection_cost(parse_metric_selection("ssim,geometry,layout,style,contrast")) == "light"
+    assert selection_cost(parse_metric_selection("ssim,text")) == "ocr"
+    assert selection_cost(parse_metric_selection("contrast,lp")) == "lpips"
+    assert selection_cost(parse_metric_selection(None)) == "lpips"
+
+
+def test_daemon_serves_model_free_selections_from_its_light_pool(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from widget2code_bench.bench_daemon import BenchDaemon
+
+    path = tmp_path / "image.png"
+    _image(path)
+    daemon = BenchDaemon(runtime_dir=tmp_path, workers=1, use_cuda=False)
+    submitted = []
+
+    class Pool(ThreadPoolExecutor):
+        def __init__(self, lane):
+            super().__init__(1)
+            self.lane = lane
+
+        def submit(self, *args, **kwargs):
+            submitted.append(self.lane)
+            return super().submit(*args, **kwargs)
+
+    async def scenario():
+        daemon._pool, daemon._light_pool = Pool("model"), Pool("light")
+        server = await asyncio.start_unix_server(
+            daemon._handle, path=str(ipc.socket_path(tmp_path)))
+        async with server:
+            async with BenchClient(tmp_path) as client:
+                return await client.evaluate(path, path, metrics="ssim,layout,contrast")
+
+    try:
+        assert asyncio.run(scenario())["PerceptualScore"] == {"ssim": 1.0}
+    finally:
+        daemon._pool.shutdown()
+        daemon._light_pool.shutdown()
+    assert submitted == ["light"]
+
+
+def test_daemon_binds_its_socket_only_once_every_worker_is_warm(tmp_path, monkeypatch):
+    from widget2code_bench import bench_daemon
+    from widget2code_bench.canary import canary_arrays, canary_png
+    from widget_quality.utils import load_image
+
+    gt_png, _ = canary_png(1)
+    assert (load_image(gt_png) == canary_arrays(1)[0][..., ::-1] / 255.0).all()
+
+    # The canary on every pool, without loading either network for the test.
+    monkeypatch.setitem(bench_daemon.WARMUP_METRICS, "model", "ssim,geometry")
+    daemon = bench_daemon.BenchDaemon(runtime_dir=tmp_path, workers=2, use_cuda=False,
+                                      light_workers=1)
+    sock = ipc.socket_path(tmp_path)
+
+    async def scenario():
+        running = asyncio.create_task(daemon.run())
+        while not sock.exists():
+            assert not running.done(), running.exception()
+            beat = json.loads(ipc.heartbeat_path(tmp_path).read_text()) \
+                if ipc.heartbeat_path(tmp_path).exists() else None
+            assert beat is None or not beat["ready"]
+            await asyncio.sleep(0.05)
+        beat = json.loads(ipc.heartbeat_path(tmp_path).read_text())
+        async with BenchClient(tmp_path) as client:
+            scores = await client.evaluate_bytes(gt_png, gt_png, metrics="ssim")
+        warm_pids = set(daemon._pool.pids())
+        daemon.stop()
+        await running
+        return beat, scores, warm_pids
+
+    beat, scores, warm_pids = asyncio.run(scenario())
+    assert beat["ready"] and beat["ready_at"] >= beat["started_at"]
+    assert scores == {"PerceptualScore": {"ssim": 1.0}}
+    assert len(warm_pids) == 2
+
+
+def test_a_successor_takes_the_socket_while_the_old_daemon_answers_what_it_read(tmp_path):
+    from widget2code_bench.bench_daemon import BenchDaemon
+
+    path = tmp_path / "image.png"
+    _image(path)
+    sock = ipc.socket_path(tmp_path)
+    old = BenchDaemon(runtime_dir=tmp_path, workers=1, light_workers=0, warmup=False,
+                      use_cuda=False)
+    new = BenchDaemon(runtime_dir=tmp_path, workers=1, light_workers=0, warmup=False,
+                      use_cuda=False, takeover=True)
+    release = asyncio.Event()
+
+    async def slow_answer(framing, request, payloads):
+        await release.wait()
+        return ipc.success({"Daemon": {"old": 1.0}})
+
+    async def answer(framing, request, payloads):
+        return ipc.success({"Daemon": {"new": 1.0}})
+
+    old._answer, new._answer = slow_answer, answer
+
+    async def scenario():
+        serving_old = asyncio.create_task(old.run())
+        while old._ready_at is None:
+            await asyncio.sleep(0.01)
+        async with BenchClient(tmp_path) as client:
+            in_flight = asyncio.create_task(client.evaluate(path, path, metrics="geometry"))
+            while old._in_flight == 0:
+                await asyncio.sleep(0.01)
+            serving_new = asyncio.create_task(new.run())
+            while new._ready_at is None:
+                await asyncio.sleep(0.01)
+            assert not old._owns_socket() and new._owns_socket()
+            assert json.loads(ipc.heartbeat_path(tmp_path).read_text())["ready"]
+            assert not ipc.standby_heartbeat_path(tmp_path).exists()
+            old.stop()
+            while not old._draining:
+                await asyncio.sleep(0.01)
+            # Sent on the draining daemon's connection: never read there, so
+            # the client resends it to the successor.
+            resent = asyncio.create_task(client.evaluate(path, path, metrics="geometry"))
+            await asyncio.sleep(0.1)
+            release.set()
+            answers = await asyncio.wait_for(asyncio.gather(in_flight, resent), timeout=10)
+        await serving_old
+        assert sock.exists() and new._owns_socket()
+        new.stop()
+        await serving_new
+        return answers
+
+    assert asyncio.run(scenario()) == [{"Daemon": {"old": 1.0}}, {"Daemon": {"new": 1.0}}]
+    assert not sock.exists()
@@ -0,0 +1,97 @@
+import asyncio
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+from widget2code_bench import bench_ipc as ipc
+from widget2code_bench.bench_client import BenchClient, BenchEvaluationError
+from widget2code_bench.bench_daemon import BenchDaemon
+from widget2code_bench.telemetry import Registry, serve, serve_in_thread
+
+
+def _sample_lines(text):
+    return [line for line in text.splitlines() if line and not line.startswith("#")]
+
+
+def test_registry_renders_the_prometheus_text_format():
+    registry = Registry()
+    requests = registry.counter("w2c_requests_total", "Requests.")
+    latency = registry.histogram("w2c_request_seconds", "Latency.", buckets=(0.1, 1.0))
+    requests.inc(op="evaluate", outcome="ok")
+    requests.inc(op="evaluate", outcome="ok")
+    requests.inc(op="evaluate", outcome='Bad"Name')
+    latency.observe(0.05, op="evaluate")
+    latency.observe(0.5, op="evaluate")
+    registry.collector(lambda: [("w2c_in_flight", "gauge", "In flight.", [({}, 3)])])
+    registry.collector(lambda: 1 / 0)
+
+    text = registry.render()
+    assert "# TYPE w2c_requests_total counter" in text
+    assert _sample_lines(text) == [
+        'w2c_requests_total{op="evaluate",outcome="Bad\\"Name"} 1',
+        'w2c_requests_total{op="evaluate",outcome="ok"} 2',
+        'w2c_request_seconds_bucket{op="evaluate",le="0.1"} 1',
+        'w2c_request_seconds_bucket{op="evaluate",le="1.0"} 2',
+        'w2c_request_seconds_bucket{op="evaluate",le="+Inf"} 2',
+        'w2c_request_seconds_sum{op="evaluate"} 0.55',
+        'w2c_request_seconds_count{op="evaluate"} 2',
+        "w2c_in_flight 3",
+    ]
+    assert "# collector failed: ZeroDivisionError" in text
+
+
+def test_supervisor_metrics_are_served_from_a_thread():
+    registry = Registry()
+    registry.counter("w2c_supervisor_restarts_total", "Restarts.").inc()
+    server = serve_in_thread(registry, "127.0.0.1", 0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert "w2c_supervisor_restarts_total 1" in response.read().decode()
+    finally:
+        server.shutdown()
+
+
+def test_daemon_counts_requests_errors_and_latency_per_group(tmp_path):
+    path = tmp_path / "image.png"
+    Image.new("RGB", (64, 48), (20, 40, 60)).save(path)
+    daemon = BenchDaemon(runtime_dir=tmp_path, workers=1, use_cuda=False)
+
+    async def scrape(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.0\r\n\r\n")
+        response = (await reader.read()).decode()
+        writer.close()
+        return response
+
+    async def scenario():
+        daemon._pool, daemon._light_pool = ThreadPoolExecutor(1), ThreadPoolExecutor(1)
+        server = await asyncio.start_unix_server(
+            daemon._handle, path=str(ipc.socket_path(tmp_path)))
+        metrics = await serve(daemon.metrics, "127.0.0.1", 0)
+        async with server:
+            async with BenchClient(tmp_path) as client:
+                await client.evaluate(path, path, metrics="ssim,layout")
+                with pytest.raises(BenchEvaluationError):
+                    await client.evaluate(path, path, metrics="nonsense")
+            response = await scrape(metrics.sockets[0].getsockname()[1])
+        metrics.close()
+        return response
+
+    try:
+        response = asyncio.run(scenario())
+    finally:
+        daemon._pool.shutdown()
+        daemon._light_pool.shutdown()
+    assert response.startswith("HTTP/1.0 200")
+    lines = _sample_lines(response.split("\r\n\r\n", 1)[1])
+    assert 'w2c_requests_total{op="evaluate",outcome="ok"} 1' in lines
+    assert 'w2c_requests_total{op="evaluate",outcome="ValueError"} 1' in lines
+    assert 'w2c_errors_total{type="ValueError"} 1' in lines
+    assert ('w2c_evaluation_seconds_count{groups="layout+perceptual",lane="light"} 1'
+            in lines)
+    assert 'w2c_queue_depth{lane="model",priority="interactive"} 0' in lines
+    assert any(line.startswith('w2c_resident_bytes{role="daemon"}') for line in lines)
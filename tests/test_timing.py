@@ -0,0 +1,95 @@
+import json
+
+from PIL import Image, ImageDraw
+
+from widget2code_bench.bench_daemon import _evaluate_in_worker
+from widget2code_bench.report import write_run
+from widget2code_bench.single import evaluate_single
+from widget2code_bench.timings import BUCKETS_MS, RollingTimings, summarize
+from widget_quality import timing
+
+
+def _image(path):
+    image = Image.new("RGB", (96, 64), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((12, 10, 82, 52), fill=(30, 60, 90))
+    image.save(path)
+
+
+def test_stages_are_free_and_unrecorded_outside_a_collector():
+    with timing.stage("decode"):
+        pass
+    with timing.collect() as record:
+        with timing.stage("layout"):
+            with timing.stage("layout.mask"):
+                pass
+            with timing.stage("layout.mask"):
+                pass
+    assert set(record) == {"layout", "layout.mask"}
+    assert record["layout.mask"]["calls"] == 2
+    assert record["layout"]["wall_ms"] >= record["layout.mask"]["wall_ms"]
+
+
+def test_an_evaluation_reports_each_stage_it_ran_and_the_same_scores(tmp_path):
+    path = tmp_path / "image.png"
+    _image(path)
+    with timing.collect() as record:
+        timed = evaluate_single(path, path, metrics="ssim,geometry,layout,style")
+    assert timed == evaluate_single(path, path, metrics="ssim,geometry,layout,style")
+    assert {"decode", "resize", "geometry", "ssim", "layout", "layout.mask",
+            "style", "style.hsv"} <= set(record)
+    assert record["decode"]["calls"] == 2
+    assert "lpips" not in record
+
+    scores, record = _evaluate_in_worker((path.read_bytes(), path.read_bytes()), "ssim",
+                                         False, None, None, None, True)
+    assert scores == {"PerceptualScore": {"ssim": 1.0}}
+    assert "ssim" in record
+
+
+def test_summaries_give_percentiles_and_bucketed_wall_times():
+    records = [{"ssim": {"wall_ms": float(ms), "cpu_ms": ms / 2, "calls": 1}}
+               for ms in range(1, 101)]
+    records[0]["ocr"] = {"wall_ms": 7000.0, "cpu_ms": 10.0, "calls": 1}
+    summary = summarize(records)
+    assert summary["ssim"]["n"] == 100
+    assert summary["ssim"]["wall_ms"] == {"p50": 51.0, "p90": 91.0, "p99": 100.0,
+                                          "max": 100.0}
+    assert summary["ocr"]["n"] == 1
+
+    rolling = RollingTimings(window=10)
+    for record in records:
+        rolling.add(record)
+    stats = rolling.stats()
+    assert stats["samples"] == 10
+    hist = stats["stages"]["ssim"]["wall_hist"]
+    assert len(hist) == len(BUCKETS_MS) + 1 and sum(hist) == 10
+    assert hist[BUCKETS_MS.index(100)] == 10    # 91..100 ms
+
+
+def test_a_timed_run_writes_timings_beside_samples(tmp_path):
+    from widget_quality.composite import composite_score
+
+    sample = composite_score(1.0, {"SSIM": 1.0, "LPIPS": 0.0},
+                             {"MarginAsymmetry": 0.0, "ContentAspectDiff": 0.0,
+                              "AreaRatioDiff": 0.0},
+                             {"TextJaccard": 1.0, "ContrastDiff": 0.0,
+                              "ContrastLocalDiff": 0.0},
+                             {"PaletteDistance": 1.0, "Vibrancy": 1.0,
+                              "PolarityConsistency": 1.0})
+    stages = {"decode": {"wall_ms": 2.0, "cpu_ms": 1.5, "calls": 2}}
+    out = write_run(tmp_path / "run", manifest={"run": "t"},
+                    matched=[dict(sample, id="0002"), dict(sample, id="0001")],
+                    black=[], white=[],
+                    timings=[{"id": "0002", "stages": stages},
+                             {"id": "0001", "stages": stages}])
+    lines = [json.loads(line) for line in (out / "timings.jsonl").read_text().splitlines()]
+    assert [line["id"] for line in lines] == ["0001", "0002"]
+    manifest = json.loads((out / "run.json").read_text())
+    assert manifest["timings"]["decode"]["n"] == 2
+    assert manifest["timings"]["decode"]["wall_ms"]["p50"] == 2.0
+
+    untimed = write_run(tmp_path / "plain", manifest={"run": "p"},
+                        matched=[dict(sample, id="0001")], black=[], white=[])
+    assert not (untimed / "timings.jsonl").exists()
+    assert "timings" not in json.loads((untimed / "run.json").read_text())
@@ -0,0 +1,127 @@
+import multiprocessing
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from widget2code_bench.devices import parse_devices, pin_device
+from widget2code_bench.worker_pool import RecyclingPool
+
+
+def _fail_once(marker):
+    """A warm-up that fails while `marker` exists, removing it."""
+    if os.path.exists(marker):
+        os.remove(marker)
+        raise RuntimeError("models failed to load")
+
+
+def _always_fail():
+    raise MemoryError("card out of memory loading the models")
+
+
+def _pool(workers=1, **limits):
+    return RecyclingPool(workers, mp_context=multiprocessing.get_context("spawn"), **limits)
+
+
+def test_a_worker_is_replaced_after_max_tasks_between_jobs():
+    pool = _pool(max_tasks=2)
+    try:
+        pids = [pool.submit(os.getpid).result() for _ in range(5)]
+        stats = pool.stats()
+    finally:
+        pool.shutdown()
+    assert pids[0] == pids[1] != pids[2] == pids[3] != pids[4]
+    assert stats["retired"]["tasks"] == 2
+    assert [event["reason"] for event in stats["events"]] == ["tasks", "tasks"]
+    assert stats["events"][0]["pid"] == pids[0]
+
+
+def test_a_worker_over_its_memory_ceiling_is_replaced():
+    pool = _pool(max_rss=1)
+    try:
+        first, second = (pool.submit(os.getpid).result() for _ in range(2))
+        stats = pool.stats()
+    finally:
+        pool.shutdown()
+    assert first != second
+    assert stats["retired"]["rss"] == 2
+    assert stats["events"][0]["rss"] > 1
+
+
+def test_a_dying_worker_fails_only_its_own_job():
+    pool = _pool(workers=2)
+    try:
+        survivors = [pool.submit(os.getpid) for _ in range(2)]
+        with pytest.raises(BrokenProcessPool):
+            pool.submit(os._exit, 1).result()
+        assert all(future.result() for future in survivors)
+        assert pool.submit(os.getpid).result()
+        stats = pool.stats()
+    finally:
+        pool.shutdown()
+    assert stats["retired"]["died"] == 1
+
+
+def test_a_worker_whose_warm_up_fails_is_replaced_before_it_takes_work(tmp_path):
+    marker = tmp_path / "fail"
+    marker.touch()
+    pool = _pool(max_tasks=1, warm=(_fail_once, str(marker)))
+    try:
+        first = pool.submit(os.getpid).result()
+        later = pool.submit(os.getpid).result()
+        stats = pool.stats()
+    finally:
+        pool.shutdown()
+    assert not marker.exists()
+    assert stats["retired"]["warmup"] == 1
+    failed = next(e["pid"] for e in stats["events"] if e["reason"] == "warmup")
+    assert later not in (first, failed)
+
+
+def test_a_slot_whose_warm_up_keeps_failing_is_given_up_not_respawned_forever(monkeypatch):
+    from widget2code_bench import worker_pool
+
+    monkeypatch.setattr(worker_pool, "WARMUP_BACKOFF_S", 0.05)
+    pool = _pool(max_tasks=1, warm=(_always_fail,))
+    try:
+        pool.submit(os.getpid).result(timeout=30)
+        waiting = pool.submit(os.getpid)
+        with pytest.raises(RuntimeError, match="failed to warm up") as failed:
+            waiting.result(timeout=30)
+        assert isinstance(failed.value.__cause__, MemoryError)
+        with pytest.raises(RuntimeError, match="failed to warm up"):
+            pool.submit(os.getpid).result(timeout=1)
+        stats = pool.stats()
+    finally:
+        pool.shutdown()
+    assert stats["retired"]["warmup"] == worker_pool.WARMUP_ATTEMPTS
+    assert stats["given_up"] == [0]
+
+
+def test_a_failing_job_still_reports_the_footprint_it_left():
+    pool = _pool(max_rss=1)
+    try:
+        with pytest.raises(TypeError):
+            pool.submit(os.getpid, "unexpected").result()
+        stats = pool.stats()
+    finally:
+        pool.shutdown()
+    assert stats["retired"]["rss"] == 1
+    assert stats["events"][0]["rss"] > 1
+
+
+def test_placed_workers_keep_their_card_and_later_jobs_wait_for_a_free_one():
+    pool = _pool(workers=2, initializer=pin_device, placements=[(0,), (3,)], max_tasks=2)
+    try:
+        futures = [pool.submit(os.getenv, "CUDA_VISIBLE_DEVICES") for _ in range(6)]
+        waiting = pool.stats()["waiting"]
+        seen = [future.result() for future in futures]
+        stats = pool.stats()
+    finally:
+        pool.shutdown()
+    assert waiting == 4
+    assert set(seen) == {"0", "3"} and len(seen) == 6
+    assert stats["retired"]["tasks"] >= 2 and stats["waiting"] == 0
+    assert parse_devices("0, 3") == [0, 3]
+    with pytest.raises(ValueError):
+        parse_devices("0,0")
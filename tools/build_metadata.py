@@ -30,17 +30,14 @@ import time
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
-import cv2
 import numpy as np
-from skimage.color import rgb2gray, rgb2hsv
 
-from widget_quality.utils import load_image, edge_map, margin_from_mask, \
-    remove_border_touching_components
-from widget_quality.legibility import ocr_text_easyocr, contrast_ratio, \
-    local_contrast_from_text_regions, compute_legibility
+from widget_quality.features import ImageFeatures, as_features
+from widget_quality.utils import load_pixels
+from widget_quality.legibility import compare_legibility, legibility_summary
 from widget_quality.perceptual import compute_perceptual, set_device
-from widget_quality.layout import compute_layout
-from widget_quality.style import compute_style
+from widget_quality.layout import compare_layout, layout_summary
+from widget_quality.style import compare_style, style_summary
 from widget_quality.geometry import compute_aspect_dimensionality_fidelity
 
 
@@ -50,145 +47,69 @@ def _f(x):
 
 # --- reuse within one sample --------------------------------------------
 #
-# A sample recomputes the ground truth's own OCR, HSV, greyscale and edge mask
-# several times over: once for its own entry, and again inside each of the two
-# fill evaluations, because those call the pair metrics with the same GT array
-# on one side. `compute_style` alone converts the GT to HSV twice per call, so
-# a sample ran five EasyOCR passes and five rgb2hsv conversions where one of
-# each would do.
+# build_one wraps the GT in one ImageFeatures, so its own entry and both fill
+# evaluations share its OCR, HSV, greyscale and edge mask instead of each
+# computing them again.
 #
-# The fills' own side is a constant image, so everything derived from it is
-# fixed by its shape and its colour and can be shared across samples too.
-#
-# Both caches dispatch on object identity and fall through to the real function
-# for anything else, so every value still comes from the evaluator's own code
-# running on the same input - it just runs once. Only functions whose result
-# the callers treat as read-only are wrapped.
-
-_REAL = {}                 # name -> the unwrapped function
-_CONST = {}                # (fn, colour, h, w) -> result, shared across samples
-_SAMPLE = {}               # id(array) -> {fn: result}, cleared per sample
-_CONST_TAG = {}            # id(array) -> colour, for the two fill images
-
-
-def _dispatch(name, fn):
-    """Wrap `fn` so a repeat call on the same array object returns the same
-    result, and a call on a fill image is answered from the shared cache."""
-    def wrapper(img, *args, **kwargs):
-        if args or kwargs:                    # non-default call: never cached
-            return fn(img, *args, **kwargs)
-        colour = _CONST_TAG.get(id(img))
-        if colour is not None:
-            key = (name, colour, img.shape[0], img.shape[1])
-            if key not in _CONST:
-                _CONST[key] = fn(img)
-            return _CONST[key]
-        slot = _SAMPLE.get(id(img))
-        if slot is None:
-            return fn(img)
-        if name not in slot:
-            slot[name] = fn(img)
-        return slot[name]
-    return wrapper
-
-
-def install_caches():
-    """Point every reference to these functions at one caching wrapper each.
-
-    The metric modules and this one both hold their own module-level references
-    (`from ... import edge_map`), so rebinding only the defining module would
-    leave half the calls uncached and the two halves unshared. The wrapper is
-    keyed on the bare function name so a GT converted here and the same GT
-    converted inside `compute_style` hit the same entry.
-    """
-    if _REAL:
-        return
-    import widget_quality.layout as _layout
-    import widget_quality.legibility as _legibility
-    import widget_quality.style as _style
-
-    here = sys.modules[__name__]
-    for name in ("ocr_text_easyocr", "contrast_ratio", "edge_map",
-                 "rgb2hsv", "rgb2gray"):
-        holders = [m for m in (_legibility, _layout, _style, here)
-                   if getattr(m, name, None) is not None]
-        real = getattr(holders[0], name)
-        _REAL[name] = real
-        wrapper = _dispatch(name, real)
-        for mod in holders:
-            if getattr(mod, name) is real:
-                setattr(mod, name, wrapper)
+# The fills' own side is a constant image, so its summaries are fixed by its
+# shape and its colour and are shared across samples too. They are the
+# evaluator's own `*_summary` functions run on that image, compared with the
+# GT's through the same `compare_*` functions `compute_*` would call.
+
+_FILLS = {}                # (colour, h, w) -> {group: summary}
+
+
+def _fill_summaries(colour, img):
+    key = (colour, img.shape[0], img.shape[1])
+    if key not in _FILLS:
+        fill = as_features(img)
+        _FILLS[key] = {"layout": layout_summary(fill),
+                       "legibility": legibility_summary(fill),
+                       "style": style_summary(fill)}
+    return _FILLS[key]
 
 
 def gt_layout(gt):
     """The GT branch of compute_layout, reduced to what the metric consumes."""
-    mask = remove_border_touching_components(
-        cv2.dilate(edge_map(gt), np.ones((3, 3), np.uint8)))
-    _, _, stats, _ = cv2.connectedComponentsWithStats(
-        (mask > 0).astype(np.uint8), connectivity=8)
-    areas = np.array([w * h for x, y, w, h, a in stats[1:] if a > 10])
-    if mask.any():
-        ys, xs = np.where(mask > 0)
-        bh, bw = ys.max() - ys.min() + 1, xs.max() - xs.min() + 1
-        bbox_ar = bw / bh if bh > 0 else 1.0
-    else:
-        bbox_ar = None
-    return {
-        "margin": [int(v) for v in margin_from_mask(mask)],
-        "mask_empty": bool(mask.sum() == 0),
-        "bbox_ar": _f(bbox_ar),
-        "area_ratio": _f(areas.mean() / areas.sum()) if len(areas) else None,
-        "n_comp": int(len(areas)),
-    }
+    return layout_summary(gt)
 
 
 def gt_legibility(gt):
-    text, results = ocr_text_easyocr(gt)
+    summary = legibility_summary(gt)
     return {
-        "text": text,
-        "contrast": _f(np.nan_to_num(contrast_ratio(gt))),
-        "contrast_local": _f(local_contrast_from_text_regions(gt, results)),
+        "text": summary["text"],
+        "contrast": _f(summary["contrast"]),
+        "contrast_local": _f(summary["contrast_local"]),
         "ocr": [[[[_f(c) for c in pt] for pt in box], txt, _f(conf)]
-                for box, txt, conf in results],
+                for box, txt, conf in summary["ocr"]],
     }
 
 
 def gt_style(gt):
     """The GT histograms, kept unnormalised: the metric divides by their sum."""
-    hsv = rgb2hsv(gt)
-    hue, _ = np.histogram(hsv[..., 0].ravel(), bins=36, range=(0, 1), density=True)
-    sat, _ = np.histogram(hsv[..., 1].ravel(), bins=30, range=(0, 1), density=True)
-    flat = np.sort(rgb2gray(gt).ravel())
-    k = max(1, int(0.1 * flat.size))
-    bg, dark, bright = np.median(flat), np.mean(flat[:k]), np.mean(flat[-k:])
-    fg = dark if abs(bg - dark) >= abs(bg - bright) else bright
-    contrast = bg - fg
-    return {
-        "hue_hist": [_f(v) for v in hue],
-        "sat_hist": [_f(v) for v in sat],
-        "polarity": [_f(np.sign(contrast)), _f(abs(contrast))],
-    }
+    return style_summary(gt)
 
 
 def gt_fill(gt):
     """Black and white fill score the GT against a constant image, so both are
     fixed by the GT alone. Stored before composite_score's rounding, so a
     compatibility mode and a full-precision mode can both be derived from it."""
+    gt = as_features(gt)
+    layout, legibility, style = (layout_summary(gt), legibility_summary(gt),
+                                 style_summary(gt))
     out = {}
-    for name, img in (("black", np.zeros_like(gt)), ("white", np.ones_like(gt))):
-        # `img` stays referenced for the whole block, so its id cannot be
-        # recycled while the tag names it; the tag is dropped straight after.
-        _CONST_TAG[id(img)] = name
-        try:
-            out[name] = {
-                "geo": _f(compute_aspect_dimensionality_fidelity(gt, img)),
-                "perceptual": {k: _f(v) for k, v in compute_perceptual(gt, img).items()},
-                "layout": {k: _f(v) for k, v in compute_layout(gt, img).items()},
-                "legibility": {k: _f(v) for k, v in compute_legibility(gt, img).items()},
-                "style": {k: _f(v) for k, v in compute_style(gt, img).items()},
-            }
-        finally:
-            _CONST_TAG.pop(id(img), None)
+    for name, pixels in (("black", np.zeros_like(gt.pixels)),
+                         ("white", np.full_like(gt.pixels, 255))):
+        img = ImageFeatures(pixels)
+        fill = _fill_summaries(name, img)
+        out[name] = {
+            "geo": _f(compute_aspect_dimensionality_fidelity(gt, img)),
+            "perceptual": {k: _f(v) for k, v in compute_perceptual(gt, img).items()},
+            "layout": {k: _f(v) for k, v in compare_layout(layout, fill["layout"]).items()},
+            "legibility": {k: _f(v) for k, v in
+                           compare_legibility(legibility, fill["legibility"]).items()},
+            "style": {k: _f(v) for k, v in compare_style(style, fill["style"]).items()},
+        }
     return out
 
 
@@ -198,41 +119,33 @@ def build_one(src: Path, dst_dir: Path, split: str, category, has_chart):
     if not image_out.exists():
         shutil.copy(src, image_out)
 
-    gt = load_image(str(src))
+    gt = ImageFeatures(load_pixels(str(src)))
     h, w = gt.shape[:2]
-    # Everything below derives from this one array; the slot lets the four
-    # sections share the GT's OCR, HSV, greyscale and edge mask instead of
-    # each recomputing them.
-    _SAMPLE[id(gt)] = {}
-    try:
-        meta = {
-            "id": dst_dir.name,
-            "split": split,
-            "sha256": hashlib.sha256(src.read_bytes()).hexdigest(),
-            "size": [int(w), int(h)],
-            "category": category,
-            "has_chart": has_chart,
-            "eval": {
-                "layout": gt_layout(gt),
-                "legibility": gt_legibility(gt),
-                "style": gt_style(gt),
-                "fill": gt_fill(gt),
-            },
-        }
-    finally:
-        _SAMPLE.pop(id(gt), None)
+    meta = {
+        "id": dst_dir.name,
+        "split": split,
+        "sha256": hashlib.sha256(src.read_bytes()).hexdigest(),
+        "size": [int(w), int(h)],
+        "category": category,
+        "has_chart": has_chart,
+        "eval": {
+            "layout": gt_layout(gt),
+            "legibility": gt_legibility(gt),
+            "style": gt_style(gt),
+            "fill": gt_fill(gt),
+        },
+    }
     (dst_dir / "metadata.json").write_text(
         json.dumps(meta, ensure_ascii=False, indent=1), encoding="utf-8")
     return dst_dir.name
 
 
 def _init_worker(use_cuda: bool) -> None:
-    """Load this worker's own models, then install the caches."""
+    """Load this worker's own models."""
     set_device(use_cuda=use_cuda)
     import easyocr
     from widget_quality import legibility
     legibility._reader = easyocr.Reader(["en"], gpu=use_cuda)
-    install_caches()
 
 
 def main() -> int:
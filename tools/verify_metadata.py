@@ -22,7 +22,8 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from build_metadata import gt_layout, gt_legibility, gt_style, gt_fill  # noqa: E402
-from widget_quality.utils import load_image                             # noqa: E402
+from widget_quality.features import ImageFeatures                       # noqa: E402
+from widget_quality.utils import load_pixels                            # noqa: E402
 from widget_quality.perceptual import set_device                        # noqa: E402
 
 
@@ -76,7 +77,7 @@ def main() -> int:
             print(f"  {sample}: image does not match the sha256 the cache was built from")
             continue
 
-        gt = load_image(str(image))
+        gt = ImageFeatures(load_pixels(str(image)))
         fresh = {"layout": gt_layout(gt), "legibility": gt_legibility(gt),
                  "style": gt_style(gt), "fill": gt_fill(gt)}
         diffs = list(differences(meta["eval"], fresh))